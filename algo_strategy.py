@@ -1,9 +1,9 @@
 import gamelib
 import random
 import math
+import os
 import warnings
 from sys import maxsize
-import json
 from tower_defense import *
 
 
@@ -16,8 +16,8 @@ Advanced strategy tips:
   - You can analyze action frames by modifying on_action_frame function
 
   - The GameState.map object can be manually manipulated to create hypothetical 
-  board states. Though, we recommended making a copy of the map to preserve 
-  the actual current map state.
+  board states. Take a game_state.snapshot() first and restore() it afterwards,
+  or work on a game_state.fork(), to preserve the actual current map state.
 """
 
 class AlgoStrategy(gamelib.AlgoCore):
@@ -67,14 +67,30 @@ class AlgoStrategy(gamelib.AlgoCore):
     GREATWALL = [[5,13],[8,13],[8,12],[5,12]]
     
     ENTRANCE = [[9,11],[13,7]]
+
+    # default BuildPlanner values of a new and an upgraded factory, high enough that the economy comes before
+    # reinforcing like it used to, a reinforcement is worth 1 to 6 per structure (see DefenseStructures.VALUES)
+    FACTORY_VALUE = 40
+    FACTORY_UPGRADE_VALUE = 45
     
 
     
-    def __init__(self):
+    def __init__(self, factory_value = FACTORY_VALUE, factory_upgrade_value = FACTORY_UPGRADE_VALUE):
         super().__init__()
+        self.factory_value = factory_value
+        self.factory_upgrade_value = factory_upgrade_value
         seed = random.randrange(maxsize)
         random.seed(seed)
         gamelib.debug_write('Random seed: {}'.format(seed))
+        # set ALGO_RECORD_DIR to keep every message of the game for replaying later
+        if os.environ.get("ALGO_RECORD_DIR"):
+            self.recorder = gamelib.Recorder(os.environ["ALGO_RECORD_DIR"])
+        # set ALGO_LOG_LEVEL to DEBUG for more diagnostics every turn, or to WARNING for less
+        if os.environ.get("ALGO_LOG_LEVEL"):
+            gamelib.log.level = getattr(gamelib, os.environ["ALGO_LOG_LEVEL"].upper())
+        # set ALGO_PROFILE to "stderr" or a file path to get a json line of phase timings every turn
+        if os.environ.get("ALGO_PROFILE"):
+            gamelib.profiler.enable(os.environ["ALGO_PROFILE"])
 
     def on_game_start(self, config):
         """ 
@@ -93,6 +109,8 @@ class AlgoStrategy(gamelib.AlgoCore):
         SP = 0
         # This is a good place to do initial setup
         self.scored_on_locations = []
+        # lets the defenses only look at tiles that were hit last turn
+        self.collect_summary = True
 
         self.farm = self.init_farmland()
         self.wall_left, self.wall_right = self.init_wall()
@@ -104,6 +122,16 @@ class AlgoStrategy(gamelib.AlgoCore):
         self.left = SideDefense(Wall(self.wall_left), Entrance(self.entrance_left), Funnel(self.funnel_left),config )
         self.right = SideDefense(Wall(self.wall_right,True), Entrance(self.wall_right, True), Funnel(self.funnel_right, True),config)
 
+        # AlgoCore.start creates the budget, this covers running the strategy without it
+        if self.budget is None:
+            self.budget = gamelib.TurnBudget(config)
+
+        # worker processes that score candidate attacks, started now so turns don't pay for it
+        self.search = gamelib.TurnSearch(config, budget=self.budget)
+
+
+    def on_game_end(self):
+        self.search.shutdown()
 
     def init_farmland(self):
         coords = []
@@ -162,8 +190,8 @@ class AlgoStrategy(gamelib.AlgoCore):
         unit deployments, and transmitting your intended deployments to the
         game engine.
         """
-        game_state = gamelib.GameState(self.config, turn_state)
-        gamelib.debug_write('Performing turn {} of your custom algo strategy'.format(game_state.turn_number))
+        game_state = gamelib.GameState(self.config, turn_state, self.rules)
+        gamelib.log.info('Performing turn {} of your custom algo strategy', game_state.turn_number)
         game_state.suppress_warnings(True)  #Comment or remove this line to enable warnings.
 
         
@@ -175,7 +203,8 @@ class AlgoStrategy(gamelib.AlgoCore):
             self.tower_defense_loop(game_state)
        
 
-        game_state.submit_turn()
+        with gamelib.profiler.phase("submit_turn"):
+            game_state.submit_turn()
 
 
     '''
@@ -210,6 +239,7 @@ Apart from maintaining defenses, our win condition is to get an economic lead an
     # 4*2 + 6*2 + 9 + 1 = 30
     
     
+    @gamelib.profiler.timed()
     def starting_setup(self, game_state, turn ):
 
 
@@ -310,9 +340,10 @@ Apart from maintaining defenses, our win condition is to get an economic lead an
     # manages all SP_points, MP_points usage
 
     # can activate final_form mode by checking in begingging
+    @gamelib.profiler.timed()
     def tower_defense_loop(self,game_state):
         #
-        gamelib.debug_write("TURN :", game_state.turn_number, "Resources : ", game_state.get_resources(0))
+        gamelib.log.info("TURN : {} Resources : {}", game_state.turn_number, game_state.get_resources(0))
       
 
         # basically unless otherwise specified then SP able to spend is this much
@@ -322,8 +353,8 @@ Apart from maintaining defenses, our win condition is to get an economic lead an
         MP_points = game_state.get_resource(1,0)
 
         # always run this first to update states and data vlaues
-        self.left.update(game_state)
-        self.right.update(game_state)
+        self.left.update(game_state, self.action_summary)
+        self.right.update(game_state, self.action_summary)
 
         # need to call prior to adding any new units. Otherwise inaccurate readings
         self.left.query_damage()
@@ -348,11 +379,7 @@ Apart from maintaining defenses, our win condition is to get an economic lead an
             # now factory or reinforce. As of now its build as many factories
 
             # add logic later if needed
-            self.add_factory(game_state, SP_points)
-
-
-            SP_points = game_state.get_resource(0,0)
-            self.reinforce(game_state, SP_points)
+            self.build(game_state, SP_points, SP_points)
             
 
         else:
@@ -363,7 +390,7 @@ Apart from maintaining defenses, our win condition is to get an economic lead an
             repair_queue = gamelib.ticket_maker([[self.left.repair_queue, ld ],[self.right.repair_queue, rd]])
 
             for i in repair_queue:
-                gamelib.debug_write("REPAIRING", i[0])
+                gamelib.log.info("REPAIRING {}", i[0])
                 if not game_state.attempt_spawn(TURRET if i[1] == 0 else WALL, i[0]):
                     break
                     
@@ -379,7 +406,7 @@ Apart from maintaining defenses, our win condition is to get an economic lead an
         # now I made my repairs
         
         
-        gamelib.debug_write("SP LEFT for farm",SP_points)
+        gamelib.log.info("SP LEFT for farm {}", SP_points)
 
 
         #gamelib.debug_write(11,game_state.get_resource(0,0))
@@ -392,16 +419,11 @@ Apart from maintaining defenses, our win condition is to get an economic lead an
         else:
             game_state.to_save = 0
             
-        self.add_factory(game_state, min(game_state.get_resource(0,0),2*9) )
-
-        
-        
         SP_points = game_state.get_allowance()
-        gamelib.debug_write("allowance", SP_points)
-        
+        gamelib.log.info("allowance {}", SP_points)
 
-        
-        self.reinforce(game_state, SP_points)
+        # factories and reinforcements compete for the allowance, the planner picks the best mix
+        self.build(game_state, min(game_state.get_resource(0,0),2*9), SP_points)
         
         
         
@@ -425,33 +447,60 @@ Apart from maintaining defenses, our win condition is to get an economic lead an
     # bomber manuever : this will need the other hole 
     # attack manuever
     
+    @gamelib.profiler.timed()
     def air_support(self,game_state):
         MP_points = int(game_state.get_resource(1,0))
 
-
-        # can use 
+        # candidate plans, the one we would have picked without searching goes first so it wins ties
         if MP_points >= 30:
-            self.all_in(game_state,self.easier_side(game_state), MP_points)
+            side = self.easier_side(game_state)
+            plans = [self.all_in(game_state, side, MP_points), self.all_in(game_state, 1 - side, MP_points)]
         #elif MP_points >= 12 and random.randint(0,9) < 5:
          #   self.bb_middle(game_state, MP_points)
         else:
-            self.aa_middle(game_state,MP_points)
+            plans = []
+            for startLeft in [int(MP_points/2), int(MP_points/4), MP_points - int(MP_points/4)]:
+                plan = self.aa_middle(game_state, MP_points, startLeft)
+                if plan not in plans:
+                    plans.append(plan)
+
+        # the unsearched plan is kept in case there is no time to search
+        self.budget.offer("air support", plans[0])
+        deadline = self.search.get_deadline()
+        result = self.budget.step("air support search", self.search.search, game_state, plans, deadline, self.enemy_scenarios(game_state), estimate=0.05, learn=False)
+        if result is not None and result[0] is not None:
+            gamelib.log.debug("air support scores {}", result[2])
+            self.budget.offer("air support", result[0], result[1])
+        gamelib.apply_plan(game_state, self.budget.best("air support"))
       
+    # guesses at what the enemy sends: all their MP as scouts or demolishers down the middle
+    def enemy_scenarios(self, game_state):
+        MP_points = game_state.get_resource(1,1)
+        scenarios = []
+        for unit_type in [SCOUT, DEMOLISHER]:
+            num = int(MP_points / game_state.type_cost(unit_type)[1])
+            if num > 0:
+                scenarios.append([[unit_type, [13,27], int(num/2)], [unit_type, [14,27], num - int(num/2)]])
+        return scenarios or None
         
     # anti air middle 
-    def aa_middle(self,game_state,MP_points):
-        startLeft = int(MP_points/2)
+    # returns the plan, startLeft is how many MP_points go to the left
+    def aa_middle(self,game_state,MP_points, startLeft = None):
+        if startLeft is None:
+            startLeft = int(MP_points/2)
         startRight = MP_points - startLeft
+        plan = []
 
         if 2 * 2 <= startLeft:
-            game_state.attempt_spawn(INTERCEPTOR,LEFTHOME, 2)
+            plan.append(("spawn", INTERCEPTOR, LEFTHOME, 2))
             startLeft-=2
         if 2*2 <= startRight:
-            game_state.attempt_spawn(INTERCEPTOR,RIGHTHOME,2)
+            plan.append(("spawn", INTERCEPTOR, RIGHTHOME, 2))
             startRight-=2
         
-        game_state.attempt_spawn(INTERCEPTOR, [7,6], startLeft)
-        game_state.attempt_spawn(INTERCEPTOR, gamelib.mirror([7,6]), startRight)
+        plan.append(("spawn", INTERCEPTOR, [7,6], startLeft))
+        plan.append(("spawn", INTERCEPTOR, gamelib.mirror([7,6])[0], startRight))
+        return plan
 
     # bomber sweep
     def bb_middle(self, game_state,MP_points):
@@ -463,6 +512,7 @@ Apart from maintaining defenses, our win condition is to get an economic lead an
         game_state.attempt_spawn(DEMOLISHER, self.right.funnel.air_support_9_11, startRight)
         
 
+    # returns the plan
     def all_in(self,game_state, side, MP_points):
         # if side == 0, attack left other wise attack right
         # bust thru whatever is blocking the funnel
@@ -470,14 +520,22 @@ Apart from maintaining defenses, our win condition is to get an economic lead an
 
         
         # simple way
-        game_state.attempt_spawn(SCOUT,RIGHTHOME if side else LEFTHOME, int(MP_points))
+        return [("spawn", SCOUT, RIGHTHOME if side else LEFTHOME, int(MP_points))]
         
 
     # find easier side
+    # scores a scout rush down the path from each home, prefers breaches, then damage to structures, then survivors
     def easier_side(self,game_state):
-        peak_region = [[4,11],[3,11],[3,12],[2,12],[2,13],[1,13]]
-        
-        return 1 if random.randint(0,1) == 1 else 0
+        num = int(game_state.get_resource(1,0) / game_state.type_cost(SCOUT)[1])
+        paths = [game_state.find_path_to_edge(LEFTHOME), game_state.find_path_to_edge(RIGHTHOME)]
+        left, right = gamelib.evaluate_paths(game_state, paths, SCOUT, num)
+        gamelib.log.info("all in left {} right {}", left, right)
+
+        left_score = (left.breaches, left.structure_damage, left.survivors)
+        right_score = (right.breaches, right.structure_damage, right.survivors)
+        if left_score == right_score:
+            return 1 if random.randint(0,1) == 1 else 0
+        return 1 if right_score > left_score else 0
 
         
    # how to determine what to reinforce
@@ -497,7 +555,20 @@ Apart from maintaining defenses, our win condition is to get an economic lead an
    # final form is essentially that v wall wiht holes plucked
    #  
    
-    def reinforce(self, game_state, SP_points):
+    # proposes factories and reinforcements to one BuildPlanner, then builds the best mix SP_points can buy
+    # factory_SP caps the factories like in add_factory
+    @gamelib.profiler.timed()
+    def build(self, game_state, factory_SP, SP_points):
+        planner = gamelib.BuildPlanner(game_state)
+        self.add_factory(game_state, factory_SP, planner)
+        self.reinforce(game_state, SP_points, planner)
+        committed = planner.commit(SP_points)
+        gamelib.log.debug("built {}", committed)
+        return committed
+
+    # without a planner, the proposals are built right away
+    @gamelib.profiler.timed()
+    def reinforce(self, game_state, SP_points, planner = None):
         if SP_points == 0:
             return
         # current possible SP_points 0-8.
@@ -517,24 +588,42 @@ Apart from maintaining defenses, our win condition is to get an economic lead an
         # second 1 idx uses absolute
         priority = sorted(all_sections, key = lambda x: -x[1][0])
 
-        # try reinforce all
+        # the more damage a section took, the more its reinforcements are worth
+        total_damage = sum(max(i[1][0], 0) for i in priority)
+        own_planner = planner is None
+        if own_planner:
+            planner = gamelib.BuildPlanner(game_state)
+
+        # propose reinforcing all
         for i in priority:
-            i[0].reinforce(game_state, game_state.get_allowance())
+            weight = 1 + (max(i[1][0], 0) / total_damage if total_damage > 0 else 0)
+            i[0].propose(game_state, planner, weight)
 
+        if own_planner:
+            planner.commit(SP_points)
         return
 
     
     # SP_points indicates the amount allocate for factories
     
-    def add_factory(self, game_state, SP_points):
+    # without a planner, the factories are built right away
+    @gamelib.profiler.timed()
+    def add_factory(self, game_state, SP_points, planner = None):
         # basically checks the farm. Again mirrors.
         upgradable, empty = self.examine_farm(game_state)
         # always upgrade before building new
         to_add = int(SP_points / 9)
-        gamelib.debug_write("factory", to_add,upgradable,empty)
-        game_state.attempt_upgrade(upgradable[:min(to_add, len(upgradable))])
+        gamelib.log.debug("factory {} {} {}", to_add, upgradable, empty)
+        own_planner = planner is None
+        if own_planner:
+            planner = gamelib.BuildPlanner(game_state)
+        for coord in upgradable[:min(to_add, len(upgradable))]:
+            planner.add((self.factory_upgrade_value, [("upgrade", coord)]))
         to_add -= min(to_add, len(upgradable))
-        game_state.attempt_spawn(FACTORY, empty[:min(to_add, len(empty))])
+        for coord in empty[:min(to_add, len(empty))]:
+            planner.add((self.factory_value, [("spawn", FACTORY, coord, 1)]))
+        if own_planner:
+            planner.commit(game_state.get_resource(0,0))
         
         
         
@@ -545,8 +634,7 @@ Apart from maintaining defenses, our win condition is to get an economic lead an
     def examine_farm(self, game_state):
         upgradable = []
         empty = []
-        for coord in self.farm:
-            cur  = game_state.contains_stationary_unit(coord)
+        for coord, cur in zip(self.farm, game_state.game_map.structures_at(self.farm)):
             if not cur:
                 empty.append(coord)
             else:
@@ -686,11 +774,8 @@ Apart from maintaining defenses, our win condition is to get an economic lead an
         # Get the damage estimate each path will take
         for location in location_options:
             path = game_state.find_path_to_edge(location)
-            damage = 0
-            for path_location in path:
-                # Get number of enemy turrets that can attack each location and multiply by turret damage
-                damage += len(game_state.get_attackers(path_location, 0)) * gamelib.GameUnit(TURRET, game_state.config).damage_i
-            damages.append(damage)
+            # Sum the damage per frame of the enemy turrets covering each location, upgrades included
+            damages.append(game_state.threat_map.path_damage(path, 0))
         
         # Now just return the location that takes the least damage
         return location_options[damages.index(min(damages))]
@@ -711,26 +796,16 @@ Apart from maintaining defenses, our win condition is to get an economic lead an
                 filtered.append(location)
         return filtered
 
-    def on_action_frame(self, turn_string):
+    def on_breach(self, breach):
         """
-        This is the action frame of the game. This function could be called 
-        hundreds of times per turn and could slow the algo down so avoid putting slow code here.
-        Processing the action frames is complicated so we only suggest it if you have time and experience.
-        Full doc on format of a game frame at in json-docs.html in the root of the Starterkit.
+        Called for every breach of the action phase.
+        Only frames with breaches are decoded, so this is cheap compared to parsing every action frame.
         """
         # Let's record at what position we get scored on
-        state = json.loads(turn_string)
-        events = state["events"]
-        breaches = events["breach"]
-        for breach in breaches:
-            location = breach[0]
-            unit_owner_self = True if breach[4] == 1 else False
-            # When parsing the frame data directly, 
-            # 1 is integer for yourself, 2 is opponent (StarterKit code uses 0, 1 as player_index instead)
-            if not unit_owner_self:
-                gamelib.debug_write("Got scored on at: {}".format(location))
-                self.scored_on_locations.append(location)
-                gamelib.debug_write("All locations: {}".format(self.scored_on_locations))
+        if breach.player_index == 1:
+            gamelib.log.info("Got scored on at: {}", breach.location)
+            self.scored_on_locations.append(breach.location)
+            gamelib.log.debug("All locations: {}", self.scored_on_locations)
 
 
 if __name__ == "__main__":
@@ -10,22 +10,73 @@ Investigating it is useful for any player that wants to access more information
 The GameUnit class in unit.py represetns a single unit. 
 Investigating it is useful for any player that wants to access information about units. \n
 
+The Rules class in rules.py holds the unit types, costs and stats of a config, compiled once by compile_rules(). 
+AlgoCore keeps them as self.rules, GameState, GameMap and GameUnit read them instead of the config. \n
+
 The AlgoCore class in algocore.py handles communication with the game engine, and forms the bones of an algo. AlgoStrategy inherits from it. 
-Investigating it is useful for advanced players interested in getting data from the action phase or communicating directly with the game engine. \n
+Investigating it is useful for advanced players interested in getting data from the action phase or communicating directly with the game engine. 
+An ActionFrameFilter set as its frame_filter skips action frames without the events you need, before they are decoded. 
+Its on_breach, on_structure_destroyed, on_damage and on_spawn callbacks receive the records defined in events.py. 
+With collect_summary set, it also hands on_turn a TurnSummary of the last action phase as action_summary. \n
 
 The Navigation class in navigation.py contains functions related to pathfinding, which are used by GameState in pathing related functions. 
 Investigating it is useful for advanced player who want to optimize the slow default pathing algorithm we provide. \n 
 
+The ThreatMap class in threat_map.py tracks how much damage each player's structures deal at every location.
+GameState keeps one up to date as game_state.threat_map, which makes scoring a path a simple sum. \n
+
+path_evaluation.py contains evaluate_paths(), which estimates survivors, structure damage and breaches for a group of
+mobile units on each of several candidate paths. \n
+
+The Simulator class in simulator.py runs the action phase locally, frame by frame. 
+Call it after deploying to compare the breaches, destroyed structures and resources of several candidate turns. \n
+
+The TurnSearch class in search.py scores candidate turn plans with the Simulator in a pool of worker processes and 
+returns the best one before a deadline. apply_plan() queues a plan on a GameState. \n
+
+The BuildPlanner class in build_planner.py collects build options with their values, dry runs them with 
+GameState.snapshot() to price them, and queues the mix that gets the most value out of a SP budget. \n
+
+The TurnBudget class in budget.py tracks the time left in a turn. AlgoCore starts it when a turn arrives, and 
+expensive analysis run through TurnBudget.step() is skipped once there is no time left for it. \n
+
+The Recorder class in recorder.py streams every message an algo receives to disk from a background thread. 
+Set one as AlgoCore.recorder to keep a game, read_records() reads it back. \n
+
+replay.py contains replay(), which feeds a recorded game to an algo in process and captures the stacks it submits 
+each turn and how long on_turn took, without the game engine. \n
+
+benchmarks.py times the gamelib hot paths and a full on_turn on generated mid and late game boards. 
+Run it with python -m gamelib.benchmarks --output results.json to compare branches. \n
+
+The Profiler class in profiling.py times the phases of each turn. gamelib.profiler, the instance gamelib and AlgoCore 
+report to, writes a json line of per phase times and call counts every turn once enabled. \n
+
+The DebugLog class in debug_log.py buffers debug output with levels and a per turn byte cap. gamelib.log, which 
+debug_write() and GameState warnings write to, is flushed once AlgoCore has handled each message. \n
+
 util.py contains a small handful of functions that help with communication, including the debug-printing function, debug_write().
 """
 
-from .algocore import AlgoCore
+from .algocore import AlgoCore, ActionFrameFilter
+from .events import Breach, Damage, Death, Spawn, TurnSummary
 from .util import debug_write
+from .debug_log import DebugLog, log, DEBUG, INFO, WARNING, ERROR
 from .game_state import GameState
 from .unit import GameUnit
+from .rules import Rules, compile_rules
 from .game_map import GameMap
+from .threat_map import ThreatMap
+from .path_evaluation import evaluate_paths, PathOutcome
+from .simulator import Simulator, SimulationResult
+from .search import TurnSearch, apply_plan, score_result
+from .build_planner import BuildPlanner
+from .budget import TurnBudget
+from .recorder import Recorder, read_records, read_index
+from .profiling import Profiler, profiler
+from . import replay
 
 
 from .util import *
-__all__ = ["algocore", "game_state", "game_map", "navigation", "unit", "util"]
+__all__ = ["algocore", "benchmarks", "budget", "build_planner", "debug_log", "events", "game_state", "game_map", "navigation", "path_evaluation", "profiling", "recorder", "replay", "rules", "search", "simulator", "threat_map", "unit", "util"]
  
@@ -1,7 +1,98 @@
-import json
+import time
 
+from .budget import TurnBudget
+from .debug_log import log
+from .events import EventReader, TurnSummary
 from .game_state import GameState
-from .util import get_command, debug_write, BANNER_TEXT, send_command
+from .rules import compile_rules
+from .profiling import profiler
+from .util import get_command, debug_write, BANNER_TEXT, send_command, GameMessage
+
+class ActionFrameFilter(object):
+    """
+    Decides from the raw text of an action frame whether it is worth decoding. \n
+    A frame passes if one of the subscribed event lists (breach, damage, death, spawn, ...) is not empty.
+    The check only scans the string, frames that are skipped are never decoded.
+
+    Attributes :
+        * events (list): The event categories subscribed to
+        * passed (int): The number of frames that passed
+        * skipped (int): The number of frames that were skipped
+
+    """
+    EVENTS = ["selfDestruct", "breach", "damage", "shield", "move", "spawn", "death", "attack", "melee"]
+
+    def __init__(self, events):
+        for event in events:
+            if event not in self.EVENTS:
+                raise ValueError("Unknown action frame event {}, expected one of {}".format(event, self.EVENTS))
+        self.events = list(events)
+        self.passed = 0
+        self.skipped = 0
+        self.__keys = ['"{}"'.format(event) for event in self.events]
+
+    def subscribe(self, events):
+        """Adds event categories to the ones frames are checked for
+
+        Args:
+            events: A list of event categories
+
+        """
+        for event in events:
+            if event not in self.EVENTS:
+                raise ValueError("Unknown action frame event {}, expected one of {}".format(event, self.EVENTS))
+            if event not in self.events:
+                self.events.append(event)
+                self.__keys.append('"{}"'.format(event))
+
+    def wants(self, frame):
+        """Checks if a frame has any of the subscribed events, and counts it
+
+        Args:
+            frame: The raw action frame string
+
+        Returns:
+            True if the frame should be decoded
+
+        """
+        start = frame.find('"events"')
+        if start < 0:
+            return self.__decoded_wants(frame)
+        for key in self.__keys:
+            index = frame.find(key, start)
+            if index < 0:
+                continue
+            bracket = frame.find("[", index + len(key))
+            # the key must be followed by a list, anything else is not a frame shape the scan knows
+            if bracket < 0 or frame[index + len(key):bracket].strip() != ":":
+                return self.__decoded_wants(frame)
+            index = bracket + 1
+            while index < len(frame) and frame[index] in " \t\r\n":
+                index += 1
+            if index >= len(frame):
+                return self.__decoded_wants(frame)
+            if frame[index] != "]":
+                self.passed += 1
+                return True
+        self.skipped += 1
+        return False
+
+    def __decoded_wants(self, frame):
+        """Decides on the decoded frame, for frames the text scan does not understand. Frames that can not be
+        decoded are passed, so the handlers see them rather than have them silently dropped.
+        """
+        message = frame if isinstance(frame, GameMessage) else GameMessage(frame)
+        try:
+            events = message.state.get("events")
+        except (ValueError, AttributeError):
+            self.passed += 1
+            return True
+        if isinstance(events, dict) and any(events.get(event) for event in self.events):
+            self.passed += 1
+            return True
+        self.skipped += 1
+        return False
+
 
 class AlgoCore(object):
     """
@@ -10,10 +101,35 @@ class AlgoCore(object):
 
     Attributes :
         * config (JSON): json object containing information about the game
+        * rules (:obj: Rules): The compiled unit rules of the config, set before on_game_start is called. Pass them to GameState.
+        * budget (:obj: TurnBudget): Tracks the time left in the current turn, created once the config arrives
+        * frame_filter (:obj: ActionFrameFilter): When set, only action frames it passes reach on_action_frame and the event callbacks.
+          If it is not set in on_game_start and on_action_frame is not overridden, it is set to the events of the overridden callbacks.
+        * collect_summary (bool): Set it in on_game_start to collect a TurnSummary of every action phase
+        * action_summary (:obj: TurnSummary): The summary of the last action phase, set before on_turn is called. None if collect_summary is not set.
+        * recorder (:obj: Recorder): When set before start() is called, every message received is recorded
+
+    Every on_turn call is a turn of gamelib.profiler, enable it to get per phase timings of each turn.
 
     """
+    # callback -> the action frame event it is built from, and the EventReader method that builds its records
+    EVENT_CALLBACKS = [
+        ("on_breach", "breach", "breaches"),
+        ("on_structure_destroyed", "death", "structures_destroyed"),
+        ("on_damage", "damage", "damages"),
+        ("on_spawn", "spawn", "spawns")]
+
     def __init__(self):
         self.config = None
+        self.rules = None
+        self.budget = None
+        self.frame_filter = None
+        self.collect_summary = False
+        self.action_summary = None
+        self.recorder = None
+        self.__event_handlers = []
+        self.__event_reader = None
+        self.__summary = None
 
     def on_game_start(self, config):
         """
@@ -26,7 +142,7 @@ class AlgoCore(object):
     def on_turn(self, game_state):
         """
         This step function is called at the start of each turn.
-        It is passed the current game state, which can be used to initiate a new GameState object. 
+        It is passed the current game state as a GameMessage, which can be used to initiate a new GameState object. 
         By default, it sends empty commands to the game engine. \n
         algo_strategy.py inherits from AlgoCore and overrides this on turn function. 
         Adjusting the on_turn function in algo_strategy is the main way to adjust your algo's logic. 
@@ -39,10 +155,72 @@ class AlgoCore(object):
         After each deploy phase, the game engine will run the action phase of the round.
         The action phase is made up of a sequence of distinct frames. 
         Each of these frames is sent to the algo in order. 
-        They can be handled in this function. 
+        They can be handled in this function. Frames are GameMessages, read action_frame_game_state.state
+        for the decoded frame rather than decoding it again. 
+        Most algos only need some of the events, the on_breach, on_structure_destroyed, on_damage and on_spawn callbacks are simpler and cheaper.
         """
         pass
 
+    def on_game_end(self):
+        """
+        Called once the game is over, before start() returns. 
+        Override it to release what on_game_start set up, like worker processes.
+        """
+        pass
+
+    def on_breach(self, breach):
+        """
+        Called for every unit that scores during the action phase, with a gamelib.events.Breach. 
+        player_index is the player who scored, 0 for you and 1 for your opponent.
+        """
+        pass
+
+    def on_structure_destroyed(self, death):
+        """
+        Called for every structure destroyed during the action phase, with a gamelib.events.Death. 
+        Structures removed by their owner are left out.
+        """
+        pass
+
+    def on_damage(self, damage):
+        """
+        Called for every unit damaged during the action phase, with a gamelib.events.Damage.
+        """
+        pass
+
+    def on_spawn(self, spawn):
+        """
+        Called for every unit created during the action phase, with a gamelib.events.Spawn.
+        """
+        pass
+
+    def __subscribe(self, config):
+        """
+        Finds the event callbacks this algo overrides, and sets a frame filter for their events if none was set.
+        """
+        reader = EventReader(config)
+        self.__event_reader = reader
+        self.__event_handlers = []
+        events = []
+        for callback, event, read in self.EVENT_CALLBACKS:
+            if getattr(type(self), callback) is not getattr(AlgoCore, callback):
+                self.__event_handlers.append((getattr(reader, read), getattr(self, callback)))
+                events.append(event)
+        if self.frame_filter is None and type(self).on_action_frame is AlgoCore.on_action_frame:
+            self.frame_filter = ActionFrameFilter(events)
+        if self.collect_summary:
+            self.__summary = TurnSummary()
+            if self.frame_filter is not None:
+                self.frame_filter.subscribe(TurnSummary.EVENTS)
+
+    def __dispatch_events(self, frame):
+        events = frame.state["events"]
+        for read, handler in self.__event_handlers:
+            for record in read(events):
+                handler(record)
+        if self.__summary is not None:
+            self.__summary.add(self.__event_reader, events)
+
 
     def start(self):
         """ 
@@ -56,40 +234,89 @@ class AlgoCore(object):
         while True:
             # Note: Python blocks and hangs on stdin. Can cause issues if connections aren't setup properly and may need to
             # manually kill this Python program.
-            game_state_string = get_command()
-            if "replaySave" in game_state_string:
+            game_state_string = GameMessage(get_command())
+            if not self.handle_message(game_state_string, time.monotonic()):
+                break
+
+    def handle_message(self, game_state_string, arrived=None):
+        """
+        Handles a single message from the game engine, start() calls it for every line it reads.
+        The replay runner calls it directly to feed recorded games to an algo.
+
+        Args:
+            * game_state_string (GameMessage): The message
+            * arrived (float): The time.monotonic() timestamp the message arrived at, defaults to now
+
+        Returns:
+            False once the end game message was handled, True otherwise
+        """
+        try:
+            return self.__handle_message(game_state_string, arrived)
+        finally:
+            # Debug output is written once the message is handled, after the turn was submitted
+            log.flush()
+
+    def __handle_message(self, game_state_string, arrived):
+        if not isinstance(game_state_string, GameMessage):
+            game_state_string = GameMessage(game_state_string)
+        if arrived is None:
+            arrived = time.monotonic()
+        if self.recorder is not None:
+            self.recorder.record(game_state_string, arrived)
+        if "replaySave" in game_state_string:
+            """
+            This means this must be the config file. So, load in the config file as a json and add it to your AlgoStrategy class.
+            """
+            parsed_config = game_state_string.state
+            self.rules = compile_rules(parsed_config)
+            self.budget = TurnBudget(parsed_config)
+            self.on_game_start(parsed_config)
+            self.__subscribe(parsed_config)
+        elif "turnInfo" in game_state_string:
+            # Only the turn type is read here, the message is decoded once, by whichever handler needs it
+            stateType = game_state_string.turn_type
+            if stateType == 0:
+                """
+                This is the game turn game state message. Algo must now print to stdout 2 lines, one for build phase one for
+                deploy phase. Printing is handled by the provided functions.
                 """
-                This means this must be the config file. So, load in the config file as a json and add it to your AlgoStrategy class.
+                log.start_turn()
+                self.budget.start(float(game_state_string.state["p1Stats"][3]), arrived)
+                if self.__summary is not None:
+                    self.action_summary = self.__summary
+                    self.__summary = TurnSummary()
+                profiler.start_turn(game_state_string.turn_info[1])
+                self.on_turn(game_state_string)
+                profiler.end_turn()
+            elif stateType == 1:
                 """
-                parsed_config = json.loads(game_state_string)
-                self.on_game_start(parsed_config)
-            elif "turnInfo" in game_state_string:
-                state = json.loads(game_state_string)
-                stateType = int(state.get("turnInfo")[0])
-                if stateType == 0:
-                    """
-                    This is the game turn game state message. Algo must now print to stdout 2 lines, one for build phase one for
-                    deploy phase. Printing is handled by the provided functions.
-                    """
-                    self.on_turn(game_state_string)
-                elif stateType == 1:
-                    """
-                    If stateType == 1, this game_state_string string represents a single frame of an action phase
-                    """
+                If stateType == 1, this game_state_string string represents a single frame of an action phase
+                """
+                if self.__summary is not None:
+                    self.__summary.frames += 1
+                if self.frame_filter is None or self.frame_filter.wants(game_state_string):
+                    if self.__event_handlers or self.__summary is not None:
+                        self.__dispatch_events(game_state_string)
                     self.on_action_frame(game_state_string)
-                elif stateType == 2:
-                    """
-                    This is the end game message. This means the game is over so break and finish the program.
-                    """
-                    debug_write("Got end state, game over. Stopping algo.")
-                    break
-                else:
-                    """
-                    Something is wrong? Received an incorrect or improperly formatted string.
-                    """
-                    debug_write("Got unexpected string with turnInfo: {}".format(game_state_string))
+            elif stateType == 2:
+                """
+                This is the end game message. This means the game is over so break and finish the program.
+                """
+                debug_write("Got end state, game over. Stopping algo.")
+                if self.frame_filter is not None:
+                    log.info("Action frames handled: {}, skipped: {}", self.frame_filter.passed, self.frame_filter.skipped)
+                if self.recorder is not None:
+                    self.recorder.close()
+                self.on_game_end()
+                return False
             else:
                 """
                 Something is wrong? Received an incorrect or improperly formatted string.
                 """
-                debug_write("Got unexpected string : {}".format(game_state_string))
+                debug_write("Got unexpected string with turnInfo: {}".format(game_state_string))
+        else:
+            """
+            Something is wrong? Received an incorrect or improperly formatted string.
+            """
+            debug_write("Got unexpected string : {}".format(game_state_string))
+        return True
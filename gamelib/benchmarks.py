@@ -0,0 +1,279 @@
+"""
+Benchmarks for the gamelib hot paths.
+
+Run from the folder holding algo_strategy.py:
+
+    python -m gamelib.benchmarks --output results.json
+
+Every benchmark runs on generated mid and late game boards (and on the last turn of a recording given with --recording).
+Per call latency percentiles come from timed runs, allocations from a separate run under tracemalloc so tracing does not
+skew the timings. Results are written as JSON so runs on different branches can be compared.
+"""
+
+import argparse
+import importlib
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from .game_map import GameMap
+from .game_state import GameState
+from .navigation import ShortestPathFinder
+from .recorder import read_records
+from .util import set_command_sink
+
+# name -> (structures per side, mobile units per side, turn number)
+BOARDS = {
+    "mid": (60, 40, 20),
+    "late": (150, 150, 60),
+}
+
+
+def make_board(config, structures, mobile_units, turn_number, seed=0):
+    """Generates a serialized turn with random structures and mobile units on each side
+
+    Args:
+        config: The game config
+        structures: The number of structures each player has, some of them upgraded
+        mobile_units: The number of mobile units each player has, spread over their edges
+        turn_number: The turn number of the state
+        seed: The random seed, the same seed gives the same board
+
+    Returns:
+        The turn as a json string, like the game engine sends it
+
+    """
+    rng = random.Random(seed)
+    unit_information = config["unitInformation"]
+    structure_types = [index for index, unit_info in enumerate(unit_information[:6]) if unit_info.get("unitCategory") == 0]
+    mobile_types = [index for index, unit_info in enumerate(unit_information[:6]) if unit_info.get("unitCategory") != 0]
+
+    tiles = [[], []]
+    edges = [[], []]
+    game_map = GameMap(config)
+    for x in range(28):
+        for y in range(28):
+            if game_map.in_arena_bounds([x, y]):
+                tiles[0 if y < 14 else 1].append([x, y])
+    edge_lists = game_map.get_edges()
+    edges[0] = edge_lists[game_map.BOTTOM_LEFT] + edge_lists[game_map.BOTTOM_RIGHT]
+    edges[1] = edge_lists[game_map.TOP_LEFT] + edge_lists[game_map.TOP_RIGHT]
+
+    unit_id = 0
+    players = []
+    for player_index in (0, 1):
+        units = [[] for _ in unit_information]
+        candidates = [tile for tile in tiles[player_index] if tile not in edges[player_index]]
+        for x, y in rng.sample(candidates, min(structures, len(candidates))):
+            unit_type = rng.choice(structure_types)
+            health = unit_information[unit_type].get("startHealth", 1) * rng.uniform(0.3, 1)
+            units[unit_type].append([x, y, health, str(unit_id)])
+            if rng.random() < 0.3:
+                units[7].append([x, y, 0, str(unit_id)])
+            unit_id += 1
+        for _ in range(mobile_units):
+            x, y = rng.choice(edges[player_index])
+            unit_type = rng.choice(mobile_types)
+            units[unit_type].append([x, y, unit_information[unit_type].get("startHealth", 1), str(unit_id)])
+            unit_id += 1
+        players.append(units)
+
+    return json.dumps({
+        "p1Units": players[0], "p2Units": players[1],
+        "turnInfo": [0, turn_number, -1],
+        "p1Stats": [30.0, 40.0, 35.0, 2000],
+        "p2Stats": [30.0, 40.0, 35.0, 2000],
+        "events": {}})
+
+
+def measure(function, setup=None, calls=200, warmup=5):
+    """Times a function and counts what it allocates
+
+    Args:
+        function: The function to measure, called with the result of setup if there is one
+        setup: An optional function run before each call, outside of the timing
+        calls: The number of timed calls
+        warmup: The number of calls run before timing
+
+    Returns:
+        A dict with the calls, per call mean / p50 / p95 / p99 / max in microseconds, and the peak bytes and
+        allocated blocks of a traced call
+
+    """
+    def run():
+        if setup is None:
+            start = time.perf_counter()
+            function()
+        else:
+            argument = setup()
+            start = time.perf_counter()
+            function(argument)
+        return time.perf_counter() - start
+
+    for _ in range(warmup):
+        run()
+    timings = sorted(run() for _ in range(calls))
+
+    argument = setup() if setup is not None else None
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    if setup is None:
+        function()
+    else:
+        function(argument)
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(max(0, stat.count_diff) for stat in after.compare_to(before, "lineno"))
+
+    def percentile(fraction):
+        return timings[min(len(timings) - 1, int(fraction * len(timings)))] * 1e6
+    return {
+        "calls": calls,
+        "mean_us": sum(timings) / len(timings) * 1e6,
+        "p50_us": percentile(0.5),
+        "p95_us": percentile(0.95),
+        "p99_us": percentile(0.99),
+        "max_us": timings[-1] * 1e6,
+        "peak_bytes": peak,
+        "allocated_blocks": blocks,
+    }
+
+
+def board_benchmarks(config, board, calls):
+    """Runs the gamelib benchmarks on a board
+
+    Args:
+        config: The game config
+        board: A serialized turn
+        calls: The number of timed calls of each benchmark
+
+    Returns:
+        A dict of benchmark name -> measure() result
+
+    """
+    rng = random.Random(1)
+    game_state = GameState(config, board)
+    game_state.suppress_warnings(True)
+    game_map = game_state.game_map
+    locations = [location for location in game_map]
+    units = [unit for location in locations for unit in game_map[location]]
+    edges = game_map.get_edge_locations(game_map.BOTTOM_LEFT) + game_map.get_edge_locations(game_map.BOTTOM_RIGHT)
+    starts = [location for location in edges if not game_state.contains_stationary_unit(location)]
+
+    def fresh_pathfinder():
+        game_state._shortest_path_finder = ShortestPathFinder()
+        return rng.choice(starts)
+
+    def all_tiles():
+        for location in locations:
+            game_state.contains_stationary_unit(location)
+
+    def iterate_map():
+        for location in game_map:
+            pass
+
+    return {
+        "GameState.__init__": measure(lambda: GameState(config, board), calls=max(10, calls // 10)),
+        "find_path_to_edge (cold)": measure(game_state.find_path_to_edge, setup=fresh_pathfinder, calls=max(10, calls // 10)),
+        "find_path_to_edge (cached)": measure(game_state.find_path_to_edge, setup=lambda: rng.choice(starts), calls=calls),
+        "get_attackers": measure(lambda location: game_state.get_attackers(location, 0), setup=lambda: rng.choice(locations), calls=calls),
+        "get_target": measure(game_state.get_target, setup=lambda: rng.choice(units), calls=calls),
+        "get_locations_in_range": measure(lambda location: game_map.get_locations_in_range(location, 3.5), setup=lambda: rng.choice(locations), calls=calls),
+        "GameMap iteration": measure(iterate_map, calls=max(10, calls // 10)),
+        "contains_stationary_unit (every tile)": measure(all_tiles, calls=max(10, calls // 10)),
+    }
+
+
+def strategy_benchmark(strategy, config, board, calls):
+    """Times a full on_turn of a strategy, with the commands it submits discarded
+
+    Args:
+        strategy: An AlgoCore subclass
+        config: The game config
+        board: A serialized turn
+        calls: The number of timed turns
+
+    Returns:
+        The measure() result
+
+    """
+    algo = strategy()
+    previous = set_command_sink(lambda command: None)
+    try:
+        algo.handle_message(json.dumps(dict(config, replaySave=1)))
+        return measure(lambda: algo.handle_message(board), calls=calls, warmup=2)
+    finally:
+        algo.on_game_end()
+        set_command_sink(previous)
+
+
+def load_strategy(name):
+    """Imports a strategy from a "module.Class" name, None if it can not be imported
+    """
+    module_name, _, class_name = name.rpartition(".")
+    try:
+        return getattr(importlib.import_module(module_name), class_name)
+    except (ImportError, AttributeError):
+        return None
+
+
+def default_config():
+    """The config the unit tests use
+    """
+    from .tests import BasicTests
+    return BasicTests().make_turn_0_map().config
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the gamelib hot paths")
+    parser.add_argument("--config", help="a game config json file, defaults to the unit test config")
+    parser.add_argument("--recording", help="a .rec recording, its last turn is benchmarked as well")
+    parser.add_argument("--strategy", default="algo_strategy.AlgoStrategy", help="the strategy to time on_turn for")
+    parser.add_argument("--calls", type=int, default=200, help="timed calls per benchmark")
+    parser.add_argument("--output", help="write the results to this json file")
+    args = parser.parse_args(argv)
+
+    if args.config:
+        with open(args.config) as config_file:
+            config = json.load(config_file)
+    else:
+        config = default_config()
+
+    boards = {name: make_board(config, *settings) for name, settings in BOARDS.items()}
+    if args.recording:
+        turns = [str(message) for message in read_records(args.recording) if message.turn_type == 0]
+        if turns:
+            boards["recorded"] = turns[-1]
+
+    sys.path.insert(0, ".")
+    strategy = load_strategy(args.strategy)
+    results = {}
+    for name, board in boards.items():
+        results[name] = board_benchmarks(config, board, args.calls)
+        if strategy is not None:
+            results[name]["on_turn"] = strategy_benchmark(strategy, config, board, max(5, args.calls // 20))
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "strategy": args.strategy if strategy is not None else None,
+        "boards": {name: {"structures": settings[0], "mobile_units": settings[1], "turn": settings[2]} for name, settings in BOARDS.items()},
+        "results": results,
+    }
+    for board, benchmarks in results.items():
+        print(board)
+        for name, result in benchmarks.items():
+            print("  {:40} p50 {:10.1f}us  p95 {:10.1f}us  peak {:8d}B".format(name, result["p50_us"], result["p95_us"], result["peak_bytes"]))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
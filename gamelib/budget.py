@@ -0,0 +1,126 @@
+import time
+
+from .debug_log import log
+
+
+class TurnBudget:
+    """Keeps track of the time left in the current turn.
+
+    AlgoCore starts the clock as soon as a turn's game state arrives, before on_turn is called.
+    Expensive analysis is run through step(), which skips it when it is not expected to finish in the time left.
+    Steps that can stop early, like TurnSearch.search, should be given the budget's deadline.
+    The best plan found so far for each decision is kept with offer(), so there is always something to submit.
+
+    A part of the turn, the headroom, is never handed out. It is kept for submit_turn and the work after the last step.
+
+    Attributes :
+        * limit (float): The seconds a turn may take, from the config's waitTimeBotSoft
+        * headroom (float): The seconds kept back for submitting the turn
+        * started (float): The time.monotonic() timestamp the turn started at, None before the first turn
+        * turn_limit (float): The seconds this turn may take, the limit less any overrun on the previous turn
+        * timings (dict): The seconds each step took the last time it ran
+        * skipped (list): The names of the steps skipped this turn
+
+    """
+    def __init__(self, config, headroom=0.25, clock=time.monotonic):
+        self.limit = config.get("timingAndReplay", {}).get("waitTimeBotSoft", 5000) / 1000
+        self.headroom = headroom
+        self.started = None
+        self.turn_limit = self.limit
+        self.timings = {}
+        self.skipped = []
+        self._clock = clock
+        self._offers = {}
+
+    def start(self, my_time=None, started=None):
+        """Starts the clock for a new turn
+
+        Args:
+            my_time: The milliseconds the previous turn took, as in GameState.my_time. Time spent past the limit
+                on the previous turn is taken out of this one.
+            started: The time.monotonic() timestamp the turn's game state arrived at, defaults to now
+
+        """
+        self.started = started if started is not None else self._clock()
+        self.turn_limit = self.limit
+        if my_time:
+            self.turn_limit -= max(0, my_time / 1000 - self.limit)
+        self.skipped = []
+        self._offers = {}
+
+    def elapsed(self):
+        """Gets the seconds since the turn started
+        """
+        if self.started is None:
+            return 0
+        return self._clock() - self.started
+
+    def remaining(self):
+        """Gets the seconds left for steps, headroom excluded
+        """
+        return self.turn_limit - self.headroom - self.elapsed()
+
+    def expired(self):
+        """Checks if the time for steps has run out
+        """
+        return self.remaining() <= 0
+
+    @property
+    def deadline(self):
+        """The time.monotonic() timestamp steps must finish by
+        """
+        return self._clock() + self.remaining()
+
+    def step(self, name, function, *args, estimate=0, learn=True, **kwargs):
+        """Runs an optional stage of the turn if there is time for it
+
+        Args:
+            name: A name for the step, used for timings and skipped
+            function: The function to run, called with the remaining args and kwargs
+            estimate: The seconds the step is expected to take. The time it took last turn is used if that is longer.
+            learn: Whether to remember how long the step took. Steps that run until the deadline they are given
+                should pass False, or they would be skipped on the next turn.
+
+        Returns:
+            What the function returns, or None if the step was skipped
+
+        """
+        estimate = max(estimate, self.timings.get(name, 0))
+        if self.remaining() < estimate:
+            log.debug("Skipping {}, {:.3f}s left and it takes {:.3f}s", name, self.remaining(), estimate)
+            self.skipped.append(name)
+            return None
+
+        started = self._clock()
+        result = function(*args, **kwargs)
+        if learn:
+            self.timings[name] = self._clock() - started
+        return result
+
+    def offer(self, name, plan, score=None):
+        """Offers a plan for a decision, it is kept if it is the best seen this turn
+
+        Plans without a score are fallbacks, they are kept only until a scored plan is offered.
+
+        Args:
+            name: The decision the plan is for
+            plan: The plan
+            score: The plan's score, higher is better
+
+        """
+        current = self._offers.get(name)
+        if current is None or (score is not None and (current[1] is None or score > current[1])):
+            self._offers[name] = (plan, score)
+
+    def best(self, name):
+        """Gets the best plan offered for a decision this turn
+
+        Args:
+            name: The decision
+
+        Returns:
+            The plan, None if none was offered
+
+        """
+        offer = self._offers.get(name)
+        return offer[0] if offer is not None else None
@@ -0,0 +1,207 @@
+import math
+
+from .profiling import profiler
+from .search import plan_requests
+
+# The cost units tried, from coarse to fine, when turning SP costs into whole numbers for the knapsack
+_SCALES = (1, 2, 4, 10)
+
+
+def _locations(actions):
+    """The locations actions build on, upgrade or remove, as a set of (x, y) tuples
+    """
+    locations = set()
+    for action in actions:
+        targets = action[2] if action[0] == "spawn" else action[1]
+        if len(targets) > 0 and type(targets[0]) == int:
+            targets = [targets]
+        locations.update(tuple(target) for target in targets)
+    return locations
+
+
+class BuildPlanner:
+    """Chooses the builds that get the most value out of a SP budget, then queues them in one pass.
+
+    An option is a list of actions, in the apply_plan() format, that are only worth building together, with a
+    value score. The options passed to one add() call exclude each other, at most one of them is built, which is
+    how alternatives for the same slot are offered (a turret, or a turret and its upgrade). Every option is dry run
+    with GameState.snapshot()/restore() when it is added, which gives its exact SP cost and drops the options that
+    can not be built on the current board.
+
+    Groups whose options use the same location are merged into one group, so a location proposed twice is neither
+    paid for nor valued twice. The merged group offers every option on its own, and every pair of options from the
+    two groups that do not share a location.
+
+    commit() solves the allocation as a multiple choice knapsack over the budget and queues the chosen options in
+    the order they were added. An option whose actions do not all succeed is rolled back, nothing is built half way.
+
+    Attributes :
+        * game_state (:obj: GameState): The state the options are built on
+        * groups (list): For each add() call, its buildable options as (value, cost, actions)
+        * claims (list): For each group, the set of (x, y) locations its options use
+
+    """
+    def __init__(self, game_state):
+        self.game_state = game_state
+        self.groups = []
+        self.claims = []
+
+    def apply(self, actions):
+        """Queues the actions on the game state in one GameState.attempt_batch() call
+
+        Returns:
+            True if every action succeeded in full
+        """
+        requests = plan_requests(actions, self.game_state.rules)
+        results = self.game_state.attempt_batch(requests)
+        return all(done == count for done, (_, _, count) in zip(results, requests))
+
+    def dry_run(self, actions):
+        """Queues the actions on the game state and rolls them back
+
+        Args:
+            actions: A list of actions in the apply_plan() format
+
+        Returns:
+            The SP the actions cost, or None if they do not all succeed
+
+        """
+        game_state = self.game_state
+        snapshot = game_state.snapshot()
+        resources = game_state.get_resource(game_state.SP)
+        warnings = game_state.enable_warnings
+        game_state.suppress_warnings(True)
+        try:
+            complete = self.apply(actions)
+            cost = resources - game_state.get_resource(game_state.SP)
+        finally:
+            game_state.restore(snapshot)
+            game_state.suppress_warnings(not warnings)
+        return cost if complete else None
+
+    def add(self, *options):
+        """Proposes options that exclude each other
+
+        Args:
+            options: (value, actions) pairs, actions is a list in the apply_plan() format
+
+        Returns:
+            The number of options that can be built and were kept
+
+        """
+        group = []
+        for value, actions in options:
+            if not actions or value <= 0:
+                continue
+            cost = self.dry_run(actions)
+            if cost is not None:
+                group.append((value, cost, actions))
+        if not group:
+            return 0
+        kept = len(group)
+
+        claim = set()
+        for _, _, actions in group:
+            claim |= _locations(actions)
+        overlapping = [index for index, other in enumerate(self.claims) if other & claim]
+        if overlapping:
+            merged = self.groups[overlapping[0]]
+            for index in overlapping[1:]:
+                merged = self.merge(merged, self.groups[index])
+            group = self.merge(merged, group)
+            for index in overlapping:
+                claim |= self.claims[index]
+            for index in reversed(overlapping):
+                del self.groups[index]
+                del self.claims[index]
+        position = overlapping[0] if overlapping else len(self.groups)
+        self.groups.insert(position, group)
+        self.claims.insert(position, claim)
+        return kept
+
+    def merge(self, first, second):
+        """Merges two groups of options into one group of options that exclude each other
+
+        Args:
+            first: The options of the group added first, as (value, cost, actions)
+            second: The options of the other group
+
+        Returns:
+            The options of either group, then the buildable pairs of options that do not share a location
+
+        """
+        group = first + second
+        for value, _, actions in first:
+            locations = _locations(actions)
+            for other_value, _, other_actions in second:
+                if locations & _locations(other_actions):
+                    continue
+                cost = self.dry_run(actions + other_actions)
+                if cost is not None:
+                    group.append((value + other_value, cost, actions + other_actions))
+        return group
+
+    def choose(self, budget):
+        """Solves which options to build
+
+        Args:
+            budget: The SP that can be spent
+
+        Returns:
+            The chosen (value, cost, actions) options, in the order they were added
+
+        """
+        costs = [cost for group in self.groups for _, cost, _ in group]
+        scale = next((scale for scale in _SCALES if all(abs(cost * scale - round(cost * scale)) < 1e-9 for cost in costs)), _SCALES[-1])
+        capacity = max(int(math.floor(budget * scale + 1e-9)), 0)
+
+        # best[b] is the most value for at most b cost units, choices[g][b] the option group g took for it
+        best = [0.0] * (capacity + 1)
+        choices = []
+        for group in self.groups:
+            stage = list(best)
+            choice = [-1] * (capacity + 1)
+            for k, (value, cost, _) in enumerate(group):
+                units = int(math.ceil(cost * scale - 1e-9))
+                for b in range(units, capacity + 1):
+                    if best[b - units] + value > stage[b]:
+                        stage[b] = best[b - units] + value
+                        choice[b] = k
+            choices.append(choice)
+            best = stage
+
+        chosen = []
+        b = capacity
+        for group, choice in zip(reversed(self.groups), reversed(choices)):
+            k = choice[b]
+            if k >= 0:
+                chosen.append(group[k])
+                b -= int(math.ceil(group[k][1] * scale - 1e-9))
+        chosen.reverse()
+        return chosen
+
+    @profiler.timed("BuildPlanner.commit")
+    def commit(self, budget=None):
+        """Queues the options that get the most value out of the budget
+
+        Args:
+            budget: The SP that can be spent, defaults to game_state.get_allowance()
+
+        Returns:
+            The (value, cost, actions) options that were queued
+
+        """
+        game_state = self.game_state
+        if budget is None:
+            budget = game_state.get_allowance()
+        committed = []
+        for option in self.choose(budget):
+            actions = option[2]
+            snapshot = game_state.snapshot()
+            if self.apply(actions):
+                committed.append(option)
+            else:
+                game_state.restore(snapshot)
+        self.groups = []
+        self.claims = []
+        return committed
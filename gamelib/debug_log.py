@@ -0,0 +1,108 @@
+import atexit
+import sys
+
+# Levels, a message is kept when its level is at least the log's level
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+
+class DebugLog:
+    """Buffers debug output and writes it to the game's debug output (stderr) in one write.
+
+    Messages are format strings with their arguments, formatted only when the message is kept, so a message below
+    the level or past the byte cap costs almost nothing. AlgoCore flushes the buffer after handling each message,
+    which for a turn is after it was submitted, so writing never delays the commands the engine waits on.
+    At most byte_cap bytes are kept per turn, the rest are dropped and counted in a single line.
+
+    debug_write() and GameState.warn() write to gamelib.log.
+
+    Attributes :
+        * level (int): The lowest level kept, DEBUG, INFO, WARNING or ERROR
+        * byte_cap (int): The number of bytes kept per turn, None for no cap
+        * dropped (int): The number of messages dropped this turn because of the cap
+        * stream (file): Where the buffer is written, None for the current sys.stderr
+
+    """
+    def __init__(self, level=INFO, byte_cap=64 * 1024, stream=None):
+        self.level = level
+        self.byte_cap = byte_cap
+        self.stream = stream
+        self.dropped = 0
+        self._buffer = []
+        self._size = 0
+
+    def keeps(self, level):
+        """Whether a message of the level is kept, a message refused because of the byte cap is counted as dropped.
+        Check it before building an expensive message, then write() the message.
+        """
+        if level < self.level:
+            return False
+        if self.byte_cap is not None and self._size >= self.byte_cap:
+            self.dropped += 1
+            return False
+        return True
+
+    def log(self, level, message, *args):
+        """Buffers a message
+
+        Args:
+            level: The level of the message
+            message: The message, a format string when args are given
+            args: The arguments of the format string
+
+        """
+        if self.keeps(level):
+            self.write(message.format(*args) if args else str(message))
+
+    def debug(self, message, *args):
+        self.log(DEBUG, message, *args)
+
+    def info(self, message, *args):
+        self.log(INFO, message, *args)
+
+    def warning(self, message, *args):
+        self.log(WARNING, message, *args)
+
+    def error(self, message, *args):
+        self.log(ERROR, message, *args)
+
+    def write(self, text):
+        """Buffers text that was already formatted, as a line, counting it towards the cap
+        """
+        text = text.rstrip() + "\n"
+        if self.byte_cap is not None and self._size + len(text) > self.byte_cap:
+            self._size = self.byte_cap
+            self.dropped += 1
+            return
+        self._buffer.append(text)
+        self._size += len(text)
+
+    def flush(self):
+        """Writes the buffered messages
+        """
+        if not self._buffer:
+            return
+        text = "".join(self._buffer)
+        self._buffer = []
+        stream = self.stream if self.stream is not None else sys.stderr
+        try:
+            stream.write(text)
+            stream.flush()
+        except (OSError, ValueError):
+            pass
+
+    def start_turn(self):
+        """Writes what is buffered and resets the byte cap, AlgoCore calls it when a turn arrives
+        """
+        if self.dropped:
+            self._buffer.append("Debug output cap of {} bytes reached, {} messages dropped\n".format(self.byte_cap, self.dropped))
+        self.flush()
+        self.dropped = 0
+        self._size = 0
+
+
+# The log debug_write() and gamelib write to
+log = DebugLog()
+atexit.register(log.flush)
@@ -0,0 +1,129 @@
+"""
+Records for the events of an action frame, built by AlgoCore for its on_breach, on_structure_destroyed,
+on_damage and on_spawn callbacks.
+
+In the raw frames the engine numbers players 1 (you) and 2 (your opponent) and unit types by their index in the
+config. Records use player_index 0 for you and 1 for your opponent, like the rest of gamelib, and unit type shorthands.
+"""
+
+from collections import namedtuple
+
+Breach = namedtuple("Breach", ["location", "damage", "unit_type", "unit_id", "player_index"])
+Breach.__doc__ = "A mobile unit of player_index scored on the opponent at location, dealing damage to their health"
+
+Damage = namedtuple("Damage", ["location", "damage", "unit_type", "unit_id", "player_index"])
+Damage.__doc__ = "A unit of player_index at location took damage"
+
+Death = namedtuple("Death", ["location", "unit_type", "unit_id", "player_index", "removed"])
+Death.__doc__ = "A unit of player_index at location died, removed is True if its owner removed it"
+
+Spawn = namedtuple("Spawn", ["location", "unit_type", "unit_id", "player_index"])
+Spawn.__doc__ = "A unit of player_index was created at location"
+
+
+class EventReader:
+    """Turns the raw event lists of action frames into records
+
+    Attributes :
+        * unit_types (list): The shorthand of each unit type, in config order
+        * structure_types (set): The shorthands of the stationary unit types
+
+    """
+    def __init__(self, config):
+        self.unit_types = [unit_info.get("shorthand") for unit_info in config["unitInformation"]]
+        self.structure_types = {unit_info.get("shorthand") for unit_info in config["unitInformation"] if unit_info.get("unitCategory") == 0}
+
+    def breaches(self, events):
+        unit_types = self.unit_types
+        return [Breach(event[0], event[1], unit_types[event[2]], event[3], event[4] - 1) for event in events.get("breach", ())]
+
+    def damages(self, events):
+        unit_types = self.unit_types
+        return [Damage(event[0], event[1], unit_types[event[2]], event[3], event[4] - 1) for event in events.get("damage", ())]
+
+    def deaths(self, events):
+        unit_types = self.unit_types
+        return [Death(event[0], unit_types[event[1]], event[2], event[3] - 1, event[4]) for event in events.get("death", ())]
+
+    def structures_destroyed(self, events):
+        """Deaths of structures, leaving out the ones their owner removed
+        """
+        unit_types = self.unit_types
+        structure_types = self.structure_types
+        destroyed = []
+        for event in events.get("death", ()):
+            unit_type = unit_types[event[1]]
+            if unit_type in structure_types and not event[4]:
+                destroyed.append(Death(event[0], unit_type, event[2], event[3] - 1, False))
+        return destroyed
+
+    def spawns(self, events):
+        unit_types = self.unit_types
+        return [Spawn(event[0], unit_types[event[1]], event[2], event[3] - 1) for event in events.get("spawn", ())]
+
+
+class TurnSummary:
+    """What happened during an action phase, collected from its frames by AlgoCore when collect_summary is set
+
+    Locations are (x, y) tuples. Every attribute holding a pair is indexed by player_index, 0 for you and 1 for your opponent.
+
+    Attributes :
+        * frames (int): The number of action frames received
+        * damage_taken ([dict, dict]): (x, y) -> the damage the player's units took at that location
+        * structures_lost ([list, list]): A Death record for each of the player's structures that was destroyed
+        * structures_removed ([list, list]): A Death record for each of the player's structures they removed
+        * breaches ([list, list]): The locations the player scored at
+        * spawns ([dict, dict]): (x, y) -> the number of units the player created at that location
+        * unit_counts ([dict, dict]): unit type -> the number of units of that type the player created
+
+    """
+    # The frame events a summary is built from
+    EVENTS = ["breach", "damage", "death", "spawn"]
+
+    def __init__(self):
+        self.frames = 0
+        self.damage_taken = [{}, {}]
+        self.structures_lost = [[], []]
+        self.structures_removed = [[], []]
+        self.breaches = [[], []]
+        self.spawns = [{}, {}]
+        self.unit_counts = [{}, {}]
+
+    def add(self, reader, events):
+        """Adds the events of a frame
+
+        Args:
+            reader: The EventReader for the game's config
+            events: The decoded events of the frame
+
+        """
+        for breach in reader.breaches(events):
+            self.breaches[breach.player_index].append(tuple(breach.location))
+        for damage in reader.damages(events):
+            damage_taken = self.damage_taken[damage.player_index]
+            location = tuple(damage.location)
+            damage_taken[location] = damage_taken.get(location, 0) + damage.damage
+        for death in reader.deaths(events):
+            if death.unit_type in reader.structure_types:
+                (self.structures_removed if death.removed else self.structures_lost)[death.player_index].append(death)
+        for spawn in reader.spawns(events):
+            spawns = self.spawns[spawn.player_index]
+            location = tuple(spawn.location)
+            spawns[location] = spawns.get(location, 0) + 1
+            unit_counts = self.unit_counts[spawn.player_index]
+            unit_counts[spawn.unit_type] = unit_counts.get(spawn.unit_type, 0) + 1
+
+    def changed_locations(self, player_index):
+        """Gets the locations where the player's units took damage or where their structures were destroyed or removed
+
+        Args:
+            player_index: The index corresponding to the player, 0 for you 1 for your opponent
+
+        Returns:
+            A set of (x, y) tuples
+
+        """
+        changed = set(self.damage_taken[player_index])
+        for death in self.structures_lost[player_index] + self.structures_removed[player_index]:
+            changed.add(tuple(death.location))
+        return changed
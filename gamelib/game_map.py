@@ -1,6 +1,77 @@
+import copy
 import math
+from .debug_log import log
+from .rules import compile_rules
 from .unit import GameUnit
-from .util import debug_write
+
+ARENA_SIZE = 28
+HALF_ARENA = 14
+
+
+def _diamond_bounds():
+    """Builds a flat (x * ARENA_SIZE + y) table that is True for every location on the diamond shaped board
+    """
+    bounds = []
+    for x in range(ARENA_SIZE):
+        for y in range(ARENA_SIZE):
+            row_size = y + 1 if y < HALF_ARENA else ARENA_SIZE - y
+            bounds.append(HALF_ARENA - row_size <= x < HALF_ARENA + row_size)
+    return bounds
+
+_IN_BOUNDS = _diamond_bounds()
+# y -> the (first x, last x + 1) of the row
+_ROW_RANGES = tuple((HALF_ARENA - (y + 1 if y < HALF_ARENA else ARENA_SIZE - y), HALF_ARENA + (y + 1 if y < HALF_ARENA else ARENA_SIZE - y)) for y in range(ARENA_SIZE))
+# Every location on the board, row by row from the bottom, in the order GameMap iterates them
+_LOCATIONS = tuple((x, y) for y in range(ARENA_SIZE) for x in range(*_ROW_RANGES[y]))
+
+
+def _edge_tables():
+    """Builds the four edges as tuples of (x, y) locations, in get_edges order: top right, top left, bottom left, bottom right
+    """
+    # top edges go from top to bottom, bottom edges from bottom to top
+    top_right = tuple((HALF_ARENA + num, ARENA_SIZE - 1 - num) for num in range(HALF_ARENA))
+    top_left = tuple((HALF_ARENA - 1 - num, ARENA_SIZE - 1 - num) for num in range(HALF_ARENA))
+    bottom_left = tuple((HALF_ARENA - 1 - num, num) for num in range(HALF_ARENA))
+    bottom_right = tuple((HALF_ARENA + num, num) for num in range(HALF_ARENA))
+    return top_right, top_left, bottom_left, bottom_right
+
+_EDGES = _edge_tables()
+_EDGE_SETS = tuple(frozenset(edge) for edge in _EDGES)
+
+
+def _bottom_edge_table():
+    """Builds a flat (x * ARENA_SIZE + y) table that is True for every location on the bottom left and bottom right edges
+    """
+    table = [False] * (ARENA_SIZE * ARENA_SIZE)
+    for x, y in _EDGES[2] + _EDGES[3]:
+        table[x * ARENA_SIZE + y] = True
+    return table
+
+# Where player 0 can deploy mobile units
+_BOTTOM_EDGES = _bottom_edge_table()
+
+# (radius, hit radius) -> tuple of (dx, dy, distance) offsets, filled once per distinct range
+_RANGE_OFFSETS = {}
+
+
+def _range_offsets(radius, hit_radius):
+    """Gets the offsets of every location within radius of a location.
+    A unit with a given range affects all locations who's centers are within that range + get hit radius
+    """
+    key = (radius, hit_radius)
+    offsets = _RANGE_OFFSETS.get(key)
+    if offsets is None:
+        search_radius = math.ceil(radius)
+        offsets = []
+        for dx in range(-search_radius, search_radius + 1):
+            for dy in range(-search_radius, search_radius + 1):
+                distance = math.sqrt(dx ** 2 + dy ** 2)
+                if distance < radius + hit_radius:
+                    offsets.append((dx, dy, distance))
+        offsets = tuple(offsets)
+        _RANGE_OFFSETS[key] = offsets
+    return offsets
+
 
 class GameMap:
     """Holds data about the current game map and provides functions
@@ -11,6 +82,7 @@ class GameMap:
 
     Attributes :
         * config (JSON): Contains information about the current game rules
+        * rules (:obj: Rules): The compiled unit rules of the config
         * enable_warnings (bool): If true, debug messages for game_map functions will print out
         * ARENA_SIZE (int): The size of the arena.
         * HALF_ARENA (int): Half of the size of the arena.
@@ -18,16 +90,33 @@ class GameMap:
         * TOP_LEFT (int): A constant that represents the top left edge
         * BOTTOM_LEFT (int): Hidden challenge! Can you guess what this constant represents???
         * BOTTOM_RIGHT (int): A constant that represents the bottom right edge
+        * max_attack_range (float): The largest attack range any unit can have, including upgrades
+        * edge_sets (tuple): A frozenset of the (x, y) locations of each edge, indexed by TOP_RIGHT, TOP_LEFT, BOTTOM_LEFT and BOTTOM_RIGHT
+        * structure_changes (list): Every location whose structures were changed through add_unit, remove_unit, upgrade_unit
+          or game_map[x, y] = units, in order. Pathfinding uses it to update cached results instead of rescanning the map.
+
+    The map also keeps flat layers with one entry per location, indexed by x * ARENA_SIZE + y, so questions
+    about the whole board can be answered without walking the unit lists. Off board entries are always empty.
+    They are kept in sync by add_unit, remove_unit, upgrade_unit and game_map[x, y] = units:
+        * structures (list): The structure GameUnit at each location, None if there is none
+        * structure_mask (list): True where there is a structure
+        * structure_owner (list): The player index owning the structure, -1 if there is none
+        * structure_type (list): The index in config["unitInformation"] of the structure, -1 if there is none
+        * structure_health (list): The health of the structure when it was placed, 0 if there is none
+        * structure_upgraded (list): True where the structure is upgraded
+        * mobile_counts (list): Two layers, the number of mobile units player 0 and player 1 have at each location
 
     """
-    def __init__(self, config):
+    def __init__(self, config, rules=None):
         """Initializes constants and game map
 
         Args:
             config (JSON): Contains information about the game
+            rules (:obj: Rules): The compiled rules of the config, compiled when not given
 
         """
         self.config = config
+        self.rules = rules if rules is not None else compile_rules(config)
         self.enable_warnings = True
         self.ARENA_SIZE = 28
         self.HALF_ARENA = int(self.ARENA_SIZE / 2)
@@ -36,7 +125,19 @@ class GameMap:
         self.BOTTOM_LEFT = 2
         self.BOTTOM_RIGHT = 3
         self.__map = self.__empty_grid()
-        self.__start = [13,0]
+        self.edge_sets = _EDGE_SETS
+        # the unit lists replaced since the first snapshot, as (x, y, units), see snapshot()
+        self.__journal = None
+        # 1 for every location whose unit list is shared with a fork, see fork()
+        self.__shared = None
+        self.structure_changes = []
+        self.__hit_radius = self.rules.hit_radius
+        self.max_attack_range = self.rules.max_attack_range
+        # the offsets of every attack range are cached, so this only builds them for the first map of a config
+        for radius in self.rules.attack_ranges:
+            _range_offsets(radius, self.__hit_radius)
+        self.__type_index = self.rules.UNIT_TYPE_TO_INDEX
+        self.__init_layers()
     
     def __getitem__(self, location):
         if len(location) == 2 and self.in_arena_bounds(location):
@@ -46,26 +147,17 @@ class GameMap:
 
     def __setitem__(self, location, val):
         if type(location) == tuple and len(location) == 2 and self.in_arena_bounds(location):
+            self.__touch(location[0], location[1])
             self.__map[location[0]][location[1]] = val
+            self.__update_layers(location[0], location[1])
+            self.structure_changes.append([location[0], location[1]])
             return
         self._invalid_coordinates(location)
 
     def __iter__(self):
-        self.__start = [13,0]
-        return self
-    
-    def __next__(self):
-        location = self.__start
-        if location == [15,27]:
-            raise StopIteration
-        new_location = [location[0]+1, location[1]]
-        while not self.in_arena_bounds(new_location) and not location == [14,27]:
-            if new_location[0] == self.ARENA_SIZE:
-                new_location = [0, new_location[1]+1]
-            else:
-                new_location = [new_location[0]+1, new_location[1]]
-        self.__start = new_location
-        return location 
+        # a new generator every time, so iterations of the same map can be nested
+        for x, y in _LOCATIONS:
+            yield [x, y]
 
     def __empty_grid(self):
         grid = []
@@ -75,6 +167,122 @@ class GameMap:
                 grid[x].append([])
         return grid
 
+    def __init_layers(self):
+        size = self.ARENA_SIZE * self.ARENA_SIZE
+        self.structures = [None] * size
+        self.structure_mask = [False] * size
+        self.structure_owner = [-1] * size
+        self.structure_type = [-1] * size
+        self.structure_health = [0] * size
+        self.structure_upgraded = [False] * size
+        self.mobile_counts = [[0] * size, [0] * size]
+
+    def __set_structure_layers(self, index, unit):
+        self.structures[index] = unit
+        if unit is None:
+            self.structure_mask[index] = False
+            self.structure_owner[index] = -1
+            self.structure_type[index] = -1
+            self.structure_health[index] = 0
+            self.structure_upgraded[index] = False
+        else:
+            self.structure_mask[index] = True
+            self.structure_owner[index] = unit.player_index
+            self.structure_type[index] = self.__type_index.get(unit.unit_type, -1)
+            self.structure_health[index] = unit.health
+            self.structure_upgraded[index] = unit.upgraded
+
+    def __update_layers(self, x, y):
+        """Recomputes every layer at a location from its list of units
+        """
+        index = x * self.ARENA_SIZE + y
+        structure = None
+        counts = [0, 0]
+        for unit in self.__map[x][y]:
+            if unit.stationary:
+                structure = unit
+            elif unit.player_index in (0, 1):
+                counts[unit.player_index] += 1
+        self.__set_structure_layers(index, structure)
+        self.mobile_counts[0][index] = counts[0]
+        self.mobile_counts[1][index] = counts[1]
+
+    def __touch(self, x, y, in_place=False):
+        """Called before the units of a location change. Journals the unit list when a snapshot was taken, and when the
+        list is about to be changed in place and is journaled or shared with a fork, gives the location its own copy.
+
+        Returns:
+            The unit list of the location, and whether its units may be referenced by a snapshot or a fork
+        """
+        units = self.__map[x][y]
+        index = x * self.ARENA_SIZE + y
+        shared = self.__shared is not None and self.__shared[index]
+        if self.__journal is not None:
+            self.__journal.append((x, y, units))
+            shared = True
+        if shared and in_place:
+            units = list(units)
+            self.__map[x][y] = units
+            if self.__shared is not None:
+                self.__shared[index] = 0
+        return units, shared
+
+    def snapshot(self):
+        """Marks the current units of the map so restore() can bring them back
+
+        From the first snapshot on, every change records the unit list it replaces, changes never modify a unit list
+        or a structure a snapshot can see (upgrade_unit upgrades a copy of the structure), so taking a snapshot and
+        restoring it only costs the locations that changed in between.
+
+        Returns:
+            A marker to pass to restore()
+
+        """
+        if self.__journal is None:
+            self.__journal = []
+        return len(self.__journal)
+
+    def restore(self, marker):
+        """Brings back the units the map had when snapshot() returned marker. Restored locations are added to
+        structure_changes, so pathfinding and the threat map catch up like after any other change.
+
+        Args:
+            marker: A marker returned by snapshot(), markers of later snapshots are no longer valid afterwards
+
+        """
+        journal = self.__journal
+        while len(journal) > marker:
+            x, y, units = journal.pop()
+            self.__map[x][y] = units
+            if self.__shared is not None:
+                self.__shared[x * self.ARENA_SIZE + y] = 1
+            self.__update_layers(x, y)
+            self.structure_changes.append([x, y])
+
+    def fork(self):
+        """Creates an independent map with the same units, without copying them
+
+        Unit lists and units are shared until either map changes a location, which then gets its own copy.
+
+        Returns:
+            The new GameMap
+        """
+        forked = copy.copy(self)
+        forked.__map = [list(column) for column in self.__map]
+        forked.structures = list(self.structures)
+        forked.structure_mask = list(self.structure_mask)
+        forked.structure_owner = list(self.structure_owner)
+        forked.structure_type = list(self.structure_type)
+        forked.structure_health = list(self.structure_health)
+        forked.structure_upgraded = list(self.structure_upgraded)
+        forked.mobile_counts = [list(self.mobile_counts[0]), list(self.mobile_counts[1])]
+        forked.structure_changes = list(self.structure_changes)
+        forked.__journal = None
+        size = self.ARENA_SIZE * self.ARENA_SIZE
+        forked.__shared = bytearray(b"\x01") * size
+        self.__shared = bytearray(b"\x01") * size
+        return forked
+
     def _invalid_coordinates(self, location):
         self.warn("{} is out of bounds.".format(str(location)))
 
@@ -89,6 +297,8 @@ class GameMap:
         
         """
         x, y = location
+        if type(x) is int and type(y) is int:
+            return 0 <= x < ARENA_SIZE and 0 <= y < ARENA_SIZE and _IN_BOUNDS[x * ARENA_SIZE + y]
         half_board = self.HALF_ARENA
 
         row_size = y + 1
@@ -103,6 +313,26 @@ class GameMap:
 
         return bottom_half_check or top_half_check
 
+    def structures_at(self, locations):
+        """Gets the structure at each of several locations, one indexed read per location
+
+        Args:
+            locations: A list of locations
+
+        Returns:
+            A list with the structure GameUnit at each location, None where there is none or the location is off the board
+
+        """
+        size = self.ARENA_SIZE
+        structures = self.structures
+        found = []
+        for x, y in locations:
+            if 0 <= x < size and 0 <= y < size and _IN_BOUNDS[x * size + y]:
+                found.append(structures[x * size + y])
+            else:
+                found.append(None)
+        return found
+
     def get_edge_locations(self, quadrant_description):
         """Takes in an edge description and returns a list of locations.
         
@@ -117,8 +347,7 @@ class GameMap:
             self.warn("Passed invalid quadrant_description '{}'. See the documentation for valid inputs for get_edge_locations.".format(quadrant_description))
             return
 
-        edges = self.get_edges()
-        return edges[quadrant_description]
+        return [[x, y] for x, y in _EDGES[quadrant_description]]
 
     def get_edges(self):
         """Gets all of the edges and their edge locations
@@ -127,39 +356,16 @@ class GameMap:
             A list with four lists inside of it of locations corresponding to the four edges.
             [0] = top_right, [1] = top_left, [2] = bottom_left, [3] = bottom_right.
         """
-
-        # goes from top to bottom
-        top_right = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA + num
-            y = self.ARENA_SIZE - 1 - num
-            top_right.append([int(x), int(y)])
-        top_left = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA - 1 - num
-            y = self.ARENA_SIZE - 1 - num
-            top_left.append([int(x), int(y)])
-
-        # goes from bottom to top 
-        bottom_left = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA - 1 - num
-            y = num
-            bottom_left.append([int(x), int(y)])
-        bottom_right = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA + num
-            y = num
-            bottom_right.append([int(x), int(y)])
-        return [top_right, top_left, bottom_left, bottom_right]
+        return [[[x, y] for x, y in edge] for edge in _EDGES]
     
-    def add_unit(self, unit_type, location, player_index=0):
+    def add_unit(self, unit_type, location, player_index=0, health=None):
         """Add a single GameUnit to the map at the given location.
 
         Args:
             unit_type: The type of the new unit. Use the constants provided in algo_strategy.
             location: A list of two integers representing the [x,y] coordinate of the new unit
             player_index: The index corresponding to the player controlling the new unit, 0 for you 1 for the enemy
+            health: The health of the new unit. Defaults to the starting health of its type.
 
         This function does not affect your turn and only changes the data stored in GameMap. The intended use of this function
         is to allow you to create arbitrary gamestates. Using this function on the game_map provided with game_state will 
@@ -171,11 +377,21 @@ class GameMap:
             self.warn("Player index {} is invalid. Player index should be 0 or 1.".format(player_index))
 
         x, y = location
-        new_unit = GameUnit(unit_type, self.config, player_index, None, location[0], location[1])
+        new_unit = GameUnit(unit_type, self.config, player_index, health, location[0], location[1], self.rules)
+        index = x * self.ARENA_SIZE + y
         if not new_unit.stationary:
-            self.__map[x][y].append(new_unit)
+            units, _ = self.__touch(x, y, True)
+            units.append(new_unit)
+            if player_index in (0, 1):
+                self.mobile_counts[player_index][index] += 1
         else:
+            self.__touch(x, y)
             self.__map[x][y] = [new_unit]
+            self.__set_structure_layers(index, new_unit)
+            self.mobile_counts[0][index] = 0
+            self.mobile_counts[1][index] = 0
+            self.structure_changes.append([x, y])
+        return new_unit
 
     def remove_unit(self, location):
         """Remove all units on the map in the given location.
@@ -190,7 +406,40 @@ class GameMap:
             self._invalid_coordinates(location)
         
         x, y = location
+        self.__touch(x, y)
         self.__map[x][y] = []
+        index = x * self.ARENA_SIZE + y
+        self.__set_structure_layers(index, None)
+        self.mobile_counts[0][index] = 0
+        self.mobile_counts[1][index] = 0
+        self.structure_changes.append([x, y])
+
+    def upgrade_unit(self, location):
+        """Upgrade the structure at the given location.
+
+        Args:
+            location: The location of the structure to upgrade
+
+        Returns:
+            The upgraded GameUnit, or None if there is no structure at the location
+
+        Like add_unit, this only changes the data stored in GameMap. Use GameState.attempt_upgrade to upgrade as part of your turn.
+        """
+        if not self.in_arena_bounds(location):
+            self._invalid_coordinates(location)
+            return None
+
+        x, y = location
+        for i, unit in enumerate(self.__map[x][y]):
+            if unit.stationary:
+                units, shared = self.__touch(x, y, True)
+                if shared:
+                    unit = units[i] = copy.copy(unit)
+                unit.upgrade()
+                self.__set_structure_layers(x * self.ARENA_SIZE + y, unit)
+                self.structure_changes.append([x, y])
+                return unit
+        return None
 
     def get_locations_in_range(self, location, radius):
         """Gets locations in a circular area around a location
@@ -209,16 +458,59 @@ class GameMap:
             self._invalid_coordinates(location)
 
         x, y = location
+        if type(x) is not int or type(y) is not int:
+            return [[i, j] for i, j, _ in self.__off_grid_range(location, radius)]
         locations = []
+        for dx, dy, _ in _range_offsets(radius, self.__hit_radius):
+            i = x + dx
+            j = y + dy
+            if 0 <= i < ARENA_SIZE and 0 <= j < ARENA_SIZE and _IN_BOUNDS[i * ARENA_SIZE + j]:
+                locations.append([i, j])
+        return locations
+
+    def get_units_in_range(self, location, radius):
+        """Gets the units in a circular area around a location, uses the same area as get_locations_in_range
+
+        Args:
+            location: The center of our search area
+            radius: The radius of our search area
+
+        Returns:
+            A list of [distance, units] pairs, one for each location in range that has units on it,
+            where units is the list of GameUnits at that location and distance is its distance to location
+
+        """
+        x, y = location
+        grid = self.__map
+        if type(x) is not int or type(y) is not int:
+            return [[distance, grid[i][j]] for i, j, distance in self.__off_grid_range(location, radius) if grid[i][j]]
+        found = []
+        for dx, dy, distance in _range_offsets(radius, self.__hit_radius):
+            i = x + dx
+            j = y + dy
+            if 0 <= i < ARENA_SIZE and 0 <= j < ARENA_SIZE and _IN_BOUNDS[i * ARENA_SIZE + j]:
+                units = grid[i][j]
+                if units:
+                    found.append([distance, units])
+        return found
+
+    def __off_grid_range(self, location, radius):
+        """Gets the locations in range of a location given with non int coordinates, such as [13.0, 5.0],
+        measuring each location instead of using the offset table
+
+        Returns:
+            A list of (x, y, distance) for each location on the board within range
+
+        """
+        x, y = location
         search_radius = math.ceil(radius)
-        getHitRadius = self.config["unitInformation"][0]['getHitRadius']
+        found = []
         for i in range(int(x - search_radius), int(x + search_radius + 1)):
             for j in range(int(y - search_radius), int(y + search_radius + 1)):
-                new_location = [i, j]
-                # A unit with a given range affects all locations who's centers are within that range + get hit radius
-                if self.in_arena_bounds(new_location) and self.distance_between_locations(location, new_location) < radius + getHitRadius:
-                    locations.append(new_location)
-        return locations
+                distance = math.sqrt((x - i) ** 2 + (y - j) ** 2)
+                if 0 <= i < ARENA_SIZE and 0 <= j < ARENA_SIZE and _IN_BOUNDS[i * ARENA_SIZE + j] and distance < radius + self.__hit_radius:
+                    found.append((i, j, distance))
+        return found
 
     def distance_between_locations(self, location_1, location_2):
         """Euclidean distance
@@ -241,7 +533,7 @@ class GameMap:
         Used internally by game_map to print out default messaging
         """
         if(self.enable_warnings):
-            debug_write(message)
+            log.warning(message)
 
 
 
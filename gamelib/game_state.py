@@ -1,37 +1,24 @@
+import copy
 import math
 import json
 import sys
 
 from .navigation import ShortestPathFinder
-from .util import send_command, debug_write
-from .unit import GameUnit
-from .game_map import GameMap
-
-def is_stationary(unit_type):
-    """
-        Args:
-            unit_type: A unit type
-        
-        Returns: 
-            Boolean, True if the unit is stationary, False otherwise.
-    """
-    return unit_type in STRUCTURE_TYPES
+from .profiling import profiler
+from .debug_log import log
+from .util import send_command, parse_message
+from .rules import compile_rules
+from .unit import GameUnit, is_stationary
+from .game_map import GameMap, _IN_BOUNDS, _BOTTOM_EDGES
+from .threat_map import ThreatMap
 
 class GameState:
     """Represents the entire gamestate for a given turn
     Provides methods related to resources and unit deployment
 
     Attributes :
-        * UNIT_TYPE_TO_INDEX (dict): Maps a unit to a corresponding index
-        * WALL (str): A constant representing the wall unit
-        * FACTORY (str): A constant representing the factory unit
-        * TURRET (str): A constant representing the turret unit
-        * SCOUT (str): A constant representing the scout unit
-        * DEMOLISHER (str): A constant representing the demolisher unit
-        * INTERCEPTOR (str): A constant representing the interceptor unit
-        * REMOVE (str): A constant representing removing your own unit
-        * UPGRADE (str): A constant representing upgrading a unit
-        * STRUCTURE_TYPES (list): A list of the structure units
+        * config (JSON): Contains information about the game
+        * rules (:obj: Rules): The compiled unit rules of the config, rules.WALL, rules.TURRET, rules.STRUCTURE_TYPES, ...
 
         * ARENA_SIZE (int): The size of the arena
         * HALF_ARENA (int): Half the size of the arena
@@ -39,6 +26,7 @@ class GameState:
         * SP (int): A constant representing the SP resource, used in the get_resource function
          
         * game_map (:obj: GameMap): The current GameMap. To retrieve a list of GameUnits at a location, use game_map[x, y]
+        * threat_map (:obj: ThreatMap): The damage per frame each player's structures deal at every location
         * turn_number (int): The current turn number. Starts at 0.
         * my_health (int): Your current remaining health
         * my_time (int): The time you took to submit your previous turn
@@ -47,52 +35,32 @@ class GameState:
 
     """
 
-    def __init__(self, config, serialized_string):
+    @profiler.timed("GameState.__init__")
+    def __init__(self, config, serialized_string, rules=None):
         """ Setup a turns variables using arguments passed
 
         Args:
             * config (JSON): A json object containing information about the game
-            * serialized_string (string): A string containing information about the game state at the start of this turn
+            * serialized_string (string): A string containing information about the game state at the start of this turn.
+                A GameMessage or an already decoded dict are also accepted, neither is decoded again
+            * rules (:obj: Rules): The compiled rules of the config, AlgoCore keeps them as self.rules. Compiled (once per config) when not given.
 
         """
         self.serialized_string = serialized_string
         self.config = config
+        self.rules = rules if rules is not None else compile_rules(config)
         self.enable_warnings = True
 
-        global WALL, FACTORY, TURRET, SCOUT, DEMOLISHER, INTERCEPTOR, REMOVE, UPGRADE, STRUCTURE_TYPES, ALL_UNITS, UNIT_TYPE_TO_INDEX
-        UNIT_TYPE_TO_INDEX = {}
-        WALL = config["unitInformation"][0]["shorthand"]
-        UNIT_TYPE_TO_INDEX[WALL] = 0
-        FACTORY = config["unitInformation"][1]["shorthand"]
-        UNIT_TYPE_TO_INDEX[FACTORY] = 1
-        TURRET = config["unitInformation"][2]["shorthand"]
-        UNIT_TYPE_TO_INDEX[TURRET] = 2
-        SCOUT = config["unitInformation"][3]["shorthand"]
-        UNIT_TYPE_TO_INDEX[SCOUT] = 3
-        DEMOLISHER = config["unitInformation"][4]["shorthand"]
-        UNIT_TYPE_TO_INDEX[DEMOLISHER] = 4
-        INTERCEPTOR = config["unitInformation"][5]["shorthand"]
-        UNIT_TYPE_TO_INDEX[INTERCEPTOR] = 5
-        REMOVE = config["unitInformation"][6]["shorthand"]
-        UNIT_TYPE_TO_INDEX[REMOVE] = 6
-        UPGRADE = config["unitInformation"][7]["shorthand"]
-        UNIT_TYPE_TO_INDEX[UPGRADE] = 7
-
-        ALL_UNITS = [SCOUT, DEMOLISHER, INTERCEPTOR, WALL, FACTORY, TURRET]
-        STRUCTURE_TYPES = [WALL, FACTORY, TURRET]
-
         self.ARENA_SIZE = 28
         self.HALF_ARENA = int(self.ARENA_SIZE / 2)
         self.MP = 1
         self.SP = 0
-        global MP, SP
-        MP = self.MP
-        SP = self.SP
 
         self.to_save = 0
 
-        self.game_map = GameMap(self.config)
+        self.game_map = GameMap(self.config, self.rules)
         self._shortest_path_finder = ShortestPathFinder()
+        self.threat_map = ThreatMap(self)
         self._build_stack = []
         self._deploy_stack = []
         self._player_resources = [
@@ -103,9 +71,9 @@ class GameState:
     def __parse_state(self, state_line):
         """
         Fills in map based on the serialized game state so that self.game_map[x,y] is a list of GameUnits at that location.
-        state_line is the game state as a json string.
+        state_line is the game state as a json string, a GameMessage or a decoded dict.
         """
-        state = json.loads(state_line)
+        state = parse_message(state_line)
 
         turn_info = state["turnInfo"]
         self.turn_number = int(turn_info[1])
@@ -132,46 +100,32 @@ class GameState:
         """
         Helper function for __parse_state to add units to the map.
         """
-        typedef = self.config.get("unitInformation")
+        rules = self.rules
         for i, unit_types in enumerate(units):
+            unit_type = rules.unit_types[i]
             for uinfo in unit_types:
-                unit_type = typedef[i].get("shorthand")
                 sx, sy, shp = uinfo[:3]
                 x, y = map(int, [sx, sy])
                 hp = float(shp)
                 # This depends on RM and UP always being the last types to be processed
-                if unit_type == REMOVE:
+                if unit_type == rules.REMOVE:
                     # Quick fix will deploy engine fix soon
                     if self.contains_stationary_unit([x,y]):
                         self.game_map[x,y][0].pending_removal = True
-                elif unit_type == UPGRADE:
+                elif unit_type == rules.UPGRADE:
                     if self.contains_stationary_unit([x,y]):
-                        self.game_map[x,y][0].upgrade()
+                        self.game_map.upgrade_unit([x,y])
                 else:
-                    unit = GameUnit(unit_type, self.config, player_number, hp, x, y)
-                    self.game_map[x,y].append(unit)
+                    self.game_map.add_unit(unit_type, [x,y], player_number, hp)
 
     def __resource_required(self, unit_type):
-        return self.SP if is_stationary(unit_type) else self.MP
-
-    def __set_resource(self, resource_type, amount, player_index=0):
-        """
-        Sets the resources for the given player_index and resource_type.
-        Is automatically called by other provided functions.
-        Adds the value amount to the current held resources
-        """
-        if resource_type == self.MP:
-            resource_key = 'MP'
-        elif resource_type == self.SP:
-            resource_key = 'SP'
-        held_resource = self.get_resource(resource_type, player_index)
-        self._player_resources[player_index][resource_key] = held_resource + amount
+        return self.SP if unit_type in self.rules.STRUCTURE_TYPES else self.MP
 
     def _invalid_player_index(self, index):
-        self.warn("Invalid player index {} passed, player index should always be 0 (yourself) or 1 (your opponent)".format(index))
+        self.warn("Invalid player index {} passed, player index should always be 0 (yourself) or 1 (your opponent)", index)
     
     def _invalid_unit(self, unit):
-        self.warn("Invalid unit {}".format(unit))
+        self.warn("Invalid unit {}", unit)
 
     def submit_turn(self):
         """Submit and end your turn.
@@ -182,6 +136,52 @@ class GameState:
         send_command(build_string)
         send_command(deploy_string)
 
+    def snapshot(self):
+        """Marks the map, resources and build/deploy stacks so restore() can roll back to them
+
+        Taking a snapshot copies nothing but the resources, and rolling back only touches what changed in
+        between, so placements can be tried with attempt_spawn/attempt_upgrade/attempt_remove and undone cheaply.
+        Snapshots nest, restoring one invalidates the snapshots taken after it.
+
+        Returns:
+            A snapshot to pass to restore()
+
+        """
+        return (self.game_map.snapshot(), [dict(resources) for resources in self._player_resources],
+                len(self._build_stack), len(self._deploy_stack), self.to_save)
+
+    def restore(self, snapshot):
+        """Rolls the map, resources and build/deploy stacks back to a snapshot
+
+        Args:
+            snapshot: A snapshot returned by snapshot()
+
+        """
+        marker, resources, build_size, deploy_size, self.to_save = snapshot
+        self.game_map.restore(marker)
+        self._player_resources = [dict(player_resources) for player_resources in resources]
+        del self._build_stack[build_size:]
+        del self._deploy_stack[deploy_size:]
+
+    def fork(self):
+        """Creates an independent copy of the state to branch on
+
+        The map is copied on write (see GameMap.fork), the rest of the state is shared or small, so forking is
+        much cheaper than building a state from the serialized string or deep copying it. The fork has its own
+        pathfinder and threat map, which are built the first time they are used.
+
+        Returns:
+            The new GameState
+        """
+        forked = copy.copy(self)
+        forked.game_map = self.game_map.fork()
+        forked._player_resources = [dict(resources) for resources in self._player_resources]
+        forked._build_stack = list(self._build_stack)
+        forked._deploy_stack = list(self._deploy_stack)
+        forked._shortest_path_finder = ShortestPathFinder()
+        forked.threat_map = ThreatMap(forked)
+        return forked
+
     def get_resource(self, resource_type, player_index = 0):
         """Gets a players resources
 
@@ -197,7 +197,7 @@ class GameState:
             self._invalid_player_index(player_index)
             return
         if not resource_type == self.MP and not resource_type == self.SP:
-            self.warn("Invalid resource_type '{}'. Please use MP (0) or SP (1)".format(resource_type))
+            self.warn("Invalid resource_type '{}'. Please use MP (0) or SP (1)", resource_type)
             return
 
         if resource_type == self.MP:
@@ -236,11 +236,12 @@ class GameState:
             The number of units affordable of the given unit_type.
 
         """
-        if unit_type not in ALL_UNITS:
+        if unit_type not in self.rules.ALL_UNITS:
             self._invalid_unit(unit_type)
             return
 
-        costs = self.type_cost(unit_type)
+        SP, MP = self.SP, self.MP
+        costs = self.rules.costs[unit_type]
         player_held = self.get_resources()
         if costs[MP] > 0 and costs[SP] > 0:
             return min(math.floor(player_held[SP] / costs[SP]), math.floor(player_held[MP] / costs[MP]))
@@ -266,11 +267,11 @@ class GameState:
         """
 
         if turns_in_future < 1 or turns_in_future > 99:
-            self.warn("Invalid turns in future used ({}). Turns in future should be between 1 and 99".format(turns_in_future))
+            self.warn("Invalid turns in future used ({}). Turns in future should be between 1 and 99", turns_in_future)
         if not player_index == 1 and not player_index == 0:
             self._invalid_player_index(player_index)
         if type(current_MP) == int and current_MP < 0:
-            self.warn("Invalid current MP ({}). Current MP cannot be negative.".format(current_MP))
+            self.warn("Invalid current MP ({}). Current MP cannot be negative.", current_MP)
 
         MP = self.get_resource(self.MP, player_index) if not current_MP else current_MP
         for increment in range(1, turns_in_future + 1):
@@ -294,16 +295,13 @@ class GameState:
             The units costs as a list [SP, MP]
 
         """
-        if unit_type == REMOVE:
+        if unit_type == self.rules.REMOVE:
             self._invalid_unit(unit_type)
             return
-        
-        unit_def = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[unit_type]]
-        cost_base = [unit_def.get('cost1', 0), unit_def.get('cost2', 0)]
-        if upgrade:
-            return [unit_def.get('upgrade', {}).get('cost1', cost_base[SP]), unit_def.get('upgrade', {}).get('cost2', cost_base[MP])]
 
-        return cost_base
+        if upgrade:
+            return list(self.rules.upgrade_costs[unit_type])
+        return list(self.rules.costs[unit_type])
 
 
     def can_spawn(self, unit_type, location, num=1):
@@ -322,20 +320,22 @@ class GameState:
             True if we can spawn the unit(s)
 
         """
-        if unit_type not in ALL_UNITS:
+        if unit_type not in self.rules.ALL_UNITS:
             self._invalid_unit(unit_type)
             return
         
         if not self.game_map.in_arena_bounds(location):
             if self.enable_warnings:
-                self.warn("Could not spawn {} at location {}. Location invalid.".format(unit_type, location))
+                self.warn("Could not spawn {} at location {}. Location invalid.", unit_type, location)
             return False
 
         affordable = self.number_affordable(unit_type) >= num
-        stationary = is_stationary(unit_type)
+        stationary = is_stationary(unit_type, self.rules.STRUCTURE_TYPES)
         blocked = self.contains_stationary_unit(location) or (stationary and len(self.game_map[location[0],location[1]]) > 0)
         correct_territory = location[1] < self.HALF_ARENA
-        on_edge = location in (self.game_map.get_edge_locations(self.game_map.BOTTOM_LEFT) + self.game_map.get_edge_locations(self.game_map.BOTTOM_RIGHT))
+        edge_sets = self.game_map.edge_sets
+        tile = (location[0], location[1])
+        on_edge = tile in edge_sets[self.game_map.BOTTOM_LEFT] or tile in edge_sets[self.game_map.BOTTOM_RIGHT]
 
         if self.enable_warnings:
             fail_reason = ""
@@ -348,7 +348,7 @@ class GameState:
             if not (stationary or on_edge):
                 fail_reason = fail_reason + " Information units must be deployed on the edge."
             if len(fail_reason) > 0:
-                self.warn("Could not spawn {} at location {}.{}".format(unit_type, location, fail_reason))
+                self.warn("Could not spawn {} at location {}.{}", unit_type, location, fail_reason)
 
         return (affordable and correct_territory and not blocked and
                 (stationary or on_edge) and
@@ -369,32 +369,16 @@ class GameState:
         if len(locations) == 0:
             return
         
-        if unit_type not in ALL_UNITS:
+        if unit_type not in self.rules.ALL_UNITS:
             self._invalid_unit(unit_type)
             return
         if num < 1:
-            self.warn("Attempted to spawn fewer than one units! ({})".format(num))
+            self.warn("Attempted to spawn fewer than one units! ({})", num)
             return
       
         if type(locations[0]) == int:
             locations = [locations]
-        spawned_units = 0
-        for location in locations:
-            for i in range(num):
-                if self.can_spawn(unit_type, location, 1):
-                    x, y = map(int, location)
-                    costs = self.type_cost(unit_type)
-                    self.__set_resource(SP, 0 - costs[SP])
-                    self.__set_resource(MP, 0 - costs[MP])
-                    self.game_map.add_unit(unit_type, location, 0)
-                    if is_stationary(unit_type):
-                        self._build_stack.append((unit_type, x, y))
-                    else:
-                        self._deploy_stack.append((unit_type, x, y))
-                    spawned_units += 1
-                else:
-                    break
-        return spawned_units
+        return sum(self.attempt_batch([(unit_type, location, num) for location in locations]))
 
     def attempt_remove(self, locations):
         """Attempts to remove existing friendly structures in the given locations.
@@ -408,15 +392,7 @@ class GameState:
         """
         if type(locations[0]) == int:
             locations = [locations]
-        removed_units = 0
-        for location in locations:
-            if location[1] < self.HALF_ARENA and self.contains_stationary_unit(location):
-                x, y = map(int, location)
-                self._build_stack.append((REMOVE, x, y))
-                removed_units += 1
-            else:
-                self.warn("Could not remove a unit from {}. Location has no structures or is enemy territory.".format(location))
-        return removed_units
+        return sum(self.attempt_batch([(self.rules.REMOVE, location, 1) for location in locations]))
 
     def attempt_upgrade(self, locations):
         """Attempts to upgrade units in the given locations.
@@ -433,27 +409,109 @@ class GameState:
         
         if type(locations[0]) == int:
             locations = [locations]
-        spawned_units = 0
-        for location in locations:
-            if location[1] < self.HALF_ARENA and self.contains_stationary_unit(location):
-                x, y = map(int, location)
-                existing_unit = None
-                for unit in self.game_map[x,y]:
-                    if unit.stationary:
-                        existing_unit = unit
-
-                if not existing_unit.upgraded and self.config["unitInformation"][UNIT_TYPE_TO_INDEX[existing_unit.unit_type]].get("upgrade", None) is not None:
-                    costs = self.type_cost(existing_unit.unit_type, True)
-                    resources = self.get_resources()
-                    if resources[SP] >= costs[SP] and resources[MP] >= costs[MP]:
-                        self.__set_resource(SP, 0 - costs[SP])
-                        self.__set_resource(MP, 0 - costs[MP])
-                        existing_unit.upgrade()
-                        self._build_stack.append((UPGRADE, x, y))
-                        spawned_units += 1
-            else:
-                self.warn("Could not upgrade a unit from {}. Location has no structures or is enemy territory.".format(location))
-        return spawned_units
+        return sum(self.attempt_batch([(self.rules.UPGRADE, location, 1) for location in locations]))
+
+    def attempt_batch(self, requests):
+        """Attempts a batch of spawns, upgrades and removals, in order, with the same results as calling
+        attempt_spawn, attempt_upgrade and attempt_remove for each request.
+
+        The batch is checked against the structure and mobile unit layers of the map and a table of our edges
+        instead of going through can_spawn, and the resources are read once and written back once, so each
+        unit costs a few table lookups. attempt_spawn, attempt_upgrade and attempt_remove go through it.
+
+        Args:
+            requests: A list of (unit_type, location, count). unit_type is the type of count units to spawn,
+                or UPGRADE or REMOVE to upgrade or remove the structure at location, count is ignored for those
+
+        Returns:
+            A list with the number of units spawned, upgraded or flagged for removal for each request
+
+        """
+        rules = self.rules
+        game_map = self.game_map
+        structures = game_map.structures
+        mobile_counts = game_map.mobile_counts
+        resources = self._player_resources[0]
+        held_SP, held_MP = resources['SP'], resources['MP']
+        results = []
+        try:
+            for unit_type, location, count in requests:
+                index = self.__location_index(location)
+                if unit_type == rules.UPGRADE or unit_type == rules.REMOVE:
+                    structure = structures[index] if index is not None and index % self.ARENA_SIZE < self.HALF_ARENA else None
+                    if structure is None:
+                        self.warn("Could not {} a unit from {}. Location has no structures or is enemy territory.",
+                                  "upgrade" if unit_type == rules.UPGRADE else "remove", location)
+                        results.append(0)
+                        continue
+                    x, y = divmod(index, self.ARENA_SIZE)
+                    if unit_type == rules.REMOVE:
+                        self._build_stack.append((unit_type, x, y))
+                        results.append(1)
+                        continue
+                    cost_SP, cost_MP = rules.upgrade_costs[structure.unit_type]
+                    if not structure.upgraded and structure.unit_type in rules.upgradable and held_SP >= cost_SP and held_MP >= cost_MP:
+                        held_SP -= cost_SP
+                        held_MP -= cost_MP
+                        game_map.upgrade_unit([x, y])
+                        self._build_stack.append((unit_type, x, y))
+                        results.append(1)
+                    else:
+                        results.append(0)
+                    continue
+
+                if unit_type not in rules.ALL_UNITS:
+                    self._invalid_unit(unit_type)
+                    results.append(0)
+                    continue
+                if index is None:
+                    self.warn("Could not spawn {} at location {}. Location invalid.", unit_type, location)
+                    results.append(0)
+                    continue
+                x, y = divmod(index, self.ARENA_SIZE)
+                cost_SP, cost_MP = rules.costs[unit_type]
+                stationary = unit_type in rules.STRUCTURE_TYPES
+                stack = self._build_stack if stationary else self._deploy_stack
+                spawned = 0
+                while spawned < count:
+                    affordable = (cost_SP > 0 or cost_MP > 0) and held_SP >= cost_SP and held_MP >= cost_MP
+                    blocked = structures[index] is not None or (stationary and (mobile_counts[0][index] or mobile_counts[1][index]))
+                    correct_territory = y < self.HALF_ARENA
+                    on_edge = _BOTTOM_EDGES[index]
+                    if not (affordable and not blocked and correct_territory and (stationary or on_edge)):
+                        if self.enable_warnings:
+                            fail_reason = ""
+                            if not affordable:
+                                fail_reason = fail_reason + " Not enough resources."
+                            if blocked:
+                                fail_reason = fail_reason + " Location is blocked."
+                            if not correct_territory:
+                                fail_reason = fail_reason + " Location in enemy territory."
+                            if not (stationary or on_edge):
+                                fail_reason = fail_reason + " Information units must be deployed on the edge."
+                            self.warn("Could not spawn {} at location {}.{}", unit_type, location, fail_reason)
+                        break
+                    held_SP -= cost_SP
+                    held_MP -= cost_MP
+                    game_map.add_unit(unit_type, [x, y], 0)
+                    stack.append((unit_type, x, y))
+                    spawned += 1
+                results.append(spawned)
+        finally:
+            resources['SP'], resources['MP'] = held_SP, held_MP
+        return results
+
+    def __location_index(self, location):
+        """The flat (x * ARENA_SIZE + y) index of a location, None when it is not on the board
+        """
+        x, y = location
+        if type(x) is not int or type(y) is not int or not (0 <= x < self.ARENA_SIZE and 0 <= y < self.ARENA_SIZE):
+            if not self.game_map.in_arena_bounds(location):
+                return None
+            x, y = map(int, location)
+        elif not _IN_BOUNDS[x * self.ARENA_SIZE + y]:
+            return None
+        return x * self.ARENA_SIZE + y
 
     def get_target_edge(self, start_location):
         """Gets the target edge given a starting location
@@ -478,6 +536,7 @@ class GameState:
         elif right and top:
             return self.game_map.BOTTOM_LEFT
 
+    @profiler.timed("GameState.find_path_to_edge")
     def find_path_to_edge(self, start_location, target_edge=None):
         """Gets the path a unit at a given location would take. 
         If final point is not on an edge, it is a self destruct path
@@ -492,7 +551,7 @@ class GameState:
 
         """
         if self.contains_stationary_unit(start_location):
-            self.warn("Attempted to perform pathing from blocked starting location {}".format(start_location))
+            self.warn("Attempted to perform pathing from blocked starting location {}", start_location)
             return
 
         if target_edge is None:
@@ -501,6 +560,32 @@ class GameState:
         end_points = self.game_map.get_edge_locations(target_edge)
         return self._shortest_path_finder.navigate_multiple_endpoints(start_location, end_points, self)
 
+    @profiler.timed("GameState.find_paths_from_edges")
+    def find_paths_from_edges(self, edges=None):
+        """Gets the paths units would take from every location on the given edges.
+        Locations on the same edge share a target edge, so each edge costs a single search
+        instead of one search per location.
+
+        Args:
+            edges: A list of edges to start from, game_map.BOTTOM_LEFT, game_map.BOTTOM_RIGHT, etc. Defaults to your two edges.
+
+        Returns:
+            A list of paths, in the order of the edge locations of each edge in edges.
+            Each path starts at its edge location. Locations blocked by a structure get None instead of a path.
+
+        """
+        if edges is None:
+            edges = [self.game_map.BOTTOM_LEFT, self.game_map.BOTTOM_RIGHT]
+
+        paths = []
+        for edge in edges:
+            start_locations = self.game_map.get_edge_locations(edge)
+            if not start_locations:
+                continue
+            end_points = self.game_map.get_edge_locations(self.get_target_edge(start_locations[0]))
+            paths += self._shortest_path_finder.navigate_from_points(start_locations, end_points, self)
+        return paths
+
     def contains_stationary_unit(self, location):
         """Check if a location is blocked, return structures unit if it is
 
@@ -511,21 +596,24 @@ class GameState:
             A structures unit if there is a stationary unit at the location, False otherwise
             
         """
-        if not self.game_map.in_arena_bounds(location):
+        x, y = location
+        if type(x) is not int or type(y) is not int or not (0 <= x < self.ARENA_SIZE and 0 <= y < self.ARENA_SIZE):
+            if not self.game_map.in_arena_bounds(location):
+                self.warn('Checked for stationary unit outside of arena bounds')
+                return False
+            x, y = map(int, location)
+        elif not _IN_BOUNDS[x * self.ARENA_SIZE + y]:
             self.warn('Checked for stationary unit outside of arena bounds')
             return False
-        x, y = map(int, location)
-        for unit in self.game_map[x,y]:
-            if unit.stationary:
-                return unit
-        return False
-
-    def warn(self, message):
-        """ Used internally by game_state to print warnings
+        # the map keeps the structure of every location in a flat index, no need to scan the unit list
+        return self.game_map.structures[x * self.ARENA_SIZE + y] or False
+
+    def warn(self, message, *args):
+        """ Used internally by game_state to print warnings, the message is only formatted with args if it is written
         """
 
         if(self.enable_warnings):
-            debug_write(message)
+            log.warning(message, *args)
 
     def suppress_warnings(self, suppress):
         """Suppress all warnings
@@ -538,6 +626,7 @@ class GameState:
         self.enable_warnings = not suppress
         self.game_map.enable_warnings = not suppress
 
+    @profiler.timed("GameState.get_target")
     def get_target(self, attacking_unit):
         """Returns target of given unit based on current map of the game board. 
         A Unit can often have many other units in range, and Units that attack do so once each frame.
@@ -554,11 +643,11 @@ class GameState:
         """
 
         if not isinstance(attacking_unit, GameUnit):
-            self.warn("Passed a {} to get_target as attacking_unit. Expected a GameUnit.".format(type(attacking_unit)))
+            self.warn("Passed a {} to get_target as attacking_unit. Expected a GameUnit.", type(attacking_unit))
             return
 
         attacker_location = [attacking_unit.x, attacking_unit.y]
-        possible_locations = self.game_map.get_locations_in_range(attacker_location, attacking_unit.attackRange)
+        units_in_range = self.game_map.get_units_in_range(attacker_location, attacking_unit.attackRange)
         target = None
         target_stationary = True
         target_distance = sys.maxsize
@@ -566,14 +655,13 @@ class GameState:
         target_y = self.ARENA_SIZE
         target_x_distance = 0
 
-        for location in possible_locations:
-            for unit in self.game_map[location]:
-                if unit.player_index == attacking_unit.player_index or (attacking_unit.damage_f == 0 and is_stationary(unit.unit_type)) or (attacking_unit.damage_i == 0 and not(is_stationary(unit.unit_type))):
+        for unit_distance, units in units_in_range:
+            for unit in units:
+                if unit.player_index == attacking_unit.player_index or (attacking_unit.damage_f == 0 and unit.stationary) or (attacking_unit.damage_i == 0 and not unit.stationary):
                     continue
 
                 new_target = False
                 unit_stationary = unit.stationary
-                unit_distance = self.game_map.distance_between_locations(location, [attacking_unit.x, attacking_unit.y])
                 unit_health = unit.health
                 unit_y = unit.y
                 unit_x_distance = abs(self.HALF_ARENA - 0.5 - unit.x)
@@ -617,6 +705,7 @@ class GameState:
                     target_x_distance = unit_x_distance
         return target
 
+    @profiler.timed("GameState.get_attackers")
     def get_attackers(self, location, player_index):
         """Gets the stationary units threatening a given location
 
@@ -632,20 +721,15 @@ class GameState:
         if not player_index == 0 and not player_index == 1:
             self._invalid_player_index(player_index)
         if not self.game_map.in_arena_bounds(location):
-            self.warn("Location {} is not in the arena bounds.".format(location))
+            self.warn("Location {} is not in the arena bounds.", location)
 
         attackers = []
         """
         Get locations in the range of TURRET units
         """
-        max_range = 0
-        for unit in self.config["unitInformation"]:
-            if unit.get('attackRange', 0) >= max_range:
-                max_range = unit.get('attackRange', 0)
-        possible_locations= self.game_map.get_locations_in_range(location, max_range)
-        for location_unit in possible_locations:
-            for unit in self.game_map[location_unit]:
-                if unit.damage_i + unit.damage_f > 0 and unit.player_index != player_index and self.game_map.distance_between_locations(location, location_unit) <= unit.attackRange:
+        for distance, units in self.game_map.get_units_in_range(location, self.game_map.max_attack_range):
+            for unit in units:
+                if unit.damage_i + unit.damage_f > 0 and unit.player_index != player_index and distance <= unit.attackRange:
                     attackers.append(unit)
         return attackers
 
@@ -664,13 +748,13 @@ class GameState:
                 unit = self.contains_stationary_unit(cur)
 
                 if unit:
-                    if unit.unit_type == TURRET:
+                    if unit.unit_type == self.rules.TURRET:
                         coords.append(cur)      
         return coords
 
     # testing really
     def spawn_turret(self, coord):
-        return self.attempt_spawn(TURRET, coord)
+        return self.attempt_spawn(self.rules.TURRET, coord)
 
     # SP
     def get_allowance(self):
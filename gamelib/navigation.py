@@ -1,24 +1,25 @@
 import heapq
-import math
-import sys
-import queue
+from collections import deque
+from .debug_log import log
 from .util import debug_write
+from .game_map import ARENA_SIZE, HALF_ARENA, _IN_BOUNDS
 
-class Node:
-    """A pathfinding node
-
-    Attributes :
-        * visited_idealness (bool): Have we visited this node during the idealness search step?
-        * visited_validate (bool): Have we visited this node during the validation step?
-        * blocked (bool): Is there a structures at this node's location
-        * pathlength: The distance between this node and the target location
 
+def _build_neighbors():
+    """Builds the flat (x * ARENA_SIZE + y) neighbor table used by the pathfinder, on the board shape of game_map.
+    Neighbors are listed in the order the pathfinder considers them: up, down, right, left.
     """
-    def __init__(self):
-        self.visited_idealness = False
-        self.visited_validate = False
-        self.blocked = False
-        self.pathlength = -1
+    neighbors = []
+    for index in range(ARENA_SIZE * ARENA_SIZE):
+        x, y = divmod(index, ARENA_SIZE)
+        adjacent = []
+        for nx, ny in [[x, y + 1], [x, y - 1], [x + 1, y], [x - 1, y]]:
+            if 0 <= nx < ARENA_SIZE and 0 <= ny < ARENA_SIZE and _IN_BOUNDS[nx * ARENA_SIZE + ny]:
+                adjacent.append(nx * ARENA_SIZE + ny)
+        neighbors.append(tuple(adjacent))
+    return neighbors
+
+_NEIGHBORS = _build_neighbors()
 
 """
 This class helps with pathfinding. We guarantee the results will
@@ -28,29 +29,82 @@ code to maximise time efficiency
 class ShortestPathFinder:
     """Handles pathfinding
 
+    Distance fields are cached per set of end points and kept in sync with the
+    GameMap's structure_changes log. Adding or removing a structure only repairs
+    the part of each cached field that depended on that tile, so many queries on
+    the same board cost little more than walking the returned paths.
+
     Attributes :
         * HORIZONTAL (int): A constant representing a horizontal movement
         * VERTICAL (int): A constant representing a vertical movement
 
-        * game_state (:obj: GameState): The current gamestate
-        * game_map (:obj: GameMap): The current gamemap
+        * game_state (:obj: GameState): The gamestate of the most recent query
+        * game_map (:obj: GameMap): The gamemap the cached search data belongs to
 
     """
+    # More pending changes than this and a full rebuild is cheaper than repairing every field
+    REBUILD_THRESHOLD = 64
+
     def __init__(self):
         self.HORIZONTAL = 1
         self.VERTICAL = 2
         self.initialized = False
+        self.game_state = None
+        self.game_map = None
+        self._blocked = None
+        self._synced = 0
+        self._edge_fields = {}
+        self._pocket_fields = {}
+        self._pockets = {}
+        self._last_field = None
 
     def initialize_map(self, game_state):
-        """Initializes the map
+        """Initializes the map, rebuilding the blocked mask and dropping every cached distance field
 
         Args:
             game_state: A GameState object representing the gamestate we want to traverse
         """
-        #Initialize map 
         self.initialized = True
         self.game_state = game_state
-        self.game_map = [[Node() for x in range(self.game_state.ARENA_SIZE)] for y in range(self.game_state.ARENA_SIZE)]
+        self.game_map = game_state.game_map
+        self._synced = len(self.game_map.structure_changes)
+        self._blocked = list(self.game_map.structure_mask)
+        self._edge_fields = {}
+        self._pocket_fields = {}
+        self._pockets = {}
+        self._last_field = None
+
+    def _sync(self, game_state):
+        """Brings the blocked mask and cached fields up to date with the game map
+        """
+        self.game_state = game_state
+        game_map = game_state.game_map
+        if game_map is not self.game_map or self._blocked is None:
+            self.initialize_map(game_state)
+            return
+
+        changes = game_map.structure_changes
+        if self._synced == len(changes):
+            return
+        pending = changes[self._synced:]
+        self._synced = len(changes)
+        if len(pending) > self.REBUILD_THRESHOLD:
+            self.initialize_map(game_state)
+            return
+
+        for location in pending:
+            index = location[0] * ARENA_SIZE + location[1]
+            blocked = game_map.structure_mask[index]
+            if blocked == self._blocked[index]:
+                continue
+            self._blocked[index] = blocked
+            self._pockets = {}
+            self._pocket_fields = {}
+            for seeds, field in self._edge_fields.values():
+                if blocked:
+                    self._raise(field, index)
+                else:
+                    self._lower(field, index, seeds)
 
     def navigate_multiple_endpoints(self, start_point, end_points, game_state):
         """Finds the path a unit would take to reach a set of endpoints
@@ -68,45 +122,182 @@ class ShortestPathFinder:
         if game_state.contains_stationary_unit(start_point):
             return
 
-        #Initialize map 
-        self.initialize_map(game_state)
-        #Fill in walls
-        for location in self.game_state.game_map:
-            if self.game_state.contains_stationary_unit(location):
-                self.game_map[location[0]][location[1]].blocked = True
-        #Do pathfinding
-        ideal_endpoints = self._idealness_search(start_point, end_points)
-        self._validate(ideal_endpoints, end_points)
-        return self._get_path(start_point, end_points)
-
-    def _idealness_search(self, start, end_points):
+        self._sync(game_state)
+        key = tuple(x * ARENA_SIZE + y for x, y in end_points)
+        direction = self._get_direction_from_endpoints(end_points)
+        field = self._get_field(start_point[0] * ARENA_SIZE + start_point[1], key, direction)
+        self._last_field = field
+        return self._get_path(start_point, field, direction)
+
+    def navigate_from_points(self, start_points, end_points, game_state):
+        """Finds the paths units at several starting locations would take to reach the same set of endpoints.
+        The distance field towards end_points is built at most once and shared by every path.
+
+        Args:
+            * start_points: A list of starting locations
+            * end_points: The end points of the units, should be a list of edge locations
+            * game_state: The current game state
+
+        Returns:
+            A list with the path for each location in start_points, or None for locations that are blocked
+
         """
-        Finds the most ideal tile in our 'pocket' of pathable space. 
-        The edge if it is available, or the best self destruct location otherwise
+        self._sync(game_state)
+        key = tuple(x * ARENA_SIZE + y for x, y in end_points)
+        direction = self._get_direction_from_endpoints(end_points)
+        paths = []
+        for start_point in start_points:
+            start = start_point[0] * ARENA_SIZE + start_point[1]
+            if self._blocked[start]:
+                paths.append(None)
+                continue
+            field = self._get_field(start, key, direction)
+            self._last_field = field
+            paths.append(self._get_path(start_point, field, direction))
+        return paths
+
+    def _get_field(self, start, key, direction):
+        """Gets the distance field a unit at start follows. This is the field towards the end points
+        if they are reachable, or towards the most ideal self destruct location of its pocket otherwise.
         """
-        current = queue.Queue()
-        current.put(start)
-        best_idealness = self._get_idealness(start, end_points)
-        self.game_map[start[0]][start[1]].visited_idealness = True
-        most_ideal = start
+        cached = self._edge_fields.get(key)
+        if cached is None:
+            seeds = frozenset(key)
+            cached = (seeds, self._distance_field(index for index in key if not self._blocked[index]))
+            self._edge_fields[key] = cached
+        field = cached[1]
+        if field[start] >= 0:
+            return field
+
+        ideal = self._pockets.get((key, start))
+        if ideal is None:
+            ideal = self._idealness_search(start, key, direction)
+        field = self._pocket_fields.get((key, ideal))
+        if field is None:
+            field = self._distance_field([ideal])
+            self._pocket_fields[(key, ideal)] = field
+        return field
+
+    def _distance_field(self, sources):
+        """Breadth first search of the grid from the given tiles, returning the pathlength of each tile.
+        Blocked and unreachable tiles have a pathlength of -1.
+        """
+        blocked = self._blocked
+        field = [-1] * (ARENA_SIZE * ARENA_SIZE)
+        current = deque()
+        for index in sources:
+            field[index] = 0
+            current.append(index)
+
+        while current:
+            index = current.popleft()
+            pathlength = field[index] + 1
+            for neighbor in _NEIGHBORS[index]:
+                if field[neighbor] < 0 and not blocked[neighbor]:
+                    field[neighbor] = pathlength
+                    current.append(neighbor)
+        return field
+
+    def _raise(self, field, index):
+        """Repairs a distance field after the tile at index became blocked.
+        Only tiles whose every shortest route ran through the tile are recomputed.
+        """
+        distance = field[index]
+        field[index] = -1
+        if distance < 0:
+            return
 
-        while not current.empty():
-            search_location = current.get()
-            for neighbor in self._get_neighbors(search_location):
-                if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
+        blocked = self._blocked
+        affected = {index}
+        orphans = []
+        current = deque([(index, distance)])
+        while current:
+            tile, distance = current.popleft()
+            for neighbor in _NEIGHBORS[tile]:
+                if field[neighbor] != distance + 1 or neighbor in affected:
                     continue
+                supported = False
+                for other in _NEIGHBORS[neighbor]:
+                    if field[other] == distance and other not in affected:
+                        supported = True
+                        break
+                if not supported:
+                    affected.add(neighbor)
+                    orphans.append(neighbor)
+                    current.append((neighbor, distance + 1))
+
+        for tile in orphans:
+            field[tile] = -1
+
+        frontier = []
+        for tile in orphans:
+            best = -1
+            for neighbor in _NEIGHBORS[tile]:
+                if field[neighbor] >= 0 and (best < 0 or field[neighbor] < best):
+                    best = field[neighbor]
+            if best >= 0:
+                frontier.append((best + 1, tile))
+        heapq.heapify(frontier)
+
+        while frontier:
+            distance, tile = heapq.heappop(frontier)
+            if field[tile] >= 0:
+                continue
+            field[tile] = distance
+            for neighbor in _NEIGHBORS[tile]:
+                if field[neighbor] < 0 and neighbor in affected and not blocked[neighbor]:
+                    heapq.heappush(frontier, (distance + 1, neighbor))
 
-                x, y = neighbor
-                current_idealness = self._get_idealness(neighbor, end_points)
+    def _lower(self, field, index, seeds):
+        """Repairs a distance field after the tile at index became unblocked
+        """
+        if index in seeds:
+            field[index] = 0
+        else:
+            best = -1
+            for neighbor in _NEIGHBORS[index]:
+                if field[neighbor] >= 0 and (best < 0 or field[neighbor] < best):
+                    best = field[neighbor]
+            if best < 0:
+                return
+            field[index] = best + 1
+
+        blocked = self._blocked
+        current = deque([index])
+        while current:
+            tile = current.popleft()
+            pathlength = field[tile] + 1
+            for neighbor in _NEIGHBORS[tile]:
+                if not blocked[neighbor] and (field[neighbor] < 0 or field[neighbor] > pathlength):
+                    field[neighbor] = pathlength
+                    current.append(neighbor)
+
+    def _idealness_search(self, start, key, direction):
+        """
+        Finds the most ideal tile in our 'pocket' of pathable space.
+        Only used when the end points can not be reached, so this is the best self destruct location.
+        Every tile of the pocket is remembered so later queries from the same pocket skip the search.
+        """
+        blocked = self._blocked
+        visited = {start}
+        current = deque([start])
+        most_ideal = start
+        best_idealness = self._get_idealness(start, direction)
 
-                if current_idealness > best_idealness:
-                    best_idealness = current_idealness
+        while current:
+            index = current.popleft()
+            for neighbor in _NEIGHBORS[index]:
+                if blocked[neighbor] or neighbor in visited:
+                    continue
+                visited.add(neighbor)
+                current.append(neighbor)
+                idealness = self._get_idealness(neighbor, direction)
+                if idealness > best_idealness:
+                    best_idealness = idealness
                     most_ideal = neighbor
 
-                if not self.game_map[x][y].visited_idealness and not self.game_map[x][y].blocked:
-                    self.game_map[x][y].visited_idealness = True
-                    current.put(neighbor)
-
+        for index in visited:
+            self._pockets[(key, index)] = most_ideal
         return most_ideal
 
     def _get_neighbors(self, location):
@@ -119,7 +310,7 @@ class ShortestPathFinder:
         """Prints a message to the games debug output
 
         Args:
-            * end_points: A set of endpoints, should be an edge 
+            * end_points: A set of endpoints, should be an edge
 
         Returns:
             A direction [x,y] representing the edge. For example, [1,1] for the top right and [-1, 1] for the top left
@@ -128,134 +319,83 @@ class ShortestPathFinder:
         point = end_points[0]
         x, y = point
         direction = [1, 1]
-        if x < self.game_state.HALF_ARENA:
+        if x < HALF_ARENA:
            direction[0] = -1
-        if y < self.game_state.HALF_ARENA:
+        if y < HALF_ARENA:
             direction[1] = -1
         return direction
 
-    def _get_idealness(self, location, end_points):
+    def _get_idealness(self, index, direction):
         """Get the idealness of a tile, the reachable tile the unit most wants to path to.
-        Better self destruct locations are more ideal. The endpoints are perfectly ideal. 
+        Better self destruct locations are more ideal.
         This metric basically trys to find the path of least resistance to end goal.
 
         Returns:
-            A location the unit will attempt to reach
+            The idealness of the tile
         """
-        if location in end_points:
-            return sys.maxsize
-
-        direction = self._get_direction_from_endpoints(end_points)
-        # [x,y], its either going [1,1] top right, [-1,1] top left
-        
+        x, y = divmod(index, ARENA_SIZE)
         idealness = 0
         if direction[1] == 1:
-            idealness += 28 * location[1]
-        else: 
-            idealness += 28 * (27 - location[1])
-            
-        if direction[0] == 1:
-            idealness += location[0]
-        else: 
-            idealness += (27 - location[0])
-
-        return idealness
-
-    def _validate(self, ideal_tile, end_points):
-        """Breadth first search of the grid, setting the pathlengths of each node
-
-        """
-        #VALDIATION
-        #Add our most ideal tiles to current
-        current = queue.Queue()
-        if ideal_tile in end_points:
-            for location in end_points:
-               current.put(location)
-               #Set current pathlength to 0
-               self.game_map[location[0]][location[1]].pathlength = 0
-               self.game_map[location[0]][location[1]].visited_validate = True
+            idealness += 28 * y
         else:
-            current.put(ideal_tile)
-            self.game_map[ideal_tile[0]][ideal_tile[1]].pathlength = 0
-            self.game_map[ideal_tile[0]][ideal_tile[1]].visited_validate = True
-
-        #While current is not empty
-        while not current.empty():
-            current_location = current.get()
-            current_node = self.game_map[current_location[0]][current_location[1]]
-            for neighbor in self._get_neighbors(current_location):
-                if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
-                    continue
+            idealness += 28 * (27 - y)
 
-                neighbor_node = self.game_map[neighbor[0]][neighbor[1]]
-                if not neighbor_node.visited_validate and not current_node.blocked:
-                    neighbor_node.pathlength = current_node.pathlength + 1
-                    neighbor_node.visited_validate = True
-                    current.put(neighbor)
+        if direction[0] == 1:
+            idealness += x
+        else:
+            idealness += (27 - x)
 
-        #debug_write("Print after validate")
-        #self.print_map()
-        return
+        return idealness
 
-    def _get_path(self, start_point, end_points):
+    def _get_path(self, start_point, field, direction):
         """Once all nodes are validated, and a target is found, the unit can path to its target
 
         """
         #GET THE PATH
         path = [start_point]
-        current = start_point
+        current = start_point[0] * ARENA_SIZE + start_point[1]
         move_direction = 0
 
-        while not self.game_map[current[0]][current[1]].pathlength == 0:
-            #debug_write("current tile {} has cost {}".format(current, self.game_map[current[0]][current[1]].pathlength))
-            next_move = self._choose_next_move(current, move_direction, end_points)
-            #debug_write(next_move)
+        while not field[current] == 0:
+            next_move = self._choose_next_move(current, move_direction, field, direction)
 
-            if current[0] == next_move[0]:
+            if current // ARENA_SIZE == next_move // ARENA_SIZE:
                 move_direction = self.VERTICAL
             else:
                 move_direction = self.HORIZONTAL
-            path.append(next_move)
+            path.append(list(divmod(next_move, ARENA_SIZE)))
             current = next_move
-        
-        #debug_write(path)
+
         return path
-  
-    def _choose_next_move(self, current_point, previous_move_direction, end_points):
+
+    def _choose_next_move(self, current_point, previous_move_direction, field, direction):
         """Given the current location and adjacent locations, return the best 'next step' for a given unit to take
         """
-        neighbors = self._get_neighbors(current_point)
-        #debug_write("Unit at {} previously moved {} and has these neighbors {}".format(current_point, previous_move_direction, neighbors))
-
+        blocked = self._blocked
         ideal_neighbor = current_point
-        best_pathlength = self.game_map[current_point[0]][current_point[1]].pathlength
-        for neighbor in neighbors:
-            #debug_write("Comparing champ {} and contender {}".format(ideal_neighbor, neighbor))
-            if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
+        best_pathlength = field[current_point]
+        for neighbor in _NEIGHBORS[current_point]:
+            if blocked[neighbor]:
                 continue
 
-            new_best = False
-            x, y = neighbor
-            current_pathlength = self.game_map[x][y].pathlength
+            current_pathlength = field[neighbor]
 
             #Filter by pathlength
             if current_pathlength > best_pathlength:
                 continue
-            elif current_pathlength < best_pathlength:
-                #debug_write("Contender has better pathlength at {} vs champs {}".format(current_pathlength, best_pathlength))
-                new_best = True
 
             #Filter by direction based on prev move
-            if not new_best and not self._better_direction(current_point, neighbor, ideal_neighbor, previous_move_direction, end_points):
+            if current_pathlength == best_pathlength and not self._better_direction(
+                    divmod(current_point, ARENA_SIZE), divmod(neighbor, ARENA_SIZE), divmod(ideal_neighbor, ARENA_SIZE),
+                    previous_move_direction, direction):
                 continue
 
             ideal_neighbor = neighbor
             best_pathlength = current_pathlength
 
-        #debug_write("Gave unit at {} new tile {}".format(current_point, ideal_neighbor))
         return ideal_neighbor
 
-    def _better_direction(self, prev_tile, new_tile, prev_best, previous_move_direction, end_points):
+    def _better_direction(self, prev_tile, new_tile, prev_best, previous_move_direction, direction):
         """Compare two tiles and return True if the unit would rather move to the new one
 
         """
@@ -264,26 +404,24 @@ class ShortestPathFinder:
         if previous_move_direction == self.HORIZONTAL and not new_tile[0] == prev_best[0]:
             #We want to go up now. If we have not changed our y, we are not going up
             if prev_tile[1] == new_tile[1]:
-                return False 
+                return False
             return True
         if previous_move_direction == self.VERTICAL and not new_tile[1] == prev_best[1]:
             if prev_tile[0] == new_tile[0]:
-                #debug_write("contender {} has the same x coord as prev tile {} so we will keep best move {}".format(new_tile, prev_tile, prev_best))
                 return False
             return True
-        if previous_move_direction == 0: 
-            if prev_tile[1] == new_tile[1]: 
+        if previous_move_direction == 0:
+            if prev_tile[1] == new_tile[1]:
                 return False
             return True
-        
-        #To make it here, both moves are on the same axis 
-        direction = self._get_direction_from_endpoints(end_points)
+
+        #To make it here, both moves are on the same axis
         if new_tile[1] == prev_best[1]: #If they both moved horizontal...
             if direction[0] == 1 and new_tile[0] > prev_best[0]: #If we moved right and right is our direction, we moved towards our direction
-                return True 
+                return True
             if direction[0] == -1 and new_tile[0] < prev_best[0]: #If we moved left and left is our direction, we moved towards our direction
-                return True 
-            return False 
+                return True
+            return False
         if new_tile[0] == prev_best[0]: #If they both moved vertical...
             if direction[1] == 1 and new_tile[1] > prev_best[1]: #If we moved up and up is our direction, we moved towards our direction
                 return True
@@ -293,27 +431,27 @@ class ShortestPathFinder:
         return True
 
     def print_map(self):
-        """Prints an ASCII version of the current game map for debug purposes
+        """Prints an ASCII version of the most recently used distance field for debug purposes
 
         """
-        if not self.initialized:
-            debug_write("Attempted to print_map before pathfinder initialization. Use 'this_object.initialize_map(game_state)' to initialize the map first")
+        if not self.initialized or self._last_field is None:
+            debug_write("Attempted to print_map before pathfinder initialization. Use 'this_object.navigate_multiple_endpoints(...)' to compute a path first")
             return
 
         for y in range(28):
+            row = []
             for x in range(28):
-                node = self.game_map[x][28 - y - 1]
-                if not node.blocked and not node.pathlength == -1:
-                    self._print_justified(node.pathlength)
+                index = x * ARENA_SIZE + (28 - y - 1)
+                if not self._blocked[index] and not self._last_field[index] == -1:
+                    row.append(self._justified(self._last_field[index]))
                 else:
-                    sys.stderr.write("   ")
-            debug_write("")
+                    row.append("   ")
+            log.info("".join(row))
 
-    def _print_justified(self, number):
-        """Prints a number between 100 and -10 in 3 spaces
+    def _justified(self, number):
+        """Formats a number between 100 and -10 in 3 spaces
 
         """
         if number < 10 and number > -1:
-            sys.stderr.write(" ")
-        sys.stderr.write(str(number))
-        sys.stderr.write(" ")
+            return " {} ".format(number)
+        return "{} ".format(number)
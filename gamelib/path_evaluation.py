@@ -0,0 +1,105 @@
+import math
+
+from .profiling import profiler
+from .unit import GameUnit
+
+
+class PathOutcome:
+    """The expected result of sending a group of mobile units down a path
+
+    Attributes :
+        * path (list): The evaluated path, None if there was no path
+        * survivors (int): The number of units expected to reach the end of the path
+        * damage_taken (float): The total damage the group is expected to take
+        * structure_damage (float): The damage the group is expected to deal to enemy structures
+        * breaches (int): The number of units expected to score on the enemy edge
+
+    """
+    __slots__ = ("path", "survivors", "damage_taken", "structure_damage", "breaches")
+
+    def __init__(self, path, survivors=0, damage_taken=0, structure_damage=0, breaches=0):
+        self.path = path
+        self.survivors = survivors
+        self.damage_taken = damage_taken
+        self.structure_damage = structure_damage
+        self.breaches = breaches
+
+    def __repr__(self):
+        return "PathOutcome(survivors: {}, breaches: {}, structure_damage: {}, damage_taken: {})".format(
+            self.survivors, self.breaches, self.structure_damage, self.damage_taken)
+
+
+@profiler.timed("evaluate_paths")
+def evaluate_paths(game_state, paths, unit_type, num, player_index=0):
+    """Estimates what happens to a group of identical mobile units on each of several paths
+
+    The group spends 1 / speed frames on every location of a path. Each frame it takes the damage
+    of the enemy turrets covering the location (from game_state.threat_map). Turrets focus on one unit at a
+    time, so the damage depletes the group's pooled health and units die one after another.
+    While enemy structures are in range, every surviving unit damages them. The damage dealt on a path is
+    capped by the total health of the enemy structures within range of it.
+    Units still alive at the end of a path breach if the path ends on the edge they are heading to.
+
+    Per location lookups are shared between paths, so scoring many overlapping paths is cheap.
+
+    Args:
+        game_state: The current GameState
+        paths: A list of paths, as returned by find_path_to_edge or find_paths_from_edges. None entries are allowed.
+        unit_type: The type of mobile unit sent down the paths
+        num: The number of units in the group
+        player_index: The index corresponding to the player sending the units, 0 for you 1 for the enemy
+
+    Returns:
+        A list with a PathOutcome for each path
+
+    """
+    game_map = game_state.game_map
+    size = game_map.ARENA_SIZE
+    unit = GameUnit(unit_type, game_state.config, player_index, rules=game_state.rules)
+    walker_threat, _ = game_state.threat_map.get_damage_layers(1 - player_index)
+    frames_per_tile = 1 / unit.speed if unit.speed > 0 else 1
+    edges = game_map.get_edges()
+
+    # location index -> enemy structures the group can hit from there
+    targets_cache = {}
+
+    outcomes = []
+    for path in paths:
+        if not path:
+            outcomes.append(PathOutcome(path))
+            continue
+
+        pool = num * unit.max_health
+        alive = num
+        damage_taken = 0
+        structure_damage = 0
+        structures_hit = {}
+        for x, y in path:
+            index = x * size + y
+            if unit.damage_f > 0:
+                targets = targets_cache.get(index)
+                if targets is None:
+                    targets = []
+                    for _, units in game_map.get_units_in_range([x, y], unit.attackRange):
+                        for other in units:
+                            if other.stationary and other.player_index != player_index:
+                                targets.append(other)
+                    targets_cache[index] = targets
+                if targets:
+                    structure_damage += alive * unit.damage_f * frames_per_tile
+                    for target in targets:
+                        structures_hit[id(target)] = target.health
+
+            damage = walker_threat[index] * frames_per_tile
+            damage_taken += min(damage, pool)
+            pool -= damage
+            alive = max(0, math.ceil(pool / unit.max_health)) if unit.max_health > 0 else 0
+            if alive == 0:
+                break
+
+        structure_damage = min(structure_damage, sum(structures_hit.values()))
+        breaches = 0
+        if alive > 0 and path[-1] in edges[game_state.get_target_edge(path[0])]:
+            breaches = alive
+        outcomes.append(PathOutcome(path, alive, damage_taken, structure_damage, breaches))
+    return outcomes
@@ -0,0 +1,154 @@
+import contextlib
+import functools
+import json
+import sys
+import time
+
+# Handed out by phase() while profiling is off, so a disabled phase costs one attribute check
+_DISABLED = contextlib.nullcontext()
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Profiler:
+    """Times the phases of each turn and writes one JSON record per turn.
+
+    Wrap a block in `with profiler.phase(name):` or a function with `@profiler.timed(name)`.
+    While the profiler is disabled both do almost nothing, so they can stay in the code.
+    AlgoCore calls start_turn() and end_turn() around on_turn, end_turn() writes a line like
+    {"turn": 5, "ms": 41.2, "phases": {"tower_defense_loop": {"ms": 38.0, "calls": 1}, ...}}
+    Phases are timed inclusively, a phase inside another counts towards both.
+
+    gamelib's own hot paths (GameState parsing, pathing, targeting, simulation and search) are timed with the
+    shared gamelib.profiler instance.
+
+    Attributes :
+        * enabled (bool): Whether phases are being timed
+        * records (list): The records written so far, kept when keep_records is set
+
+    """
+    def __init__(self):
+        self.enabled = False
+        self.records = []
+        self.keep_records = False
+        self._output = None
+        self._phases = {}
+        self._turn = None
+        self._turn_start = None
+
+    def enable(self, output="stderr", keep_records=False):
+        """Starts timing phases
+
+        Args:
+            output: Where records are written, "stderr", a file path they are appended to, an open stream, or None to not write them
+            keep_records: Whether to also keep the records in self.records
+
+        """
+        if isinstance(output, str) and output != "stderr":
+            output = open(output, "a")
+        self._output = output
+        self.keep_records = keep_records
+        self.enabled = True
+
+    def disable(self):
+        """Stops timing phases
+        """
+        self.enabled = False
+        if self._output not in (None, "stderr"):
+            self._output.flush()
+
+    def phase(self, name):
+        """Gets a context manager timing a block as a phase
+
+        Args:
+            name: The phase name
+
+        """
+        if not self.enabled:
+            return _DISABLED
+        return _Phase(self, name)
+
+    def timed(self, name=None):
+        """Gets a decorator timing every call of a function as a phase
+
+        Args:
+            name: The phase name, defaults to the function's qualified name
+
+        """
+        def decorate(function):
+            phase_name = name or function.__qualname__
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.add(phase_name, time.perf_counter() - start)
+            return wrapper
+        return decorate
+
+    def add(self, name, seconds):
+        """Adds a timed call to a phase
+        """
+        phase = self._phases.get(name)
+        if phase is None:
+            self._phases[name] = [seconds, 1]
+        else:
+            phase[0] += seconds
+            phase[1] += 1
+
+    def start_turn(self, turn_number):
+        """Starts collecting a turn's record
+
+        Args:
+            turn_number: The turn number
+
+        """
+        if not self.enabled:
+            return
+        self._phases = {}
+        self._turn = turn_number
+        self._turn_start = time.perf_counter()
+
+    def end_turn(self):
+        """Writes the record of the turn
+
+        Returns:
+            The record, None if the profiler is disabled
+
+        """
+        if not self.enabled or self._turn_start is None:
+            return None
+        record = {
+            "turn": self._turn,
+            "ms": round((time.perf_counter() - self._turn_start) * 1000, 3),
+            "phases": {name: {"ms": round(seconds * 1000, 3), "calls": calls} for name, (seconds, calls) in self._phases.items()}}
+        self._turn_start = None
+        if self.keep_records:
+            self.records.append(record)
+        if self._output is not None:
+            stream = sys.stderr if self._output == "stderr" else self._output
+            stream.write(json.dumps(record) + "\n")
+            stream.flush()
+        return record
+
+
+# The profiler gamelib and AlgoCore report to
+profiler = Profiler()
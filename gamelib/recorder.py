@@ -0,0 +1,172 @@
+import gzip
+import os
+import queue
+import struct
+import threading
+import time
+
+from .debug_log import log
+from .util import GameMessage
+
+# Record kinds, stored in the index
+CONFIG = 0
+TURN = 1
+ACTION_FRAME = 2
+END = 3
+OTHER = 4
+
+# Every record in a .rec file is a 4 byte big endian length followed by that many bytes of gzip compressed message
+RECORD_HEADER = struct.Struct(">I")
+# Every entry in the matching .idx file: record offset, record length, kind, turn number, action frame number,
+# seconds since the recording started. Turn and frame are -1 when the message has none.
+INDEX_ENTRY = struct.Struct(">QIBiid")
+
+
+def _classify(message):
+    """Gets the kind, turn number and frame number of a message without decoding it
+    """
+    turn_info = message.turn_info
+    if turn_info is None:
+        return (CONFIG if "replaySave" in message else OTHER), -1, -1
+    kind = {0: TURN, 1: ACTION_FRAME, 2: END}.get(turn_info[0], OTHER)
+    turn = turn_info[1] if len(turn_info) > 1 else -1
+    frame = turn_info[2] if len(turn_info) > 2 else -1
+    return kind, turn, frame
+
+
+class Recorder:
+    """Streams every message the algo receives to disk, for replaying and tuning later.
+
+    Set an instance as AlgoCore.recorder before start() is called (in the algo's __init__) to record a game.
+    record() only puts the message on a bounded queue, a background thread compresses and writes it, so recording
+    never delays a turn. When the queue is full the message is dropped and counted rather than waiting.
+
+    A game is written to a .rec file of length prefixed, gzip compressed records, and a .idx file with an INDEX_ENTRY
+    per record. Read them back with read_records().
+
+    Attributes :
+        * path (string): The path of the .rec file, the index is the same path with .idx
+        * recorded (int): The number of messages written
+        * dropped (int): The number of messages dropped because the queue was full
+
+    """
+    def __init__(self, directory, max_queue=4096, compression_level=6):
+        """
+        Args:
+            * directory (string): The directory to write the recording in, created if needed
+            * max_queue (int): The number of messages that may wait to be written
+            * compression_level (int): The gzip compression level, 1 (fast) to 9 (small)
+
+        """
+        os.makedirs(directory, exist_ok=True)
+        name = "game-{}-{}".format(time.strftime("%Y%m%d-%H%M%S"), os.getpid())
+        self.path = os.path.join(directory, name + ".rec")
+        copy = 0
+        while os.path.exists(self.path):
+            copy += 1
+            self.path = os.path.join(directory, "{}-{}.rec".format(name, copy))
+        self.recorded = 0
+        self.dropped = 0
+        self._compression_level = compression_level
+        self._queue = queue.Queue(max_queue)
+        self._started = time.monotonic()
+        self._records = open(self.path, "wb")
+        self._index = open(self.path[:-len(".rec")] + ".idx", "wb")
+        self._thread = threading.Thread(target=self._write_loop, name="recorder", daemon=True)
+        self._thread.start()
+
+    def record(self, message, arrived=None):
+        """Queues a message to be written
+
+        Args:
+            message: The message as received from the game engine
+            arrived: The time.monotonic() timestamp it arrived at, defaults to now
+
+        """
+        if arrived is None:
+            arrived = time.monotonic()
+        try:
+            self._queue.put_nowait((message, arrived))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=5):
+        """Writes the queued messages and closes the files
+
+        Args:
+            timeout: The seconds to wait for the queue to be written
+
+        """
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put((None, None), timeout=timeout)
+        except queue.Full:
+            log.warning("Recorder queue did not drain, closing anyway")
+            return
+        self._thread.join(timeout)
+        if self.dropped:
+            log.warning("Recorder dropped {} messages", self.dropped)
+
+    def _write_loop(self):
+        offset = 0
+        try:
+            while True:
+                message, arrived = self._queue.get()
+                if message is None:
+                    break
+                if not isinstance(message, GameMessage):
+                    message = GameMessage(message)
+                kind, turn, frame = _classify(message)
+                data = gzip.compress(message.encode("utf-8"), self._compression_level)
+                self._records.write(RECORD_HEADER.pack(len(data)))
+                self._records.write(data)
+                self._index.write(INDEX_ENTRY.pack(offset, len(data), kind, turn, frame, arrived - self._started))
+                offset += RECORD_HEADER.size + len(data)
+                self.recorded += 1
+                if self._queue.empty():
+                    self._records.flush()
+                    self._index.flush()
+        except (OSError, ValueError) as error:
+            log.warning("Recorder stopped: {}", error)
+        finally:
+            self._records.close()
+            self._index.close()
+
+
+def read_index(path):
+    """Reads the index of a recording
+
+    Args:
+        path: The path of the .rec file
+
+    Returns:
+        A list of (offset, length, kind, turn, frame, seconds) tuples, one per record
+
+    """
+    with open(path[:-len(".rec")] + ".idx", "rb") as index:
+        data = index.read()
+    usable = len(data) - len(data) % INDEX_ENTRY.size
+    return list(INDEX_ENTRY.iter_unpack(data[:usable]))
+
+
+def read_records(path):
+    """Reads the messages of a recording in order. A record cut short, by a crash while writing, ends the recording.
+
+    Args:
+        path: The path of the .rec file
+
+    Returns:
+        A generator of GameMessages
+
+    """
+    with open(path, "rb") as records:
+        while True:
+            header = records.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            length, = RECORD_HEADER.unpack(header)
+            data = records.read(length)
+            if len(data) < length:
+                return
+            yield GameMessage(gzip.decompress(data).decode("utf-8"))
@@ -0,0 +1,112 @@
+import contextlib
+import json
+import os
+import random
+import sys
+import time
+from collections import namedtuple
+
+from .recorder import read_records
+from .util import GameMessage, set_command_sink
+
+TurnRecord = namedtuple("TurnRecord", ["turn_number", "build", "deploy", "seconds"])
+TurnRecord.__doc__ = "The build and deploy stacks an algo submitted for a turn, and the seconds on_turn took"
+
+
+class ReplayResult:
+    """What an algo did during a replayed game
+
+    Attributes :
+        * turns (list): A TurnRecord for each turn, in order
+        * frames (int): The number of action frames fed to the algo
+        * seconds (float): The seconds the whole replay took
+
+    """
+    def __init__(self):
+        self.turns = []
+        self.frames = 0
+        self.seconds = 0
+
+    def latency(self):
+        """Gets on_turn latency statistics
+
+        Returns:
+            A dict with the count, mean, p50, p95, p99 and max seconds on_turn took
+
+        """
+        seconds = sorted(turn.seconds for turn in self.turns)
+        if not seconds:
+            return {"count": 0}
+
+        def percentile(fraction):
+            return seconds[min(len(seconds) - 1, int(fraction * len(seconds)))]
+        return {"count": len(seconds), "mean": sum(seconds) / len(seconds), "p50": percentile(0.5),
+                "p95": percentile(0.95), "p99": percentile(0.99), "max": seconds[-1]}
+
+    def differences(self, other):
+        """Finds the turns where two replays of the same game submitted different stacks
+
+        Args:
+            other: Another ReplayResult, for instance from before a change to the strategy
+
+        Returns:
+            A list of the turn numbers that differ, turns only one of the replays reached included
+
+        """
+        differ = []
+        for index in range(max(len(self.turns), len(other.turns))):
+            if index >= len(self.turns) or index >= len(other.turns):
+                turn = self.turns[index] if index < len(self.turns) else other.turns[index]
+                differ.append(turn.turn_number)
+            elif self.turns[index][:3] != other.turns[index][:3]:
+                differ.append(self.turns[index].turn_number)
+        return differ
+
+
+def replay(algo, messages, seed=None, quiet=True):
+    """Feeds recorded messages to an algo in process, as start() would, and captures what it submits
+
+    Nothing is read from standard input or written to standard output.
+
+    Args:
+        algo: A new AlgoCore instance, like AlgoStrategy()
+        messages: A path to a .rec file or a list of messages (config, turns, action frames, end)
+        seed: When given, random is seeded with it before the first message so replays are repeatable
+        quiet: Whether to discard the algo's debug output
+
+    Returns:
+        A ReplayResult
+
+    """
+    if isinstance(messages, str):
+        messages = read_records(messages)
+    if seed is not None:
+        random.seed(seed)
+
+    result = ReplayResult()
+    commands = []
+    previous = set_command_sink(commands.append)
+    started = time.perf_counter()
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stderr(devnull if quiet else sys.stderr):
+            for message in messages:
+                message = GameMessage(message)
+                turn_info = message.turn_info
+                if turn_info is None or turn_info[0] != 0:
+                    if turn_info is not None and turn_info[0] == 1:
+                        result.frames += 1
+                    if not algo.handle_message(message):
+                        break
+                    continue
+
+                del commands[:]
+                turn_started = time.perf_counter()
+                algo.handle_message(message)
+                seconds = time.perf_counter() - turn_started
+                stacks = [json.loads(command) for command in commands[:2]]
+                stacks += [None] * (2 - len(stacks))
+                result.turns.append(TurnRecord(turn_info[1], stacks[0], stacks[1], seconds))
+    finally:
+        set_command_sink(previous)
+    result.seconds = time.perf_counter() - started
+    return result
@@ -0,0 +1,110 @@
+from collections import namedtuple
+
+UnitStats = namedtuple("UnitStats", ["stationary", "speed", "damage_f", "damage_i", "attackRange", "shieldRange", "max_health", "shieldPerUnit", "cost"])
+UnitStats.__doc__ = "The stats of a unit type, one record for the base unit and one for the upgraded unit, shared by every unit of the type"
+
+# id(config) -> (config, Rules), the config is kept so its id can not be reused while the entry exists
+_compiled = {}
+
+
+class Rules:
+    """The unit rules of a game config, compiled once and then shared.
+
+    AlgoCore compiles them as self.rules when the config arrives. GameState, GameMap and GameUnit take them
+    instead of reading config["unitInformation"], and nothing is kept in module globals, so any number of
+    states, from any number of configs, can be used side by side in one process.
+
+    Attributes :
+        * config (JSON): The config the rules were compiled from
+        * WALL, FACTORY, TURRET, SCOUT, DEMOLISHER, INTERCEPTOR, REMOVE, UPGRADE (str): The unit type shorthands
+        * unit_types (list): The shorthand of each unit type, in config order
+        * UNIT_TYPE_TO_INDEX (dict): Maps a unit type to its index in config order
+        * ALL_UNITS (list): The unit types that can be spawned
+        * STRUCTURE_TYPES (frozenset): The structure unit types
+        * costs (dict): unit type -> its (SP, MP) cost
+        * upgrade_costs (dict): unit type -> the (SP, MP) cost of upgrading it
+        * upgradable (frozenset): The unit types that can be upgraded
+        * unit_stats (dict): unit type -> (base UnitStats, upgraded UnitStats)
+        * hit_radius (float): The get hit radius of units
+        * attack_ranges (frozenset): Every attack range a unit can have, upgrades included
+        * max_attack_range (float): The largest of them
+
+    """
+    def __init__(self, config):
+        self.config = config
+        unit_information = config["unitInformation"]
+        self.unit_types = [unit_info.get("shorthand") for unit_info in unit_information]
+        if len(self.unit_types) < 8:
+            raise ValueError("The config defines {} unit types, it needs at least 8: wall, factory, turret, scout, demolisher, interceptor, remove and upgrade, in that order".format(len(self.unit_types)))
+        self.UNIT_TYPE_TO_INDEX = {unit_type: index for index, unit_type in enumerate(self.unit_types)}
+        (self.WALL, self.FACTORY, self.TURRET, self.SCOUT, self.DEMOLISHER, self.INTERCEPTOR,
+         self.REMOVE, self.UPGRADE) = self.unit_types[:8]
+        self.ALL_UNITS = [self.SCOUT, self.DEMOLISHER, self.INTERCEPTOR, self.WALL, self.FACTORY, self.TURRET]
+        self.STRUCTURE_TYPES = frozenset(unit_info.get("shorthand") for unit_info in unit_information if unit_info.get("unitCategory") == 0)
+
+        self.costs = {}
+        self.upgrade_costs = {}
+        self.unit_stats = {}
+        upgradable = []
+        ranges = set()
+        for unit_info in unit_information:
+            unit_type = unit_info.get("shorthand")
+            upgrade = unit_info.get("upgrade", {})
+            cost = (unit_info.get("cost1", 0), unit_info.get("cost2", 0))
+            self.costs[unit_type] = cost
+            self.upgrade_costs[unit_type] = (upgrade.get("cost1", cost[0]), upgrade.get("cost2", cost[1]))
+            if "upgrade" in unit_info:
+                upgradable.append(unit_type)
+            ranges.add(unit_info.get("attackRange", 0))
+            ranges.add(upgrade.get("attackRange", unit_info.get("attackRange", 0)))
+            if "unitCategory" in unit_info:
+                self.unit_stats[unit_type] = self.__compile_stats(unit_info)
+        self.upgradable = frozenset(upgradable)
+        self.hit_radius = unit_information[0].get("getHitRadius", 0)
+        self.attack_ranges = frozenset(ranges)
+        self.max_attack_range = max(ranges)
+
+    @staticmethod
+    def __compile_stats(unit_info):
+        base = UnitStats(
+            unit_info["unitCategory"] == 0,
+            unit_info.get("speed", 0),
+            unit_info.get("attackDamageTower", 0),
+            unit_info.get("attackDamageWalker", 0),
+            unit_info.get("attackRange", 0),
+            unit_info.get("shieldRange", 0),
+            unit_info.get("startHealth", 0),
+            unit_info.get("shieldPerUnit", 0),
+            (unit_info.get("cost1", 0), unit_info.get("cost2", 0)))
+        upgrade = unit_info.get("upgrade", {})
+        upgraded = UnitStats(
+            base.stationary,
+            upgrade.get("speed", base.speed),
+            upgrade.get("attackDamageTower", base.damage_f),
+            upgrade.get("attackDamageWalker", base.damage_i),
+            upgrade.get("attackRange", base.attackRange),
+            upgrade.get("shieldRange", base.shieldRange),
+            upgrade.get("startHealth", base.max_health),
+            upgrade.get("shieldPerUnit", base.shieldPerUnit),
+            (upgrade.get("cost1", 0) + base.cost[0], upgrade.get("cost2", 0) + base.cost[1]))
+        return base, upgraded
+
+
+def compile_rules(config):
+    """Gets the Rules of a config, they are only compiled the first time a config is seen
+
+    Args:
+        config: The game config
+
+    Returns:
+        The Rules
+
+    """
+    entry = _compiled.get(id(config))
+    if entry is not None and entry[0] is config:
+        return entry[1]
+    rules = Rules(config)
+    if len(_compiled) >= 8:
+        _compiled.clear()
+    _compiled[id(config)] = (config, rules)
+    return rules
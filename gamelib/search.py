@@ -0,0 +1,247 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from .debug_log import log
+from .game_state import GameState
+from .profiling import profiler
+from .simulator import Simulator
+
+# The config each worker process received when it started
+_WORKER_CONFIG = None
+
+
+def plan_requests(plan, rules):
+    """Turns the actions of a turn plan into GameState.attempt_batch() requests
+
+    Args:
+        plan: A list of actions, see apply_plan()
+        rules: The Rules of the game, for the UPGRADE and REMOVE shorthands
+
+    Returns:
+        A list of (unit_type, location, count) requests, a spawn at several locations gives one request per location
+
+    """
+    requests = []
+    for action in plan:
+        if action[0] == "spawn":
+            locations = action[2]
+            if len(locations) > 0 and type(locations[0]) == int:
+                locations = [locations]
+            requests.extend((action[1], location, action[3]) for location in locations)
+        elif action[0] == "upgrade":
+            requests.append((rules.UPGRADE, action[1], 1))
+        elif action[0] == "remove":
+            requests.append((rules.REMOVE, action[1], 1))
+    return requests
+
+
+def apply_plan(game_state, plan):
+    """Queues the actions of a turn plan on a game state, in one GameState.attempt_batch() call
+
+    A plan is a list of picklable actions:
+        * ("spawn", unit_type, location, num), location can also be a list of locations
+        * ("upgrade", location)
+        * ("remove", location)
+
+    Args:
+        game_state: The GameState to queue the actions on
+        plan: A list of actions
+
+    Returns:
+        The number of units spawned, upgraded or flagged for removal
+
+    """
+    return sum(game_state.attempt_batch(plan_requests(plan, game_state.rules)))
+
+
+def score_result(result, player_index=0):
+    """The default score of a simulated action phase, higher is better for player_index
+
+    Health changes dominate, structure damage breaks ties between plans that score the same number of breaches.
+
+    Args:
+        result: A SimulationResult
+        player_index: The index corresponding to the player the score is for, 0 for you 1 for the enemy
+
+    Returns:
+        The score as a float
+
+    """
+    enemy_index = 1 - player_index
+    health = result.health_lost[enemy_index] - result.health_lost[player_index]
+    structures = result.structure_damage[player_index] - result.structure_damage[enemy_index]
+    return health + structures / 1000
+
+
+def _init_worker(config):
+    global _WORKER_CONFIG
+    _WORKER_CONFIG = config
+
+
+def _ping():
+    return os.getpid()
+
+
+def _score_plan(serialized_string, prefix, plan, enemy_scenarios, scorer, deadline, config=None):
+    """Rebuilds the turn, queues the actions already taken and the plan, then simulates it against every enemy scenario.
+    Returns the worst score, or None if the deadline passed first, so a task the search gave up on frees its
+    worker after at most one simulation instead of running into the next turn.
+    """
+    if time.monotonic() >= deadline:
+        return None
+    game_state = GameState(config or _WORKER_CONFIG, serialized_string)
+    game_state.suppress_warnings(True)
+    build_stack, deploy_stack = prefix
+    # the stacks use the UPGRADE and REMOVE shorthands too, so they replay as one batch
+    game_state.attempt_batch([(unit_type, [x, y], 1) for unit_type, x, y in list(build_stack) + list(deploy_stack)])
+    apply_plan(game_state, plan)
+
+    simulator = Simulator(game_state)
+    worst = None
+    for enemy_deploys in enemy_scenarios:
+        if time.monotonic() >= deadline:
+            return None
+        score = (scorer or score_result)(simulator.simulate(enemy_deploys))
+        if worst is None or score < worst:
+            worst = score
+    return worst
+
+
+class TurnSearch:
+    """Scores candidate turn plans in a pool of worker processes and picks the best one.
+
+    Workers are started once, when the TurnSearch is created, and keep the parsed config. Create it in on_game_start so
+    the start up cost is not paid during a turn. They are started with forkserver where the platform has it and spawn
+    otherwise, never by forking the algo, which may already run threads (the Recorder's writer) whose locks a fork
+    could copy in a held state. Each plan is applied on top of the actions already queued on the game state,
+    simulated with Simulator, and scored. Tasks stop at the search deadline, so plans left over when time runs out
+    do not keep the workers busy into the next turn. If the pool can not be used (a worker died), plans are scored
+    in the algo's own process instead.
+
+    Attributes :
+        * config (JSON): The game config the workers were started with
+        * workers (int): The number of worker processes, 0 when plans are scored in process
+        * budget (:obj: TurnBudget): The budget of the algo's turns, get_deadline() hands out a share of its remaining time
+
+    """
+    def __init__(self, config, workers=None, budget=None):
+        self.config = config
+        self.budget = budget
+        self.workers = workers if workers is not None else max(1, (os.cpu_count() or 1) - 1)
+        self._executor = None
+        if self.workers > 0:
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            try:
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context(start_method),
+                                                     initializer=_init_worker, initargs=(config,))
+                # Start every worker now rather than during the first search
+                for future in [self._executor.submit(_ping) for _ in range(self.workers)]:
+                    future.result()
+            except (OSError, BrokenProcessPool) as error:
+                log.warning("Could not start the search workers, scoring in process: {}", error)
+                self._executor = None
+        if self._executor is None:
+            self.workers = 0
+
+    def get_deadline(self, fraction=0.5, budget=None):
+        """Gets a time.monotonic() deadline for a search started now
+
+        The search gets a fraction of the time the turn budget has left, which counts from when this turn's game
+        state arrived.
+
+        Args:
+            fraction: The share of the time left to spend searching
+            budget: The TurnBudget of the current turn, defaults to the budget the TurnSearch was created with
+
+        Returns:
+            A time.monotonic() timestamp
+
+        """
+        budget = budget if budget is not None else self.budget
+        if budget is None:
+            raise ValueError("TurnSearch needs a TurnBudget to get a deadline, create it with one or pass a deadline to search")
+        return time.monotonic() + max(0, budget.remaining()) * fraction
+
+    @profiler.timed("TurnSearch.search")
+    def search(self, game_state, plans, deadline=None, enemy_scenarios=None, scorer=None):
+        """Scores the plans and returns the best one
+
+        Plans that were not scored before the deadline, or whose scoring raised, are dropped. Ties go to the plan
+        listed first.
+
+        Args:
+            game_state: The current GameState, with the actions already taken this turn queued
+            plans: A list of plans, see apply_plan
+            deadline: A time.monotonic() timestamp, defaults to get_deadline()
+            enemy_scenarios: A list of enemy deployments, each a list of [unit_type, location, num] entries as taken by
+                Simulator.simulate. A plan scores its worst result over the scenarios. Defaults to no enemy deployment.
+            scorer: A module level function taking a SimulationResult and returning a score, defaults to score_result
+
+        Returns:
+            [best_plan, best_score, scores], best_plan is None if no plan was scored. scores holds the score of each plan,
+            None for plans that were not scored
+
+        """
+        if deadline is None:
+            deadline = self.get_deadline()
+        enemy_scenarios = enemy_scenarios or [None]
+        prefix = (list(game_state._build_stack), list(game_state._deploy_stack))
+        scores = [None] * len(plans)
+        # A GameMessage would carry its decoded copy to every worker, the plain string is cheaper to send
+        serialized_string = game_state.serialized_string
+        if isinstance(serialized_string, str):
+            serialized_string = str(serialized_string)
+
+        if self._executor is not None:
+            try:
+                futures = {}
+                for index, plan in enumerate(plans):
+                    future = self._executor.submit(_score_plan, serialized_string, prefix, plan, enemy_scenarios, scorer, deadline)
+                    futures[future] = index
+                pending = set(futures)
+                while pending and time.monotonic() < deadline:
+                    done, pending = wait(pending, timeout=deadline - time.monotonic(), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        try:
+                            scores[futures[future]] = future.result()
+                        except BrokenProcessPool:
+                            raise
+                        except Exception as error:
+                            log.warning("Could not score plan {}, skipping it: {!r}", futures[future], error)
+                for future in pending:
+                    future.cancel()
+            except BrokenProcessPool as error:
+                log.warning("Search workers died, scoring in process: {}", error)
+                self._executor = None
+                self.workers = 0
+
+        if self._executor is None:
+            for index, plan in enumerate(plans):
+                if time.monotonic() >= deadline:
+                    break
+                if scores[index] is None:
+                    try:
+                        scores[index] = _score_plan(serialized_string, prefix, plan, enemy_scenarios, scorer, deadline, self.config)
+                    except Exception as error:
+                        log.warning("Could not score plan {}, skipping it: {!r}", index, error)
+
+        best_plan, best_score = None, None
+        for plan, score in zip(plans, scores):
+            if score is not None and (best_score is None or score > best_score):
+                best_plan, best_score = plan, score
+        return [best_plan, best_score, scores]
+
+    def shutdown(self):
+        """Stops the worker processes
+        """
+        if self._executor is not None:
+            try:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+            except TypeError:
+                # cancel_futures is new in Python 3.9, queued tasks return at their deadline anyway
+                self._executor.shutdown(wait=True)
+            self._executor = None
+            self.workers = 0
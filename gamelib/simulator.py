@@ -0,0 +1,328 @@
+import copy
+import math
+
+from .game_map import GameMap
+from .navigation import ShortestPathFinder
+from .profiling import profiler
+from .threat_map import ThreatMap
+from .unit import GameUnit
+
+
+class SimulationResult:
+    """The outcome of a simulated action phase
+
+    Attributes :
+        * frames (int): The number of frames the action phase lasted
+        * breaches (list): A [location, unit_type, player_index] entry for every unit that scored, player_index is the scoring player
+        * destroyed (list): A [location, unit_type, player_index] entry for every structure destroyed, player_index is its owner
+        * health_lost ([float, float]): The health each player lost to breaches
+        * structure_damage ([float, float]): The damage each player dealt to enemy structures
+        * resources_gained ([[float, float], [float, float]]): The [SP, MP] each player gained from breaching
+
+    """
+    def __init__(self):
+        self.frames = 0
+        self.breaches = []
+        self.destroyed = []
+        self.health_lost = [0, 0]
+        self.structure_damage = [0, 0]
+        self.resources_gained = [[0, 0], [0, 0]]
+
+    def __repr__(self):
+        return "SimulationResult(frames: {}, breaches: {}, destroyed: {}, health_lost: {}, structure_damage: {})".format(
+            self.frames, len(self.breaches), len(self.destroyed), self.health_lost, self.structure_damage)
+
+
+class _Walker:
+    """A mobile unit taking part in a simulation
+    """
+    __slots__ = ("unit", "player_index", "x", "y", "health", "edge", "path", "step", "frames_per_move", "move_timer", "moves")
+
+    def __init__(self, unit, x, y, health):
+        self.unit = unit
+        self.player_index = unit.player_index
+        self.x = x
+        self.y = y
+        self.health = health
+        self.edge = None
+        self.path = None
+        self.step = 0
+        self.frames_per_move = max(1, int(round(1 / unit.speed))) if unit.speed > 0 else 1
+        self.move_timer = self.frames_per_move
+        self.moves = 0
+
+
+class Simulator:
+    """Runs the action phase that follows the current turn locally, without the game engine.
+
+    The simulation starts from a GameState after your attempt_spawn/attempt_upgrade calls: every structure on its map
+    takes part, and every mobile unit on its map (your spawned units) is deployed on the first frame.
+    The opponent's deployments are unknown, pass them to simulate() to include them.
+    The GameState is never modified.
+
+    Each frame mirrors the engine's order:
+        1. Mobile units that are due move one step along their path (pathing follows ShortestPathFinder).
+           Units reaching their target edge score. Units stuck at the end of their path self destruct,
+           damaging nearby enemies if they moved at least selfDestructStepsRequired tiles.
+        2. Every unit attacks the target GameState.get_target would choose, all attacks land at the same time.
+        3. Units without health are removed. If a structure was destroyed, every mobile unit recomputes its path.
+    Shielding is not simulated.
+
+    Attributes :
+        * game_state (:obj: GameState): The gamestate the simulation starts from
+        * max_frames (int): Simulations stop after this many frames
+
+    """
+    def __init__(self, game_state, max_frames=1000):
+        self.game_state = game_state
+        self.config = game_state.config
+        self.max_frames = max_frames
+        self._hit_radius = game_state.rules.hit_radius
+        self._breach_sp = self.config.get("resources", {}).get("coresForPlayerDamage", 0)
+        self._stats = {}
+        self._unit_information = {unit_info.get("shorthand"): unit_info for unit_info in self.config["unitInformation"]}
+
+    @profiler.timed("Simulator.simulate")
+    def simulate(self, enemy_deploys=None):
+        """Simulates the action phase
+
+        Args:
+            enemy_deploys: An optional list of [unit_type, location, num] entries for mobile units the opponent deploys
+
+        Returns:
+            A SimulationResult
+
+        """
+        result = SimulationResult()
+        state = self._copy_state()
+        game_map = state.game_map
+        walkers = self._copy_walkers()
+        for unit_type, location, num in enemy_deploys or []:
+            for _ in range(num):
+                walkers.append(self._make_walker(unit_type, location[0], location[1], 1, None))
+
+        edges = game_map.edge_sets
+        for walker in walkers:
+            walker.edge = state.get_target_edge([walker.x, walker.y])
+        self._assign_paths(state, walkers)
+
+        shooters = []
+        for x, y in self._structure_locations(game_map):
+            unit = self._structure_at(game_map, x, y)
+            if unit.damage_i + unit.damage_f > 0:
+                shooters.append(unit)
+
+        frame = 0
+        while walkers and frame < self.max_frames:
+            frame += 1
+            walkers, destroyed = self._move(state, walkers, edges, result)
+            if not walkers:
+                break
+
+            pending = self._attack(state, walkers, shooters)
+
+            for target, damage in pending.items():
+                if isinstance(target, _Walker):
+                    target.health -= damage
+                else:
+                    owner = target.player_index
+                    result.structure_damage[1 - owner] += min(damage, max(target.health, 0))
+                    target.health -= damage
+                    if target.health <= 0:
+                        destroyed = True
+                        result.destroyed.append([[target.x, target.y], target.unit_type, owner])
+                        game_map.remove_unit([target.x, target.y])
+            walkers = [walker for walker in walkers if walker.health > 0]
+            if destroyed:
+                shooters = [unit for unit in shooters if unit.health > 0]
+                self._assign_paths(state, walkers)
+
+        result.frames = frame
+        return result
+
+    def _copy_state(self):
+        """Creates a shallow copy of the game state with its own map holding copies of every structure
+        """
+        source_map = self.game_state.game_map
+        state = copy.copy(self.game_state)
+        state.enable_warnings = False
+        state.game_map = GameMap(self.config, state.rules)
+        state.game_map.enable_warnings = False
+        state._shortest_path_finder = ShortestPathFinder()
+        state.threat_map = ThreatMap(state)
+        for x, y in self._structure_locations(source_map):
+            unit = self._structure_at(source_map, x, y)
+            copied = state.game_map.add_unit(unit.unit_type, [x, y], unit.player_index, unit.health)
+            if unit.upgraded:
+                state.game_map.upgrade_unit([x, y])
+            copied.pending_removal = unit.pending_removal
+        return state
+
+    def _copy_walkers(self):
+        source_map = self.game_state.game_map
+        size = source_map.ARENA_SIZE
+        walkers = []
+        for index in range(size * size):
+            if source_map.mobile_counts[0][index] or source_map.mobile_counts[1][index]:
+                x, y = divmod(index, size)
+                for unit in source_map[x, y]:
+                    if not unit.stationary:
+                        walkers.append(self._make_walker(unit.unit_type, x, y, unit.player_index, unit.health))
+        return walkers
+
+    def _make_walker(self, unit_type, x, y, player_index, health):
+        key = (unit_type, player_index)
+        unit = self._stats.get(key)
+        if unit is None:
+            unit = GameUnit(unit_type, self.config, player_index, rules=self.game_state.rules)
+            self._stats[key] = unit
+        return _Walker(unit, x, y, health if health else unit.max_health)
+
+    def _structure_locations(self, game_map):
+        size = game_map.ARENA_SIZE
+        return [divmod(index, size) for index in range(size * size) if game_map.structure_mask[index]]
+
+    def _structure_at(self, game_map, x, y):
+        return game_map.structures[x * game_map.ARENA_SIZE + y]
+
+    def _assign_paths(self, state, walkers):
+        """Gives every walker the path from its current location, walkers sharing a location and edge share a path
+        """
+        paths = {}
+        for walker in walkers:
+            key = (walker.x, walker.y, walker.edge)
+            path = paths.get(key)
+            if path is None:
+                path = state.find_path_to_edge([walker.x, walker.y], walker.edge) or [[walker.x, walker.y]]
+                paths[key] = path
+            walker.path = path
+            walker.step = 0
+
+    def _move(self, state, walkers, edges, result):
+        """Moves every walker that is due, handling breaches and self destructs.
+        Returns the walkers still on the board, and whether a self destruct destroyed a structure.
+        """
+        remaining = []
+        destroyed = False
+        for walker in walkers:
+            walker.move_timer -= 1
+            if walker.move_timer > 0:
+                remaining.append(walker)
+                continue
+            walker.move_timer = walker.frames_per_move
+
+            if walker.step + 1 < len(walker.path):
+                walker.step += 1
+                walker.x, walker.y = walker.path[walker.step]
+                walker.moves += 1
+                if (walker.x, walker.y) in edges[walker.edge]:
+                    self._breach(walker, result)
+                    continue
+                remaining.append(walker)
+            elif self._self_destruct(state, walker, walkers, result):
+                destroyed = True
+        return remaining, destroyed
+
+    def _breach(self, walker, result):
+        player_index = walker.player_index
+        damage = self._unit_info(walker.unit.unit_type).get("playerBreachDamage", 1)
+        result.breaches.append([[walker.x, walker.y], walker.unit.unit_type, player_index])
+        result.health_lost[1 - player_index] += damage
+        result.resources_gained[player_index][0] += damage * self._breach_sp
+        result.resources_gained[player_index][1] += self._unit_info(walker.unit.unit_type).get("metalForBreach", 0)
+
+    def _self_destruct(self, state, walker, walkers, result):
+        """Removes a walker at the end of its path, exploding if it moved far enough. Returns True if a structure was destroyed.
+        """
+        walker.health = 0
+        unit_info = self._unit_info(walker.unit.unit_type)
+        if walker.moves < unit_info.get("selfDestructStepsRequired", 5):
+            return False
+
+        radius = unit_info.get("selfDestructRange", 0)
+        walker_damage = unit_info.get("selfDestructDamageWalker", 0)
+        structure_damage = unit_info.get("selfDestructDamageTower", 0)
+        destroyed = False
+        limit = radius + self._hit_radius
+        for other in walkers:
+            if other.player_index != walker.player_index and other.health > 0 and math.sqrt((other.x - walker.x) ** 2 + (other.y - walker.y) ** 2) < limit:
+                other.health -= walker_damage
+        for distance, units in state.game_map.get_units_in_range([walker.x, walker.y], radius):
+            for unit in units:
+                if unit.stationary and unit.player_index != walker.player_index and unit.health > 0:
+                    result.structure_damage[walker.player_index] += min(structure_damage, unit.health)
+                    unit.health -= structure_damage
+                    if unit.health <= 0:
+                        destroyed = True
+                        result.destroyed.append([[unit.x, unit.y], unit.unit_type, unit.player_index])
+                        state.game_map.remove_unit([unit.x, unit.y])
+        return destroyed
+
+    def _unit_info(self, unit_type):
+        return self._unit_information[unit_type]
+
+    def _attack(self, state, walkers, shooters):
+        """Chooses a target for every unit that can attack. Returns a dict of target -> damage taken this frame.
+        """
+        game_map = state.game_map
+        occupied = [{}, {}]
+        for walker in walkers:
+            if walker.health > 0:
+                occupied[walker.player_index].setdefault((walker.x, walker.y), []).append(walker)
+
+        pending = {}
+        targets = {}
+        for unit in shooters:
+            if unit.health <= 0:
+                continue
+            target = self._choose_target(game_map, unit.x, unit.y, unit.player_index, unit, occupied[1 - unit.player_index], targets)
+            if target is not None:
+                pending[target] = pending.get(target, 0) + (unit.damage_f if isinstance(target, GameUnit) else unit.damage_i)
+
+        for walker in walkers:
+            unit = walker.unit
+            if walker.health <= 0 or unit.damage_i + unit.damage_f == 0:
+                continue
+            target = self._choose_target(game_map, walker.x, walker.y, walker.player_index, unit, occupied[1 - walker.player_index], targets)
+            if target is not None:
+                pending[target] = pending.get(target, 0) + (unit.damage_f if isinstance(target, GameUnit) else unit.damage_i)
+        return pending
+
+    def _choose_target(self, game_map, x, y, player_index, unit, enemies, targets):
+        """Follows GameState.get_target priority: mobile units, then nearest, lowest health,
+        lowest y (relative to the attacker), and furthest from the center x.
+        Choices are cached per location, player and unit type for the frame.
+        """
+        key = (x, y, player_index, unit.unit_type, unit.upgraded)
+        if key in targets:
+            return targets[key]
+
+        best = None
+        best_key = None
+        limit = unit.attackRange + self._hit_radius
+        if unit.damage_i > 0:
+            for (tx, ty), group in enemies.items():
+                distance = math.sqrt((tx - x) ** 2 + (ty - y) ** 2)
+                if distance >= limit:
+                    continue
+                y_key = ty if player_index == 0 else -ty
+                x_key = -abs(13.5 - tx)
+                for walker in group:
+                    candidate = (distance, walker.health, y_key, x_key)
+                    if best_key is None or candidate < best_key:
+                        best = walker
+                        best_key = candidate
+
+        if best is None and unit.damage_f > 0:
+            for distance, units in game_map.get_units_in_range([x, y], unit.attackRange):
+                for other in units:
+                    if not other.stationary or other.player_index == player_index or other.health <= 0:
+                        continue
+                    y_key = other.y if player_index == 0 else -other.y
+                    candidate = (distance, other.health, y_key, -abs(13.5 - other.x))
+                    if best_key is None or candidate < best_key:
+                        best = other
+                        best_key = candidate
+
+        targets[key] = best
+        return best
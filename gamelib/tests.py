@@ -1,7 +1,34 @@
 import unittest
 import json
+import time
+import tempfile
+import io
 from .game_state import GameState
 from .unit import GameUnit
+from .rules import compile_rules
+from .navigation import ShortestPathFinder
+from .path_evaluation import evaluate_paths
+from .simulator import Simulator
+from .search import TurnSearch, apply_plan
+from .build_planner import BuildPlanner
+from .budget import TurnBudget
+from .profiling import Profiler, profiler
+from .debug_log import DebugLog, INFO, WARNING, log as game_log
+from .util import GameMessage
+from . import algocore
+from .replay import replay
+from .benchmarks import make_board, measure
+from .recorder import Recorder, read_records, read_index, TURN, ACTION_FRAME, CONFIG
+from .algocore import AlgoCore, ActionFrameFilter
+from .events import Death, TurnSummary
+
+
+def breach_failing_scorer(result):
+    """A TurnSearch scorer that fails on the plans that breach, module level so workers can unpickle it
+    """
+    if result.health_lost[1] > 0:
+        raise RuntimeError("scorer failed")
+    return 0
 
 
 class BasicTests(unittest.TestCase):
@@ -265,6 +292,39 @@ class BasicTests(unittest.TestCase):
         expected_string = "Enemy FF, health: 75.0 location: [14, 13] removal:  upgrade: False "
         self.assertEqual(got_string, expected_string, "Expected {} from print_unit test got {} ".format(expected_string, got_string))
 
+    def test_unit_stats(self):
+        config = self.make_turn_0_map().config
+        first = GameUnit("DF", config, 0, x=3, y=4)
+        second = GameUnit("DF", config, 1, 20)
+        self.assertIs(first.stats, second.stats, "Units of a type should share their stat record")
+        self.assertEqual((90.0, 20), (first.health, second.health), "Health should default to the type's start health")
+        self.assertFalse(hasattr(first, "__dict__"), "Units should not carry an instance dict")
+
+        first.upgrade()
+        self.assertEqual((3.5, 15.0, (6.0, 0)), (first.attackRange, first.damage_i, first.cost), "Upgrading should apply the upgraded stats")
+        self.assertIs(compile_rules(config).unit_stats["DF"][1], first.stats, "Upgraded units should share the upgraded record")
+        self.assertEqual(2.5, second.attackRange, "Other units of the type should keep their stats")
+
+    def test_rules(self):
+        game = self.make_turn_0_map()
+        self.assertIs(game.rules, compile_rules(game.config), "Rules should be compiled once per config")
+        self.assertEqual(frozenset(["FF", "EF", "DF"]), game.rules.STRUCTURE_TYPES, "Structure types should come from the config")
+        self.assertEqual((4.0, 0), game.rules.upgrade_costs["DF"], "Upgrade costs should come from the config")
+
+        config = json.loads(json.dumps(game.config))
+        config["unitInformation"][2]["shorthand"] = "TT"
+        config["unitInformation"][2]["cost1"] = 3.0
+        other = GameState(config, game.serialized_string)
+        other.suppress_warnings(True)
+        self.assertEqual([2.0, 0], game.type_cost("DF"), "Another config should not change this state's rules")
+        self.assertEqual(1, game.attempt_spawn("DF", [13, 3]), "This state should still know its turret")
+        self.assertEqual([3.0, 0], other.type_cost("TT"), "The other state should use its own config")
+        self.assertIsNone(other.attempt_spawn("DF", [13, 3]), "The other state should not know this config's turret")
+
+        short = dict(config, unitInformation=config["unitInformation"][:6])
+        with self.assertRaisesRegex(ValueError, "defines 6 unit types"):
+            compile_rules(short)
+
     def test_future_MP(self):
         game = self.make_turn_0_map()
 
@@ -282,3 +342,573 @@ class BasicTests(unittest.TestCase):
         game.spawn_turret([10,11])
         game.spawn_turret([9,11])
         assert(game.get_friendly_turrets() == [[9,11],[10,11]])
+
+    def test_pathing_cache(self):
+        game = self.make_turn_0_map()
+        open_path = game.find_path_to_edge([13, 0])
+        self.assertEqual([13, 0], open_path[0], "Paths should start at the start location")
+        self.assertIn(open_path[-1], game.game_map.get_edge_locations(game.game_map.TOP_RIGHT), "An open board path should reach the edge")
+
+        for x in range(5, 23):
+            game.game_map.add_unit("FF", [x, 13], 0)
+        blocked_path = game.find_path_to_edge([13, 0])
+        self.assertEqual(ShortestPathFinder().navigate_multiple_endpoints([13, 0], game.game_map.get_edge_locations(game.game_map.TOP_RIGHT), game), blocked_path, "Cached pathing disagrees with a fresh search after adding structures")
+
+        for x in range(5, 23):
+            game.game_map.remove_unit([x, 13])
+        self.assertEqual(open_path, game.find_path_to_edge([13, 0]), "Removing the structures should restore the original path")
+
+    def test_paths_from_edges(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("FF", [13, 0], 0)
+        for x in range(2, 26):
+            game.game_map.add_unit("DF", [x, 13], 1)
+        edge_locations = game.game_map.get_edge_locations(game.game_map.BOTTOM_LEFT) + game.game_map.get_edge_locations(game.game_map.BOTTOM_RIGHT)
+        paths = game.find_paths_from_edges()
+        self.assertEqual(28, len(paths), "There should be one entry per friendly edge location")
+        for location, path in zip(edge_locations, paths):
+            self.assertEqual(game.find_path_to_edge(location), path, "Batched path from {} differs from find_path_to_edge".format(location))
+        self.assertIsNone(paths[0], "A blocked edge location should not have a path")
+
+    def test_map_layers(self):
+        game = self.make_turn_0_map()
+        index = 13 * game.ARENA_SIZE + 5
+        game.game_map.add_unit("DF", [13, 5], 1)
+        self.assertTrue(game.game_map.structure_mask[index], "The structure mask should be set")
+        self.assertEqual(1, game.game_map.structure_owner[index], "The structure should belong to the enemy")
+        self.assertEqual(2, game.game_map.structure_type[index], "The structure type should be the destructor index")
+        self.assertEqual(90.0, game.game_map.structure_health[index], "The structure health should be its start health")
+        game.game_map.upgrade_unit([13, 5])
+        self.assertTrue(game.game_map.structure_upgraded[index], "The upgrade flag should be set")
+        game.game_map.remove_unit([13, 5])
+        self.assertFalse(game.game_map.structure_mask[index], "Removing a structure should clear the mask")
+        self.assertEqual(-1, game.game_map.structure_owner[index], "Removing a structure should clear the owner")
+
+        game.attempt_spawn("SI", [13, 0], 3)
+        self.assertEqual(3, game.game_map.mobile_counts[0][13 * game.ARENA_SIZE], "Spawned mobile units should be counted")
+        self.assertEqual(0, game.game_map.mobile_counts[1][13 * game.ARENA_SIZE], "The enemy has no mobile units here")
+
+    def test_structure_index(self):
+        game = self.make_turn_0_map()
+        turret = game.game_map.add_unit("DF", [13, 5], 0)
+        game.attempt_spawn("SI", [13, 0])
+        self.assertIs(turret, game.contains_stationary_unit([13, 5]), "The structure should be found")
+        self.assertIs(turret, game.contains_stationary_unit([13.0, 5.0]), "Float locations should still work")
+        self.assertFalse(game.contains_stationary_unit([13, 0]), "Mobile units are not structures")
+        self.assertFalse(game.contains_stationary_unit([0, 0]), "Off board locations have no structures")
+        self.assertEqual([turret, None, None], game.game_map.structures_at([[13, 5], [13, 0], [0, 0]]), "Every location should be looked up")
+
+        game.game_map[13, 5] = []
+        self.assertIsNone(game.game_map.structures_at([[13, 5]])[0], "Replacing a location's units should clear its structure")
+
+    def test_map_iteration(self):
+        game_map = self.make_turn_0_map().game_map
+        locations = [location for location in game_map]
+        self.assertEqual(420, len(locations), "Every location on the board should be visited once")
+        self.assertEqual(([13, 0], [14, 27]), (locations[0], locations[-1]), "Iteration should go row by row from the bottom")
+        pairs = sum(1 for first in game_map for second in game_map if first == second)
+        self.assertEqual(420, pairs, "Nested iteration over the same map should work")
+
+        edges = game_map.get_edges()
+        for edge, edge_set in zip(edges, game_map.edge_sets):
+            self.assertEqual(edge_set, frozenset(tuple(location) for location in edge), "The edge sets should match get_edges")
+        edges[0].clear()
+        self.assertEqual(14, len(game_map.get_edges()[0]), "Changing returned edges should not change the map")
+
+    def test_snapshot_restore_fork(self):
+        game = self.make_turn_0_map()
+        game.attempt_spawn("DF", [13, 12])
+        path = game.find_path_to_edge([13, 13])
+        resources = game.get_resources()
+        self.assertEqual(5, game.threat_map.damage_to_walkers([13, 13], 1), "The turret should threaten its neighbours")
+
+        snapshot = game.snapshot()
+        game.attempt_upgrade([13, 12])
+        game.attempt_spawn("FF", [14, 13])
+        game.attempt_spawn("PI", [13, 0])
+        game.game_map.remove_unit([13, 12])
+        self.assertEqual(0, game.threat_map.damage_to_walkers([13, 13], 1), "The turret was removed")
+        game.restore(snapshot)
+        self.assertEqual(resources, game.get_resources(), "Resources should be restored")
+        self.assertEqual([("DF", 13, 12)], game._build_stack, "The build stack should be restored")
+        self.assertEqual([], game._deploy_stack, "The deploy stack should be restored")
+        self.assertFalse(game.contains_stationary_unit([14, 13]), "The wall should be gone")
+        self.assertEqual(0, game.game_map.mobile_counts[0][13 * 28], "The scout should be gone")
+        self.assertFalse(game.game_map[13, 12][0].upgraded, "The upgrade should be undone on the restored turret")
+        self.assertEqual(5, game.threat_map.damage_to_walkers([13, 13], 1), "The threat map should follow the restore")
+        self.assertEqual(path, game.find_path_to_edge([13, 13]), "Pathing should follow the restore")
+
+        fork = game.fork()
+        fork.attempt_upgrade([13, 12])
+        fork.attempt_spawn("PI", [13, 0])
+        game.attempt_spawn("FF", [14, 13])
+        self.assertFalse(game.game_map[13, 12][0].upgraded, "Upgrading in a fork should not change the parent")
+        self.assertEqual([], game.game_map[13, 0], "Spawning in a fork should not change the parent")
+        self.assertEqual(15, fork.threat_map.damage_to_walkers([13, 13], 1), "The fork should see its own upgrade")
+        self.assertFalse(fork.contains_stationary_unit([14, 13]), "Building in the parent should not change the fork")
+        self.assertNotEqual(game.get_resources(), fork.get_resources(), "Resources should be independent")
+
+    def test_attempt_batch(self):
+        game = self.make_turn_0_map()
+        game.suppress_warnings(True)
+        results = game.attempt_batch([
+            ("DF", [13, 12], 1),
+            ("UP", [13, 12], 1),
+            ("FF", [13, 12], 1),
+            ("FF", [13, 20], 1),
+            ("FF", [0, 0], 1),
+            ("PI", [13, 0], 3),
+            ("PI", [13, 5], 1),
+            ("SI", [13, 0], 10),
+            ("UP", [14, 14], 1),
+            ("RM", [13, 12], 1),
+            ("XX", [13, 11], 1)])
+        self.assertEqual([1, 1, 0, 0, 0, 3, 0, 2, 0, 1, 0], results, "Every request should report how many units it placed")
+        self.assertEqual([19, 0], game.get_resources(), "Resources should be deducted for every unit placed")
+        self.assertEqual([("DF", 13, 12), ("UP", 13, 12), ("RM", 13, 12)], game._build_stack, "Structures should be queued in order")
+        self.assertEqual([("PI", 13, 0)] * 3 + [("SI", 13, 0)] * 2, game._deploy_stack, "Mobile units should be queued in order")
+        self.assertTrue(game.game_map[13, 12][0].upgraded, "The upgrade should see the turret spawned before it")
+        self.assertEqual(5, game.game_map.mobile_counts[0][13 * 28], "The map should hold every mobile unit")
+        self.assertEqual(2, game.attempt_spawn("FF", [[12, 12], [13, 12], [14, 12]]), "attempt_spawn should count the units of the batch")
+
+    def test_build_planner(self):
+        game = self.make_turn_0_map()
+        planner = BuildPlanner(game)
+        turret = [("spawn", "DF", [13, 12], 1)]
+        self.assertEqual(2, planner.add((5, turret), (9, turret + [("upgrade", [13, 12])])), "Both turret options can be built")
+        planner.add((4, [("spawn", "FF", [12, 13], 1)]))
+        planner.add((4, [("spawn", "FF", [14, 13], 1)]))
+        self.assertEqual(0, planner.add((100, [("spawn", "FF", [0, 0], 1)])), "Options that can not be built should be dropped")
+        self.assertEqual(25, game.get_resource(game.SP), "Dry runs should not spend anything")
+        self.assertEqual([], game._build_stack, "Dry runs should not queue anything")
+
+        self.assertEqual([5, 4, 4], [value for value, _, _ in planner.choose(6)], "Three cheap builds are worth more than the upgraded turret")
+        self.assertEqual([9, 4, 4], [value for value, _, _ in planner.choose(8)], "The upgrade fits once the budget allows it")
+        committed = planner.commit(8)
+        self.assertEqual([6.0, 1.0, 1.0], [cost for _, cost, _ in committed], "The dry run should price the upgrade with its turret")
+        self.assertEqual(17, game.get_resource(game.SP), "Only the chosen options should be paid for")
+        self.assertTrue(game.game_map[13, 12][0].upgraded, "The chosen turret should be upgraded")
+
+        planner.add((5, [("spawn", "FF", [11, 13], 1)]))
+        self.assertEqual(1, planner.add((7, [("spawn", "FF", [11, 13], 1), ("spawn", "FF", [10, 13], 1)])), "Options are kept when their location was proposed before")
+        planner.add((2, [("spawn", "FF", [10, 13], 1)]))
+        planner.add((3, [("spawn", "FF", [9, 13], 1)]))
+        self.assertEqual(2, len(planner.groups), "Groups that share a location should be merged")
+        self.assertEqual([5, 3], [value for value, _, _ in planner.choose(2)], "The cheaper option should be kept with the other group")
+        chosen = planner.choose(3)
+        self.assertEqual(10, sum(value for value, _, _ in chosen), "A location proposed twice should only be valued once")
+        self.assertEqual(3, sum(cost for _, cost, _ in chosen), "A location proposed twice should only be paid for once")
+        self.assertEqual(2, len(planner.commit(3)), "Every chosen option should be built")
+        self.assertTrue(all(game.contains_stationary_unit([x, 13]) for x in (9, 10, 11)), "The chosen walls should be built")
+        self.assertEqual(14, game.get_resource(game.SP), "Each wall should be paid for once")
+
+        planner.add((5, [("spawn", "FF", [15, 13], 1), ("spawn", "FF", [16, 13], 1)]))
+        game.attempt_spawn("FF", [16, 13])
+        self.assertEqual([], planner.commit(), "Options that no longer fit the board should be rolled back")
+        self.assertFalse(game.contains_stationary_unit([15, 13]), "Nothing should be built half way")
+        self.assertEqual(13, game.get_resource(game.SP), "Rolled back options should be refunded")
+
+    def test_range_tables(self):
+        game = self.make_turn_0_map()
+        self.assertEqual(4.5, game.game_map.max_attack_range, "The largest attack range should come from the config")
+        game.game_map.add_unit("DF", [13, 14], 1)
+        game.game_map.add_unit("DF", [13, 18], 1)
+        found = game.game_map.get_units_in_range([13, 13], 3.5)
+        self.assertEqual(1, len(found), "Only one occupied location is in range")
+        self.assertEqual(1, found[0][0], "The occupied location is one tile away")
+        self.assertEqual([13, 14], [found[0][1][0].x, found[0][1][0].y], "Wrong unit found in range")
+        self.assertEqual(1, len(game.get_attackers([13, 13], 0)), "Only the nearby turret is in range")
+
+        self.assertEqual(13, len(game.game_map.get_locations_in_range([13.0, 5.0], 2)), "Float locations should still be searched")
+        self.assertEqual(game.game_map.get_locations_in_range([13, 5], 2), game.game_map.get_locations_in_range([13.0, 5.0], 2), "Whole float locations should match their int location")
+        self.assertEqual(found, game.game_map.get_units_in_range([13.0, 13.0], 3.5), "Float locations should find the same units")
+        self.assertEqual(1, len(game.get_attackers([13.0, 13.0], 0)), "Attackers of a float location should be found")
+        self.assertEqual([[13, 13], [13, 14]], game.game_map.get_locations_in_range([13.0, 13.5], 0.5), "Locations between tiles should be measured from the exact location")
+
+    def test_threat_map(self):
+        game = self.make_turn_0_map()
+        self.assertEqual(0, game.threat_map.damage_to_walkers([13, 13], 1), "An empty board is not threatening")
+        game.attempt_spawn("DF", [13, 12])
+        self.assertEqual(5, game.threat_map.damage_to_walkers([13, 13], 1), "Enemy units next to our turret should take its damage")
+        self.assertEqual(0, game.threat_map.damage_to_walkers([13, 13], 0), "Our own turret does not threaten us")
+        self.assertEqual(0, game.threat_map.damage_to_walkers([13, 17], 1), "Locations out of range are not threatened")
+        game.attempt_upgrade([13, 12])
+        self.assertEqual(15, game.threat_map.damage_to_walkers([13, 13], 1), "The upgraded damage should be used")
+        self.assertEqual(15, game.threat_map.damage_to_walkers([13, 15], 1), "The upgraded range should be used")
+        self.assertEqual(30, game.threat_map.path_damage([[13, 13], [13, 14]], 1), "Path damage should sum every location")
+        game.game_map.remove_unit([13, 12])
+        self.assertEqual(0, game.threat_map.damage_to_walkers([13, 13], 1), "Removed structures should stop threatening")
+
+    def test_evaluate_paths(self):
+        game = self.make_turn_0_map()
+        open_path = game.find_path_to_edge([13, 0])
+        outcome = evaluate_paths(game, [open_path, None], "PI", 5)
+        self.assertEqual(5, outcome[0].breaches, "Every unit should breach on an undefended board")
+        self.assertEqual(0, outcome[0].damage_taken, "Nothing should damage the units")
+        self.assertEqual(0, outcome[1].survivors, "A missing path has no survivors")
+
+        for x in range(20, 26):
+            game.game_map.add_unit("DF", [x, 16], 1)
+            game.game_map.upgrade_unit([x, 16])
+        defended = evaluate_paths(game, [game.find_path_to_edge([13, 0])], "PI", 5)[0]
+        self.assertLess(defended.survivors, 5, "Upgraded turrets should kill some units")
+        self.assertGreater(defended.structure_damage, 0, "The units should damage the turrets they pass")
+        self.assertEqual(defended.survivors, defended.breaches, "Survivors on a path to the edge breach")
+
+    def test_simulator(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("PI", [13, 0], 0)
+        game.game_map.add_unit("PI", [13, 0], 0)
+        result = Simulator(game).simulate()
+        self.assertEqual(2, len(result.breaches), "Both units should breach on an undefended board")
+        self.assertEqual([0, 2], result.health_lost, "The enemy should lose health for every breach")
+        self.assertEqual(2, len(game.game_map[13, 0]), "The game state should not be modified")
+
+        for x in range(20, 26):
+            game.game_map.add_unit("DF", [x, 16], 1)
+            game.game_map.upgrade_unit([x, 16])
+        defended = Simulator(game).simulate()
+        self.assertEqual(0, len(defended.breaches), "Upgraded turrets should stop the units")
+        self.assertGreater(defended.structure_damage[0], 0, "The units should damage the turrets they pass")
+        self.assertEqual(6, len(game.game_map.get_units_in_range([22, 16], 5)), "The game state should keep its turrets")
+
+        enemy = Simulator(game).simulate([["PI", [14, 27], 1]])
+        self.assertEqual(1, len([breach for breach in enemy.breaches if breach[2] == 1]), "The enemy unit should breach")
+
+    def test_simulator_self_destruct_repaths(self):
+        game = self.make_turn_0_map()
+        config = json.loads(json.dumps(game.config))
+        for unit_info in config["unitInformation"][3:6]:
+            unit_info["attackDamageTower"] = unit_info["attackDamageWalker"] = 0
+        game = GameState(config, game.serialized_string)
+        game.suppress_warnings(True)
+        for x in range(28):
+            game.game_map.add_unit("FF", [x, 14], 1, 10)
+        game.game_map.add_unit("PI", [13, 0], 0)
+        game.game_map.add_unit("SI", [13, 0], 0)
+        result = Simulator(game).simulate()
+        self.assertEqual(2, len(result.destroyed), "The scout should blow a gap in the sealed wall")
+        self.assertEqual([[[27, 14], "SI", 0]], result.breaches, "The interceptor should re-path through the gap and breach")
+
+    def test_repairs_survive_turns(self):
+        from tower_defense import DefenseStructures
+        game = self.make_turn_0_map()
+        game.attempt_spawn("FF", [13, 5])
+        section = DefenseStructures([[13, 5], [14, 5]])
+        section.update_units(game)
+        health = section.cur_abs_HP
+
+        game.game_map.remove_unit([13, 5])
+        summary = TurnSummary()
+        summary.structures_lost[0].append(Death([13, 5], "FF", "1", 0, False))
+        section.update(game, summary)
+        self.assertEqual([[(13, 5), 1]], section.to_repair, "The destroyed wall should be queued for repair")
+        self.assertEqual(1, section.repair_cost, "The repair should cost the wall")
+
+        section.update(game, TurnSummary())
+        self.assertEqual([[(13, 5), 1]], section.to_repair, "A tile that was not repaired should stay queued")
+        self.assertEqual(1, section.repair_cost, "The unrepaired wall should still be paid for")
+        self.assertEqual(health - 75, section.cur_abs_HP, "The loss should only be counted once")
+
+        game.attempt_spawn("FF", [13, 5])
+        section.update_units(game)
+        section.update(game, TurnSummary())
+        self.assertEqual([], section.to_repair, "A rebuilt tile should leave the queue")
+
+        # turns that only call end_turn, like the opening, are not in the next summary
+        section = DefenseStructures([[13, 5], [14, 5]])
+        section.end_turn(game)
+        game.game_map.remove_unit([13, 5])
+        game.turn_number += 1
+        section.end_turn(game)
+        game.turn_number += 1
+        section.update(game, TurnSummary())
+        self.assertEqual([[(13, 5), 1]], section.to_repair, "A wall lost on a turn update() missed should be queued")
+        section.update(game, TurnSummary())
+        game.turn_number += 1
+        section.update(game, TurnSummary())
+        self.assertEqual([[(13, 5), 1]], section.to_repair, "The wall should stay queued on the following turns")
+
+    def test_turn_search(self):
+        game = self.make_turn_0_map()
+        game.attempt_spawn("DF", [13, 6])
+        plans = [[], [("spawn", "PI", [13, 0], 2)], [("spawn", "SI", [13, 0], 1)]]
+        for workers in (0, 1):
+            search = TurnSearch(game.config, workers)
+            best, score, scores = search.search(game, plans, time.monotonic() + 30)
+            search.shutdown()
+            self.assertEqual(plans[1], best, "Scouts that breach should be the best plan")
+            self.assertEqual([0, 2, 1], scores, "Each plan should be scored by the damage it deals")
+
+        self.assertEqual(2, apply_plan(game, plans[1]), "Both units should be spawned")
+        self.assertEqual([("DF", 13, 6)], game._build_stack, "Searching should not modify the game state")
+
+        budget = TurnBudget(game.config)
+        budget.start(started=time.monotonic() - 1)
+        search = TurnSearch(game.config, 0, budget)
+        self.assertAlmostEqual(time.monotonic() + budget.remaining() / 2, search.get_deadline(), 1, "The deadline should count from the turn's start")
+        self.assertEqual([None, None, [None, None, None]], search.search(game, plans, time.monotonic() - 1), "Nothing is scored past the deadline")
+
+        game = self.make_turn_0_map()
+        previous = game_log.stream
+        for workers in (0, 1):
+            output = io.StringIO()
+            game_log.flush()
+            game_log.stream = output
+            try:
+                search = TurnSearch(game.config, workers)
+                result = search.search(game, plans, time.monotonic() + 30, scorer=breach_failing_scorer)
+                search.shutdown()
+                game_log.flush()
+            finally:
+                game_log.stream = previous
+            self.assertEqual([[], 0, [0, None, None]], result, "Plans whose scoring raised should be dropped, not end the turn")
+            self.assertIn("Could not score plan 1, skipping it: RuntimeError('scorer failed')", output.getvalue(), "The failure should be logged")
+
+    def test_game_message(self):
+        game = self.make_turn_0_map()
+        message = GameMessage(game.serialized_string)
+        self.assertEqual(0, message.turn_type, "The turn type should be read without decoding")
+        self.assertNotIn("_state", message.__dict__, "Reading the turn type should not decode the message")
+        self.assertIs(message.state, message.state, "The message should only be decoded once")
+        self.assertEqual(json.loads(game.serialized_string), json.loads(message), "The message should still work as a string")
+        self.assertIsNone(GameMessage('{"events": []}').turn_type, "A message without turnInfo has no turn type")
+
+        for serialized in (message, message.state):
+            other = GameState(game.config, serialized)
+            self.assertEqual(game.get_resources(0), other.get_resources(0), "Decoded messages should give the same state")
+            self.assertEqual(game.my_health, other.my_health, "Decoded messages should give the same state")
+
+    def test_action_frame_filter(self):
+        quiet = '{"p1Units":[[],[]],"events":{"selfDestruct":[],"breach":[],"damage":[[[3,10],2.0,3,"1",2]],"spawn":[],"death":[]}}'
+        breach = '{"p1Units":[[],[]],"events":{"selfDestruct":[],"breach":[ [[1,12],1.0,3,"5",2]],"damage":[],"spawn":[],"death":[]}}'
+        frame_filter = ActionFrameFilter(["breach"])
+        self.assertFalse(frame_filter.wants(quiet), "A frame without breaches should be skipped")
+        self.assertTrue(frame_filter.wants(breach), "A frame with a breach should pass")
+        self.assertEqual([1, 1], [frame_filter.passed, frame_filter.skipped], "Frames should be counted")
+        self.assertTrue(ActionFrameFilter(["damage", "death"]).wants(quiet), "Any subscribed event should pass a frame")
+        self.assertTrue(frame_filter.wants('{"events" : {"breach" : [ [[1,12],1.0,3,"5",2] ]}}'), "Spacing around the list should not matter")
+        self.assertFalse(frame_filter.wants('{"events":{"breach":null,"damage":[[[3,10],2.0,3,"1",2]]}}'), "A breach that is not a list should be decoded, not scanned past")
+        self.assertFalse(frame_filter.wants('{"p1Units":[[],[]]}'), "A frame without events should be decoded and skipped")
+        self.assertTrue(frame_filter.wants('{"breach": [1'), "A frame that can not be read should be passed on")
+        with self.assertRaises(ValueError):
+            ActionFrameFilter(["breaches"])
+
+    def test_event_callbacks(self):
+        game = self.make_turn_0_map()
+        config = json.dumps(game.config)
+        events = '"events":{{"breach":[{}],"damage":[{}],"death":[{}],"spawn":[{}]}}'
+        frames = [
+            '{{"turnInfo":[1,3,10],{}}}'.format(events.format('[[1,12],1.0,3,"21",2]', '[[5,12],75.0,2,"7",1],[[5,12],5.0,2,"7",1]',
+                                                              '[[5,12],2,"7",1,false],[[6,12],0,"8",2,true]', '[[13,27],3,"30",2],[[13,27],3,"31",2]')),
+            '{{"turnInfo":[1,3,11],{}}}'.format(events.format('', '', '', '')),
+            '{{"turnInfo":[1,3,12],{}}}'.format(events.format('', '', '', '').replace('"damage":[]', '"move":[[[1,1],[1,2],[0,1],3,"21",2]],"damage":[]')),
+            game.serialized_string,
+            '{"turnInfo":[2,3,12]}']
+        lines = [config] + frames
+
+        class Algo(AlgoCore):
+            def on_game_start(self, config):
+                self.breaches = []
+                self.destroyed = []
+                self.summaries = []
+                self.collect_summary = True
+
+            def on_turn(self, turn_state):
+                self.summaries.append(self.action_summary)
+
+            def on_breach(self, breach):
+                self.breaches.append(breach)
+
+            def on_structure_destroyed(self, death):
+                self.destroyed.append(death)
+
+        get_command = algocore.get_command
+        algocore.get_command = lambda: lines.pop(0)
+        try:
+            algo = Algo()
+            algo.start()
+        finally:
+            algocore.get_command = get_command
+
+        self.assertEqual([([1, 12], 1.0, "PI", "21", 1)], [tuple(breach) for breach in algo.breaches], "The breach should be typed and use player index 1 for the opponent")
+        self.assertEqual(1, len(algo.destroyed), "Removed structures should not be reported as destroyed")
+        self.assertEqual(("DF", 0), (algo.destroyed[0].unit_type, algo.destroyed[0].player_index), "The destroyed structure should be typed")
+        self.assertEqual(["breach", "death", "damage", "spawn"], algo.frame_filter.events, "The filter should follow the overridden callbacks and the summary")
+        self.assertEqual(2, algo.frame_filter.skipped, "The frames without events should be skipped")
+
+        summary = algo.summaries[0]
+        self.assertEqual(3, summary.frames, "Every frame should be counted")
+        self.assertEqual({(5, 12): 80.0}, summary.damage_taken[0], "Damage should be summed per location")
+        self.assertEqual([(1, 12)], summary.breaches[1], "The opponent scored once")
+        self.assertEqual(({(13, 27): 2}, {"PI": 2}), (summary.spawns[1], summary.unit_counts[1]), "The opponent spawned two scouts")
+        self.assertEqual({(5, 12), (6, 12)}, summary.changed_locations(0) | summary.changed_locations(1), "Hit and removed locations should be reported")
+
+    def test_recorder(self):
+        game = self.make_turn_0_map()
+        messages = [json.dumps(game.config), game.serialized_string, '{"turnInfo":[1,0,4],"events":{}}']
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = Recorder(directory)
+            for message in messages:
+                recorder.record(message)
+            recorder.close()
+            self.assertEqual(3, recorder.recorded, "Every message should be written")
+            self.assertEqual(messages, list(read_records(recorder.path)), "Messages should read back unchanged")
+            index = read_index(recorder.path)
+            self.assertEqual([CONFIG, TURN, ACTION_FRAME], [entry[2] for entry in index], "Messages should be classified")
+            self.assertEqual((0, 4), index[2][3:5], "The turn and frame numbers should be indexed")
+
+            full = Recorder(directory, max_queue=1)
+            full.close()
+            full.record("waiting")
+            full.record("dropped")
+            self.assertEqual(1, full.dropped, "A full queue should drop messages instead of waiting")
+
+    def test_replay(self):
+        game = self.make_turn_0_map()
+        state = json.loads(game.serialized_string)
+        turns = []
+        for turn in range(3):
+            state["turnInfo"] = [0, turn, -1]
+            turns.append(json.dumps(state))
+        messages = [json.dumps(game.config), turns[0], '{"turnInfo":[1,0,0],"events":{}}', turns[1], turns[2], '{"turnInfo":[2,3,0]}']
+
+        class Algo(AlgoCore):
+            def on_turn(self, turn_state):
+                game_state = GameState(self.config, turn_state)
+                game_state.attempt_spawn("PI", [13, 0], game_state.turn_number + 1)
+                game_state.submit_turn()
+
+        result = replay(Algo(), messages)
+        self.assertEqual([0, 1, 2], [turn.turn_number for turn in result.turns], "Every turn should be recorded")
+        self.assertEqual(([], [["PI", 13, 0]] * 3), result.turns[2][1:3], "The submitted stacks should be captured")
+        self.assertEqual(1, result.frames, "The action frame should be counted")
+        self.assertEqual(3, result.latency()["count"], "Every turn should be timed")
+
+        class Changed(Algo):
+            def on_turn(self, turn_state):
+                if GameState(self.config, turn_state).turn_number == 1:
+                    return super().on_turn(turns[0])
+                super().on_turn(turn_state)
+        self.assertEqual([1], result.differences(replay(Changed(), messages)), "The changed turn should be found")
+
+    def test_benchmark_boards(self):
+        config = self.make_turn_0_map().config
+        board = make_board(config, 30, 20, 12)
+        self.assertEqual(board, make_board(config, 30, 20, 12), "Boards should be repeatable")
+        game = GameState(config, board)
+        structures = [unit for location in game.game_map for unit in game.game_map[location] if unit.stationary]
+        self.assertEqual(60, len(structures), "Each side should get its structures")
+        self.assertEqual(12, game.turn_number, "The board should have the requested turn number")
+
+        result = measure(lambda: sum(range(100)), calls=10, warmup=1)
+        self.assertEqual(10, result["calls"], "Every call should be timed")
+        self.assertLessEqual(result["p50_us"], result["max_us"], "Percentiles should be ordered")
+
+    def test_debug_log(self):
+        class Unprintable:
+            def __format__(self, spec):
+                raise AssertionError("Messages below the level should not be formatted")
+
+        output = io.StringIO()
+        buffered = DebugLog(level=INFO, byte_cap=50, stream=output)
+        buffered.debug("hidden {}", Unprintable())
+        buffered.info("turn {}", 1)
+        buffered.warning("warned")
+        self.assertEqual("", output.getvalue(), "Nothing should be written before a flush")
+        buffered.flush()
+        self.assertEqual("turn 1\nwarned\n", output.getvalue(), "Kept messages should be written in order")
+
+        buffered.error("x" * 30)
+        buffered.error("y" * 30)
+        buffered.error("z {}", Unprintable())
+        self.assertEqual(2, buffered.dropped, "Messages past the byte cap should be dropped")
+        buffered.start_turn()
+        self.assertTrue(output.getvalue().endswith("2 messages dropped\n"), "The drops should be reported")
+        buffered.info("next turn")
+        self.assertEqual(0, buffered.dropped, "A new turn should reset the cap")
+
+        game = self.make_turn_0_map()
+        game.suppress_warnings(False)
+        previous = game_log.stream
+        game_log.stream = output
+        game_log.level = WARNING
+        try:
+            game.attempt_spawn("PI", [0, 0])
+            game.game_map.get_locations_in_range([13, 13], -1)
+            self.assertNotIn("Could not spawn", output.getvalue(), "Warnings should wait for the flush")
+            game_log.flush()
+        finally:
+            game_log.stream = previous
+            game_log.level = INFO
+        self.assertIn("Could not spawn PI at location [0, 0]", output.getvalue(), "GameState warnings should be logged")
+        self.assertIn("Radius -1 was passed to get_locations_in_range", output.getvalue(), "GameMap warnings should be logged at the same level")
+
+        pathfinder = ShortestPathFinder()
+        pathfinder.navigate_multiple_endpoints([13, 0], game.game_map.get_edge_locations(game.game_map.TOP_RIGHT), game)
+        output = io.StringIO()
+        game_log.stream = output
+        try:
+            pathfinder.print_map()
+            self.assertEqual("", output.getvalue(), "The map should wait for the flush")
+            game_log.flush()
+        finally:
+            game_log.stream = previous
+        rows = output.getvalue().split("\n")[:28]
+        self.assertTrue(rows[0].startswith(" " * 39), "Rows should keep the padding of the cells off the board")
+        self.assertEqual(" 0", rows[13][81:83], "The edge the path leads to should be 0 steps away")
+
+    def test_profiler(self):
+        local = Profiler()
+        square = local.timed("square")(lambda value: value * value)
+        local.start_turn(0)
+        with local.phase("block"):
+            self.assertEqual(9, square(3), "Timed functions should still return")
+        self.assertIsNone(local.end_turn(), "A disabled profiler should not record")
+
+        output = io.StringIO()
+        local.enable(output)
+        local.start_turn(4)
+        with local.phase("block"):
+            square(2)
+            square(3)
+        record = local.end_turn()
+        self.assertEqual(record, json.loads(output.getvalue()), "One json line should be written per turn")
+        self.assertEqual(4, record["turn"], "The record should carry the turn number")
+        self.assertEqual(2, record["phases"]["square"]["calls"], "Every call should be counted")
+        self.assertEqual(1, record["phases"]["block"]["calls"], "The phase should be counted once")
+
+        game = self.make_turn_0_map()
+
+        class Algo(AlgoCore):
+            def on_turn(self, turn_state):
+                GameState(self.config, turn_state).submit_turn()
+        profiler.enable(None, keep_records=True)
+        try:
+            replay(Algo(), [json.dumps(game.config), game.serialized_string, '{"turnInfo":[2,1,0]}'])
+        finally:
+            profiler.disable()
+        self.assertEqual(1, len(profiler.records), "AlgoCore should record every turn")
+        self.assertEqual(1, profiler.records[0]["phases"]["GameState.__init__"]["calls"], "gamelib primitives should be timed")
+        del profiler.records[:]
+
+    def test_turn_budget(self):
+        now = [100.0]
+        budget = TurnBudget(self.make_turn_0_map().config, headroom=1, clock=lambda: now[0])
+        budget.start(my_time=7000)
+        self.assertEqual(3, budget.turn_limit, "Overrunning the last turn should shorten this one")
+        self.assertEqual(2, budget.remaining(), "The headroom should not be handed out")
+
+        def slow_step():
+            now[0] += 1.5
+            return "done"
+        self.assertEqual("done", budget.step("analysis", slow_step), "There is time for the step")
+        self.assertIsNone(budget.step("analysis", slow_step), "The step took longer than the time left")
+        self.assertEqual(["analysis"], budget.skipped, "The skipped step should be recorded")
+        self.assertTrue(budget.step("quick", lambda: True), "A step with no estimate fits")
+
+        budget.offer("attack", "fallback")
+        budget.offer("attack", "good", 2)
+        budget.offer("attack", "worse", 1)
+        self.assertEqual("good", budget.best("attack"), "The best scored plan should be kept")
+        self.assertIsNone(budget.best("defense"), "Nothing was offered for this decision")
@@ -0,0 +1,132 @@
+class ThreatMap:
+    """Tracks how much damage each player's structures deal per frame at every location.
+
+    The layers are built from every structure on the map the first time they are needed, using each
+    structure's actual attackRange, damage_i and damage_f (so upgrades are taken into account).
+    After that they follow the GameMap's structure_changes log, so structures added with attempt_spawn
+    or upgraded with attempt_upgrade only update the locations in their range.
+    Structures flagged with attempt_remove keep firing until the end of the turn, so they stay in the layers.
+
+    Layers are flat lists indexed by x * ARENA_SIZE + y, like the GameMap layers.
+
+    Attributes :
+        * game_state (:obj: GameState): The gamestate whose structures are tracked
+
+    """
+    def __init__(self, game_state):
+        self.game_state = game_state
+        self._game_map = None
+        self._synced = 0
+        self._walker_damage = None
+        self._structure_damage = None
+        self._sources = {}
+
+    def _sync(self):
+        """Brings the layers up to date with the game map
+        """
+        game_map = self.game_state.game_map
+        if game_map is not self._game_map:
+            self._rebuild(game_map)
+            return
+
+        changes = game_map.structure_changes
+        if self._synced == len(changes):
+            return
+        pending = changes[self._synced:]
+        self._synced = len(changes)
+        for location in pending:
+            index = location[0] * game_map.ARENA_SIZE + location[1]
+            source = self._sources.pop(index, None)
+            if source is not None:
+                self._apply(source, -1)
+            self._add_structure(location)
+
+    def _rebuild(self, game_map):
+        size = game_map.ARENA_SIZE * game_map.ARENA_SIZE
+        self._game_map = game_map
+        self._synced = len(game_map.structure_changes)
+        self._walker_damage = [[0] * size, [0] * size]
+        self._structure_damage = [[0] * size, [0] * size]
+        self._sources = {}
+        for index in range(size):
+            if game_map.structure_mask[index]:
+                self._add_structure(divmod(index, game_map.ARENA_SIZE))
+
+    def _add_structure(self, location):
+        """Adds the damage of the structure at location, if it has any, to the layers
+        """
+        game_map = self._game_map
+        x, y = location
+        if not game_map.structure_mask[x * game_map.ARENA_SIZE + y]:
+            return
+        for unit in game_map[x, y]:
+            if unit.stationary and unit.damage_i + unit.damage_f > 0 and unit.player_index in (0, 1):
+                locations = [lx * game_map.ARENA_SIZE + ly for lx, ly in game_map.get_locations_in_range([x, y], unit.attackRange)]
+                source = (unit.player_index, unit.damage_i, unit.damage_f, locations)
+                self._sources[x * game_map.ARENA_SIZE + y] = source
+                self._apply(source, 1)
+
+    def _apply(self, source, sign):
+        player_index, damage_i, damage_f, locations = source
+        walker_layer = self._walker_damage[player_index]
+        structure_layer = self._structure_damage[player_index]
+        for index in locations:
+            walker_layer[index] += sign * damage_i
+            structure_layer[index] += sign * damage_f
+
+    def get_damage_layers(self, player_index):
+        """Gets the damage the structures of a player deal per frame at every location
+
+        Args:
+            player_index: The index corresponding to the attacking player, 0 for you 1 for the enemy
+
+        Returns:
+            Two flat layers indexed by x * ARENA_SIZE + y, the first with the damage dealt to mobile units,
+            the second with the damage dealt to structures. They must not be modified.
+
+        """
+        self._sync()
+        return self._walker_damage[player_index], self._structure_damage[player_index]
+
+    def damage_to_walkers(self, location, player_index):
+        """Gets the damage per frame a mobile unit takes from enemy structures at a location
+
+        Args:
+            location: The location of a hypothetical mobile unit
+            player_index: The index corresponding to the player controlling the unit, 0 for you 1 for the enemy
+
+        Returns:
+            The total damage per frame of the enemy structures that can hit the location
+
+        """
+        walker_layer, _ = self.get_damage_layers(1 - player_index)
+        return walker_layer[location[0] * self._game_map.ARENA_SIZE + location[1]]
+
+    def damage_to_structures(self, location, player_index):
+        """Gets the damage per frame a structure takes from enemy structures at a location
+
+        Args:
+            location: The location of a hypothetical structure
+            player_index: The index corresponding to the player controlling the structure, 0 for you 1 for the enemy
+
+        Returns:
+            The total damage per frame of the enemy structures that can hit the location
+
+        """
+        _, structure_layer = self.get_damage_layers(1 - player_index)
+        return structure_layer[location[0] * self._game_map.ARENA_SIZE + location[1]]
+
+    def path_damage(self, path, player_index):
+        """Gets the total damage per frame along a path, one frame on each location
+
+        Args:
+            path: A list of locations, as returned by GameState.find_path_to_edge
+            player_index: The index corresponding to the player controlling the mobile unit, 0 for you 1 for the enemy
+
+        Returns:
+            The sum of the damage per frame the enemy structures deal on each location of the path
+
+        """
+        walker_layer, _ = self.get_damage_layers(1 - player_index)
+        size = self._game_map.ARENA_SIZE
+        return sum(walker_layer[x * size + y] for x, y in path)
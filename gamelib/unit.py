@@ -1,3 +1,6 @@
+from .rules import compile_rules
+
+
 def is_stationary(unit_type, structure_types):
     """
         Args:
@@ -26,14 +29,19 @@ class GameUnit:
         * shieldRange (float): The effective range of this unit for shielding
         * max_health (float): The starting health of this unit. Note than 'health' can be increased beyond this value by shielding in some game configurations.
         * health (float): The current health of this unit
-        * cost ([int, int]): The resource costs of this unit first is SP second is MP
+        * cost ((int, int)): The resource costs of this unit first is SP second is MP
         * shieldPerUnit (float): how much shield is given per unit
         * pending_removal (boolean): If this unit is marked for removal by its owner
         * upgraded (boolean): If this unit is upgraded
+        * rules (:obj: Rules): The rules of the game the unit is in
+        * stats (UnitStats): The stat record the unit's stats come from, shared with every unit of its type and upgrade level
 
     """
-    def __init__(self, unit_type, config, player_index=None, health=None, x=-1, y=-1):
-        """ Initialize unit variables using args passed
+    __slots__ = ("unit_type", "config", "player_index", "x", "y", "health", "pending_removal", "upgraded", "rules", "stats",
+                 "stationary", "speed", "damage_f", "damage_i", "attackRange", "shieldRange", "max_health", "shieldPerUnit", "cost")
+
+    def __init__(self, unit_type, config, player_index=None, health=None, x=-1, y=-1, rules=None):
+        """ Initialize unit variables using args passed, the stats come from rules, compiled from config when not given
 
         """
         #unit type would be the constant
@@ -44,34 +52,17 @@ class GameUnit:
         self.upgraded = False
         self.x = x
         self.y = y
-        self.__serialize_type()
+        self.rules = rules if rules is not None else compile_rules(config)
+        self.__set_stats(self.rules.unit_stats[unit_type][0])
         self.health = self.max_health if not health else health
 
-    def __serialize_type(self):
-        from .game_state import STRUCTURE_TYPES, UNIT_TYPE_TO_INDEX, FACTORY
-        type_config = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[self.unit_type]]
-        self.stationary = type_config["unitCategory"] == 0
-        self.speed = type_config.get("speed", 0)
-        self.damage_f = type_config.get("attackDamageTower", 0)
-        self.damage_i = type_config.get("attackDamageWalker", 0)
-        self.attackRange = type_config.get("attackRange", 0)
-        self.shieldRange = type_config.get("shieldRange", 0)
-        self.max_health = type_config.get("startHealth", 0)
-        self.shieldPerUnit = type_config.get("shieldPerUnit", 0)
-        self.cost = [type_config.get("cost1", 0), type_config.get("cost2", 0)]
-
+    def __set_stats(self, stats):
+        self.stats = stats
+        (self.stationary, self.speed, self.damage_f, self.damage_i, self.attackRange, self.shieldRange,
+         self.max_health, self.shieldPerUnit, self.cost) = stats
 
     def upgrade(self):
-        from .game_state import UNIT_TYPE_TO_INDEX
-        type_config = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[self.unit_type]].get("upgrade", {})
-        self.speed = type_config.get("speed", self.speed)
-        self.damage_f = type_config.get("attackDamageTower", self.damage_f)
-        self.damage_i = type_config.get("attackDamageWalker", self.damage_i)
-        self.attackRange = type_config.get("attackRange", self.attackRange)
-        self.shieldRange = type_config.get("shieldRange", self.shieldRange)
-        self.max_health = type_config.get("startHealth", self.max_health)
-        self.shieldPerUnit = type_config.get("shieldPerUnit", self.shieldPerUnit)
-        self.cost = [type_config.get("cost1", 0) + self.cost[0], type_config.get("cost2", 0) + self.cost[1]]
+        self.__set_stats(self.rules.unit_stats[self.unit_type][1])
         self.upgraded = True
 
 
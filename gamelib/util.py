@@ -1,6 +1,9 @@
 import sys
+import json
 import random
 
+from .debug_log import log, INFO
+
 BANNER_TEXT = "---------------- Starting Your Algo --------------------"
 
 
@@ -21,24 +24,106 @@ def get_command():
         exit()
     return ret
 
+# When set, commands are handed to it instead of standard output, see set_command_sink
+_command_sink = None
+
+
 def send_command(cmd):
     """Sends your turn to standard output.
     Should usually only be called by 'GameState.submit_turn()'
 
     """
+    if _command_sink is not None:
+        _command_sink(cmd.strip())
+        return
     sys.stdout.write(cmd.strip() + "\n")
     sys.stdout.flush()
 
+def set_command_sink(sink):
+    """Sends commands to a function instead of standard output, used to run an algo without the game engine
+
+    Args:
+        sink: A function called with each command string, None to go back to standard output
+
+    Returns:
+        The previous sink
+
+    """
+    global _command_sink
+    previous = _command_sink
+    _command_sink = sink
+    return previous
+
 def debug_write(*msg):
     """Prints a message to the games debug output
 
+    The message is buffered in gamelib.log at INFO level and written once the turn is submitted,
+    use gamelib.log directly for other levels.
+
     Args:
         msg: The message to output
 
     """
     #Printing to STDERR is okay and printed out by the game but doesn't effect turns.
-    sys.stderr.write(", ".join(map(str, msg)).strip() + "\n")
-    sys.stderr.flush()
+    if log.keeps(INFO):
+        log.write(", ".join(map(str, msg)))
+
+
+class GameMessage(str):
+    """A message from the game engine, decoded at most once.
+
+    It is the raw string, so handlers written for strings (json.loads included) keep working.
+    The decoded json is only built the first time state is read, and then kept.
+
+    """
+    @property
+    def state(self):
+        """The decoded message
+        """
+        try:
+            return self.__dict__["_state"]
+        except KeyError:
+            state = json.loads(self)
+            self.__dict__["_state"] = state
+            return state
+
+    @property
+    def turn_info(self):
+        """The turnInfo entries (turn type, turn number, action frame number) read without decoding the message, None if the message has no turnInfo
+        """
+        start = self.find('"turnInfo"')
+        if start < 0:
+            return None
+        start = self.find("[", start) + 1
+        end = self.find("]", start)
+        try:
+            return [int(float(entry)) for entry in self[start:end].split(",")]
+        except ValueError:
+            return [int(float(entry)) for entry in self.state["turnInfo"]]
+
+    @property
+    def turn_type(self):
+        """The first entry of turnInfo (0 turn, 1 action frame, 2 end of game) read without decoding the message, None if the message has no turnInfo
+        """
+        turn_info = self.turn_info
+        return turn_info[0] if turn_info is not None else None
+
+
+def parse_message(message):
+    """Gets the decoded game state from a GameMessage, a json string, or an already decoded dict
+
+    Args:
+        message: The message
+
+    Returns:
+        The decoded message
+
+    """
+    if isinstance(message, GameMessage):
+        return message.state
+    if isinstance(message, str):
+        return json.loads(message)
+    return message
 
 
 # given x,y coordinate returns coordinates as reflected across line thru x= 13.5
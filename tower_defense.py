@@ -11,6 +11,7 @@ class DefenseStructures():
     
     def __init__(self,coords,mirror = False):
         self.region = [tuple(coord) for coord in coords] # will store coords the DS will be able to modify
+        self.region_order = {coord: i for i, coord in enumerate(self.region)} # position of each coord in region
         self.units = dict() # maps each coord in region to copy of unit
         for coord in self.region:
             self.units[coord] = False
@@ -27,6 +28,12 @@ class DefenseStructures():
         self.repair_cost = 0
 
         self.to_repair = []
+
+        # coord -> copy of the unit destroyed there, until something is built there again
+        self.destroyed = dict()
+
+        # turn update() last ran on, a summary only covers the action phase since the turn before
+        self.updated_turn = None
         
         # stuff to reinforce
         
@@ -38,12 +45,28 @@ class DefenseStructures():
 
 
     # updates units information. Updates cur_abs_HP. Need to upgrade old_abs_HP end of turn via calling end turn. Also newly added units in this turn are not yet included. Call this in the beggining of turn 
-    def update(self,game_state):
+    # with the action phase summary only tiles where our units were hit or died are looked at, nothing changes on the others
+    # tiles destroyed on earlier turns and not rebuilt yet are looked at too, and stay queued for repair
+    # the whole region is looked at when update() did not run last turn, the summary misses the phases in between
+    def update(self,game_state, summary = None):
+        turn = game_state.turn_number
+        if summary is None or self.updated_turn is None or turn - self.updated_turn > 1:
+            coords = self.region
+        else:
+            coords = sorted(set(coord for coord in summary.changed_locations(0) if coord in self.region_order) | set(self.destroyed), key = self.region_order.get)
+        self.updated_turn = turn
+
+        for coord, structure in zip(coords, game_state.game_map.structures_at(coords)):
+            self.update_unit(coord, structure)
+
         self.repair_cost = 0
         self.to_repair = []
-        
-        for coord in self.region:
-            self.update_unit(coord, game_state.contains_stationary_unit(coord) )
+        for coord in sorted(self.destroyed, key = self.region_order.get):
+            lost = self.destroyed[coord]
+            self.repair_cost += lost.cost[0]
+            # 0 for turrets 1 for walls
+            # (coords, (0/1))
+            self.to_repair.append([coord, 0 if lost.max_health in [100,200] else 1] )
 
         # sort to_repair by putting walls first
         sorted(self.to_repair,key = lambda x:-x[1])
@@ -63,17 +86,15 @@ class DefenseStructures():
                 # nothing was here prior, so nothing should be here anyways
                 pass
             else:
-                # destroyed
+                # destroyed, the loss is counted once and the tile is queued for repair until rebuilt
                 self.cur_abs_HP -= self.units[coord].health
-                self.repair_cost += self.units[coord].cost[0]
-                # 0 for turrets 1 for walls
-                # (coords, (0/1))
-                self.to_repair.append([coord, 0 if self.units[coord].max_health in [100,200] else 1] )
+                self.destroyed[coord] = self.units[coord]
+                self.units[coord] = False
                 
         else:
             if not self.units[coord]:
                 # added new unit, this should neve rhappen
-                a = 1
+                self.destroyed.pop(coord, None)
                 
             # complete fine or damaged 
             else:
@@ -83,13 +104,13 @@ class DefenseStructures():
     # checks regions, call this after spawning structures. 
     
     def update_units(self,game_state):
-        for coord in self.region:
-            new_info = game_state.contains_stationary_unit(coord)
+        for coord, new_info in zip(self.region, game_state.game_map.structures_at(self.region)):
             if new_info:
                 # somethings here
                 if not self.units[coord]:
                     # something wasnt here before
                     self.cur_abs_HP += new_info.health
+                    self.destroyed.pop(coord, None)
                 else:
                     # upgraded   
                      self.cur_abs_HP += abs(self.units[coord].health - new_info.health)
@@ -105,6 +126,42 @@ class DefenseStructures():
     
     # implement logic for creating new things. .... hard code it
 
+    # value of each build when proposed to the BuildPlanner, multiplied by the weight of the section
+    VALUES = {"wall": 1, "upgrade wall": 1.5, "turret": 3, "upgrade turret": 6}
+
+    # for each turret slot: upgrade the turret, upgrade the wall in front of it, or build the turret (with its wall
+    # when that is missing too), upgraded or not
+    def propose_turret_slots(self, game_state, planner, weight, slots):
+        for i in slots:
+            wall_coord = [i[0], i[1]+1]
+            wall = game_state.contains_stationary_unit(wall_coord)
+            turret = game_state.contains_stationary_unit(i)
+
+            if turret and not turret.upgraded:
+                planner.add((weight * self.VALUES["upgrade turret"], [("upgrade", i)]))
+
+            if wall and not wall.upgraded:
+                planner.add((weight * self.VALUES["upgrade wall"], [("upgrade", wall_coord)]))
+
+            if not turret:
+                build = [("spawn", TURRET, i, 1)]
+                value = self.VALUES["turret"]
+                if not wall:
+                    build.append(("spawn", WALL, wall_coord, 1))
+                    value += self.VALUES["wall"]
+                planner.add((weight * value, build),
+                            (weight * (value + self.VALUES["upgrade turret"]), build + [("upgrade", i)]))
+
+    # builds the wall, or the wall and its upgrade, or upgrades the wall that is there
+    def propose_wall(self, game_state, planner, weight, coord):
+        wall = game_state.contains_stationary_unit(coord)
+        if not wall:
+            build = [("spawn", WALL, coord, 1)]
+            planner.add((weight * self.VALUES["wall"], build),
+                        (weight * (self.VALUES["wall"] + self.VALUES["upgrade wall"]), build + [("upgrade", coord)]))
+        elif not wall.upgraded:
+            planner.add((weight * self.VALUES["upgrade wall"], [("upgrade", coord)]))
+
     
 
 # the length 4 walls
@@ -125,47 +182,12 @@ class Wall(DefenseStructures):
 
 
             
-    # what to add to get to FM
-    def reinforce(self, game_state, SP_points):
-            
+    # what to add to get to FM, proposed to the BuildPlanner
+    def propose(self, game_state, planner, weight = 1):
         # upgrade turret -> upgrade wall -> turret + wall
         random.shuffle(self.turret_slots)
+        self.propose_turret_slots(game_state, planner, weight, self.turret_slots)
 
-        for i in self.turret_slots:
-            
-            empty_wall = True
-            wall_upgradable = False
-            wall =  game_state.contains_stationary_unit([i[0],i[1]+1])
-            if wall:
-                empty_wall = False
-                wall_upgradable = not wall.upgraded
-
-                
-            empty_turret = True
-            turret_upgradable = False
-            turret = game_state.contains_stationary_unit(i)
-
-            if turret:
-                empty_turret = False
-                turret_upgradable = not turret.upgraded
-
-            if turret_upgradable and SP_points >= 4:
-                game_state.attempt_upgrade(i)
-
-            SP_points = game_state.get_allowance()
-
-            if wall_upgradable and SP_points >= 2:
-                game_state.attempt_upgrade([i[0],i[1]+1])
-
-            SP_points = game_state.get_allowance()
-
-            if empty_turret and empty_wall and SP_points >= 3:
-                game_state.attempt_spawn(WALL,[i[0],i[1]+1])
-                game_state.attempt_spawn(TURRET, i)
-            
-            SP_points = game_state.get_allowance()
-
-            
     def check_final_form(self):
         return False
 
@@ -190,45 +212,12 @@ class Entrance(DefenseStructures):
         if mirror:
             self.turret_slots = gamelib.mirror(self.turret_slots)
 
-# what to add to get to FM
-    def reinforce(self, game_state, SP_points):
+# what to add to get to FM, proposed to the BuildPlanner
+    def propose(self, game_state, planner, weight = 1):
         # upgrade turret -> upgrade wall -> turret + wall
         random.shuffle(self.turret_slots)
-
-        for i in self.turret_slots:
-            if not self.final_form and i in [HOLE, gamelib.mirror(HOLE)[0]]:
-                continue
-            empty_wall = True
-            wall_upgradable = False
-            wall =  game_state.contains_stationary_unit([i[0],i[1]+1])
-            if wall:
-                empty_wall = False
-                wall_upgradable = not wall.upgraded
-
-                
-            empty_turret = True
-            turret_upgradable = False
-            turret = game_state.contains_stationary_unit(i)
-
-            if turret:
-                empty_turret = False
-                turret_upgradable = not turret.upgraded
-
-            if turret_upgradable and SP_points >= 4:
-                game_state.attempt_upgrade(i)
-
-            SP_points = game_state.get_allowance()
-
-            if wall_upgradable and SP_points >= 2:
-                game_state.attempt_upgrade([i[0],i[1]+1])
-
-            SP_points = game_state.get_allowance()
-
-            if empty_turret and empty_wall and SP_points >= 3:
-                game_state.attempt_spawn(WALL,[i[0],i[1]+1])
-                game_state.attempt_spawn(TURRET, i)
-            
-            SP_points = game_state.get_allowance()
+        slots = [i for i in self.turret_slots if self.final_form or i not in [HOLE, gamelib.mirror(HOLE)[0]]]
+        self.propose_turret_slots(game_state, planner, weight, slots)
             
     def check_final_form(self):
         return False
@@ -238,6 +227,9 @@ class Entrance(DefenseStructures):
 class Funnel(DefenseStructures):
     # End goal: All walls upgraded, with both possible turret spots spawned and them upgraded
 
+    # the walls that must exist at all times are worth this much more
+    VIP_WEIGHT = 3
+
     def __init__(self, coords, mirror=False):
         super().__init__(coords, mirror)
         self.turret_slots = [[4,12],[3,10]]
@@ -259,81 +251,20 @@ class Funnel(DefenseStructures):
             self.air_support_9_11 = gamelib.mirror(self.air_support_9_11)[0]
 
 
-# fix this part 
-    def reinforce(self,game_state, SP_points):
+    # what to add to get to FM, proposed to the BuildPlanner
+    def propose(self, game_state, planner, weight = 1):
         # for the funnel
         # always upgrade walls , if top 2 walls is upgraded, then try to add helper turret + wall
         
         # stuff should always be rebuilt
         for i in self.wall_vip[:3]:
-            wall = game_state.contains_stationary_unit(i)
-            if not wall and game_state.get_allowance() >= 1:
-                game_state.attempt_spawn(WALL, i)
-            
-            if wall and not wall.upgraded and game_state.get_allowance() >= 2:
-                game_state.attempt_upgrade(i)
+            self.propose_wall(game_state, planner, weight * self.VIP_WEIGHT, i)
 
         # add turret and or wall
+        self.propose_turret_slots(game_state, planner, weight, self.turret_slots[:1])
 
-        turret1 = game_state.contains_stationary_unit(self.turret_slots[0])
-
-        if not turret1:
-            # turret isnt here
-            # check if wall absent
-            turret1 = [self.turret_slots[0][0], self.turret_slots[0][1]]
-            wall = game_state.contains_stationary_unit(turret1)
-            if wall:
-                # there is wall
-                wall_upgradable = not wall.upgraded
-                
-                if game_state.get_allowance() and wall_upgradable >= 6+2 :
-                    # turret + upgrade
-                    game_state.attempt_spawn(TURRET, [turret1[0], turret1[1]])
-                    game_state.attempt_upgrade([turret1[0],turret1[1]])
-                    game_State.attempt_upgrade([wall.x,wall.y])
-                
-                elif game_state.get_allowance() >= 6 :
-                    # turret + upgrade
-                    game_state.attempt_spawn(TURRET, [turret1[0], turret1[1]])
-                    game_state.attempt_upgrade([turret1[0],turret1[1]])
-                elif game_state.get_allowance() >= 2+2:
-                    game_state.attempt_spawn(TURRET,[turret1[0],turret1[1] ])
-                    game_state.attempt_upgrade([wall.x,wall.y])
-                    
-                elif game_state.get_allowance() >=  2:
-                    # turret
-                    game_state.attempt_spawn(TURRET, [turret1[0], turret1[1]])
-                    
-            else:
-                 # no wall   
-                if game_state.get_allowance() >= 6+1:
-                    # wall + upgraded turret
-                    game_state.attempt_spawn(TURRET,[turret1[0],turret1[1]])
-                    game_state.attempt_upgrade([turret1[0],turret1[1]])
-                    game_state.attempt_spawn(WALL, [turret1[0],turret1[1]+1])
-
-                elif game_state.get_allowance() >=  2+1:
-                    # wall+turret
-                    game_state.attempt_spawn(TURRET,[turret1[0],turret1[1]])
-                    game_state.attempt_spawn(WALL, [turret1[0],turret1[1]+1])
-        else:
-            #try to upgrade turret, turret is here            
-            if not turret1.upgraded and game_state.get_allowance() >= 4:
-                game_state.attempt_upgrade([turret1.x,turret1.y])
-                    
         # optional wall
-        wall = game_state.contains_stationary_unit(self.optional_wall)
-
-        if not wall:
-            # no wall
-            if game_state.get_allowance() >= 2:
-                game_state.attempt_spawn(WALL,self.optional_wall)
-                game_state.attempt_upgrade(self.optional_wall)
-            elif game_state.get_allowance() >= 1:
-                game_state.attempt_spawn(WALL, self.optional_wall)
-        else:
-            if not wall.upgraded and game_state.get_allowance() >= 2:
-                game_state.attempt_upgrade(self.optional_wall)
+        self.propose_wall(game_state, planner, weight, self.optional_wall)
                        
 
 class SideDefense():
@@ -362,15 +293,18 @@ class SideDefense():
 
     # need a function to let know DS's know newly added structures. end_turn will call this
 
+    @gamelib.profiler.timed()
     def update_units(self,game_state):
         self.wall.update_units(game_state)
         self.entrance.update_units(game_state)
         self.funnel.update_units(game_state)
         
-    def update(self,game_state):
-        self.wall.update(game_state)
-        self.entrance.update(game_state)
-        self.funnel.update(game_state)
+    # summary is the last action phase's TurnSummary, without it every tile of every region is checked
+    @gamelib.profiler.timed()
+    def update(self,game_state, summary = None):
+        self.wall.update(game_state, summary)
+        self.entrance.update(game_state, summary)
+        self.funnel.update(game_state, summary)
 
         
 
@@ -384,6 +318,7 @@ class SideDefense():
         return self.wall.repair_cost + self.entrance.repair_cost + self.funnel.repair_cost 
 
     # can only call once
+    @gamelib.profiler.timed()
     def query_damage(self,i = 1):
         self.damage_taken = dict()
         stuff = [self.wall,self.entrance,self.funnel]
@@ -394,6 +329,7 @@ class SideDefense():
     # can implement strat for tearing down almost destroyed stuff. 
     
     # makes a queue for repairs
+    @gamelib.profiler.timed()
     def get_repairs(self):
        # gamelib.debug_write(self.damage_taken)
         wall_delta = self.damage_taken[self.wall][1]